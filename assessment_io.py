@@ -0,0 +1,248 @@
+"""
+Reading assessment exports.
+
+read_assessment loads one assessment from CSV, Parquet or Excel. The header is
+checked for the required columns before any data is read. Only the assessment
+columns (REQUIRED_COLUMNS plus the optional Comment) are read, with explicit
+dtypes: categoricals for the repetitive Category/Question/Answer strings and
+float64 for Score/MaxWeight. CSV is parsed by pyarrow's reader when pyarrow is
+installed, falling back to the C parser for files pyarrow rejects (e.g. ragged
+rows). Excel files (.xlsx) are read with openpyxl.
+
+iter_client_assessments streams a multi-client export (CSV or Parquet with a
+client id column) in chunks and yields one client's assessment at a time, so
+memory is bounded by the chunk size plus the largest client rather than the size
+of the export.
+"""
+import csv
+import io
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+REQUIRED_COLUMNS = ['Category', 'Question', 'Answer', 'Score', 'MaxWeight']
+OPTIONAL_COLUMNS = ['Comment']
+ASSESSMENT_COLUMNS = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+ASSESSMENT_DTYPES = {
+    'Category': 'category',
+    'Question': 'category',
+    'Answer': 'category',
+    'Score': 'float64',
+    'MaxWeight': 'float64',
+    'Comment': 'str'
+}
+
+FILE_FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet", ".xlsx": "excel"}
+UPLOAD_TYPES = sorted(extension.lstrip(".") for extension in FILE_FORMATS)
+
+DEFAULT_CLIENT_COLUMN = "ClientId"
+DEFAULT_CHUNK_ROWS = 200_000
+
+
+class MissingColumnsError(ValueError):
+    """
+    Raised when an export lacks required columns; missing lists them.
+    """
+
+    def __init__(self, missing):
+        self.missing = missing
+        super().__init__(f"missing required columns: {', '.join(missing)}")
+
+
+def file_format(source, default="csv"):
+    """
+    csv, parquet or excel, from the extension of a path or of a file object's name.
+    """
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    return FILE_FORMATS.get(os.path.splitext(name or "")[1].lower(), default)
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def read_header(source, fmt=None):
+    """
+    Column names of an export, reading no rows.
+    """
+    fmt = fmt or file_format(source)
+    try:
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            return list(pq.read_schema(source).names)
+        if fmt == "excel":
+            return list(pd.read_excel(source, nrows=0).columns)
+        return _read_csv_header(source)
+    finally:
+        _rewind(source)
+
+
+def _read_csv_header(source):
+    # Only the first record is parsed; utf-8-sig drops a byte order mark as pandas does
+    if isinstance(source, str):
+        with open(source, encoding="utf-8-sig", newline="") as f:
+            return next(csv.reader(f), [])
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    try:
+        return next(csv.reader(text), [])
+    finally:
+        text.detach()
+
+
+def _select_columns(header, extra=()):
+    missing = [column for column in list(extra) + REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise MissingColumnsError(missing)
+    return list(extra) + [column for column in ASSESSMENT_COLUMNS if column in header]
+
+
+def apply_assessment_dtypes(df):
+    return df.astype({column: dtype for column, dtype in ASSESSMENT_DTYPES.items() if column in df.columns})
+
+
+def read_assessment(source, fmt=None):
+    """
+    One assessment as a DataFrame of ASSESSMENT_COLUMNS (Comment only if present)
+    with ASSESSMENT_DTYPES. source is a path or a binary file object; fmt defaults
+    to its extension. Raises MissingColumnsError before reading any rows.
+    """
+    fmt = fmt or file_format(source)
+    columns = _select_columns(read_header(source, fmt))
+    dtypes = {column: ASSESSMENT_DTYPES[column] for column in columns}
+    if fmt == "parquet":
+        return apply_assessment_dtypes(pd.read_parquet(source, columns=columns))
+    if fmt == "excel":
+        return pd.read_excel(source, usecols=columns, dtype=dtypes)[columns]
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return pd.read_csv(source, usecols=columns, dtype=dtypes)[columns]
+    try:
+        return _read_csv_arrow(source, columns)
+    except pa.ArrowInvalid:
+        # pyarrow rejects ragged rows that the C parser pads with missing values
+        _rewind(source)
+        return pd.read_csv(source, usecols=columns, dtype=dtypes)[columns]
+
+
+def _read_csv_arrow(source, columns):
+    # pyarrow's reader used directly: categoricals come straight from dictionary-encoded
+    # columns, without the per-call overhead of pandas' pyarrow engine on small files
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    arrow_types = {'category': pa.dictionary(pa.int32(), pa.string()), 'float64': pa.float64(), 'str': pa.string()}
+    options = pa_csv.ConvertOptions(
+        include_columns=columns,
+        column_types={column: arrow_types[ASSESSMENT_DTYPES[column]] for column in columns},
+        strings_can_be_null=True,
+        # pandas' default missing-value markers are pyarrow's plus these two
+        null_values=list(pa_csv.ConvertOptions().null_values) + ["<NA>", "None"]
+    )
+    return pa_csv.read_csv(source, convert_options=options).to_pandas()
+
+
+def _iter_chunks(source, fmt, columns, chunk_rows):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield apply_assessment_dtypes(batch.to_pandas())
+    elif fmt == "csv":
+        # The pyarrow engine has no chunksize, so chunks come from the C parser
+        dtypes = {column: ASSESSMENT_DTYPES.get(column, 'str') for column in columns}
+        with pd.read_csv(source, usecols=columns, dtype=dtypes, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield chunk[columns]
+    else:
+        raise ValueError(f"{fmt} exports cannot be streamed; use CSV or Parquet")
+
+
+def _client_frame(frames, client_column):
+    # Chunks are typed once, so a client within one chunk keeps that chunk's categories;
+    # concatenating chunks with different categories falls back to strings and is retyped
+    if len(frames) == 1:
+        return frames[0].drop(columns=[client_column]).reset_index(drop=True)
+    df = pd.concat(frames, ignore_index=True).drop(columns=[client_column])
+    return apply_assessment_dtypes(df)
+
+
+def iter_client_assessments(source, client_column=DEFAULT_CLIENT_COLUMN, chunk_rows=DEFAULT_CHUNK_ROWS,
+                            grouped=True, fmt=None):
+    """
+    Yields (client id, assessment DataFrame) for every client in a multi-client CSV
+    or Parquet export, in order of first appearance. Rows without a client id are
+    skipped.
+
+    grouped=True expects each client's rows to be contiguous (e.g. an export sorted
+    by client): a client is yielded as soon as the next one starts, and a client
+    that reappears later raises ValueError. grouped=False accepts any order: chunks
+    are first sorted by client and spilled to a temporary directory (needs pyarrow),
+    then each client's rows are read back from all chunks.
+    """
+    fmt = fmt or file_format(source)
+    columns = _select_columns(read_header(source, fmt), extra=[client_column])
+    chunks = _iter_chunks(source, fmt, columns, chunk_rows)
+    if grouped:
+        yield from _iter_grouped(chunks, client_column)
+    else:
+        yield from _iter_spilled(chunks, client_column)
+
+
+def _iter_grouped(chunks, client_column):
+    current, frames, finished = None, [], set()
+    for chunk in chunks:
+        chunk = chunk[chunk[client_column].notna()]
+        ids = chunk[client_column].astype(str).to_numpy(dtype=object)
+        if len(ids) == 0:
+            continue
+        starts = np.concatenate([[0], np.flatnonzero(ids[1:] != ids[:-1]) + 1])
+        stops = np.append(starts[1:], len(ids))
+        for start, stop in zip(starts, stops):
+            client = ids[start]
+            if client != current:
+                if current is not None:
+                    finished.add(current)
+                    yield current, _client_frame(frames, client_column)
+                if client in finished:
+                    raise ValueError(f"rows of client {client!r} are not contiguous; sort the export by "
+                                     f"{client_column} or read it with grouped=False")
+                current, frames = client, []
+            frames.append(chunk.iloc[start:stop])
+    if current is not None:
+        yield current, _client_frame(frames, client_column)
+
+
+def _iter_spilled(chunks, client_column):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    with tempfile.TemporaryDirectory(prefix="gmp-export-") as spill_dir:
+        # Each chunk is sorted by client and written once, uncompressed so it can be
+        # memory-mapped; slices[client] lists the (file, start, stop) of its rows
+        numbers, slices, paths = {}, {}, []
+        for chunk in chunks:
+            chunk = chunk[chunk[client_column].notna()]
+            if chunk.empty:
+                continue
+            codes, clients = pd.factorize(chunk[client_column].astype(str))
+            for client in clients:
+                if client not in numbers:
+                    numbers[client] = len(numbers)
+                    slices[client] = []
+            row_numbers = np.array([numbers[client] for client in clients])[codes]
+            order = np.argsort(row_numbers, kind="stable")
+            sorted_numbers = row_numbers[order]
+            path = os.path.join(spill_dir, f"{len(paths)}.arrow")
+            feather.write_feather(chunk.iloc[order].reset_index(drop=True), path, compression="uncompressed")
+            starts = np.concatenate([[0], np.flatnonzero(sorted_numbers[1:] != sorted_numbers[:-1]) + 1])
+            stops = np.append(starts[1:], len(sorted_numbers))
+            for start, stop in zip(starts, stops):
+                slices[clients[codes[order[start]]]].append((len(paths), start, stop))
+            paths.append(path)
+        tables = [feather.read_table(path, memory_map=True) for path in paths]
+        for client, parts in slices.items():
+            # Slices share their chunk's dictionaries, so one conversion gives categoricals
+            table = pa.concat_tables([tables[index].slice(start, stop - start) for index, start, stop in parts])
+            yield client, table.drop_columns([client_column]).to_pandas()
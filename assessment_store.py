@@ -0,0 +1,319 @@
+"""
+Local store of analysed assessments: SQLite index plus Parquet tables.
+
+Each entry is one assessment of one client, keyed by (client, assessment_date,
+content_hash), where content_hash is the sha256 of the assessment data. The SQLite
+index (index.sqlite3) holds the keys, the generated texts, the
+run_recommendation_analysis output and a few summary columns. It is indexed by
+client and date and by content hash, so finding an earlier run of an upload or a
+client's history is a single indexed query. The tables live as Parquet files next
+to it:
+- assessments/<content_hash>.parquet: the answers, stored once however many entries use them
+- entries/<entry id>/gaps.parquet and drivers.parquet
+
+Loading an entry reads those files back, with no LLM call. The Parquet files need
+pyarrow.
+
+Every stored assessment is also in a similarity index (see similarity_index), so
+similar() finds earlier analyses of near-identical answer profiles without
+scanning the archive.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from recommendation_agent import (
+    build_answer_map,
+    calculate_maturity_levels,
+    diff_answer_maps,
+    OVERALL_CATEGORY
+)
+from similarity_index import SimilarityIndex, answer_shingles, similarity_threshold
+
+DEFAULT_STORE_PATH = os.path.join(".cache", "assessments")
+INDEX_FILE = "index.sqlite3"
+
+# One row of the index: everything needed to list an entry without reading its tables
+StoredEntry = namedtuple("StoredEntry", [
+    "client", "assessment_date", "content_hash", "rows", "overall_maturity",
+    "step", "rules_version", "updated_at"
+])
+
+# A loaded entry; any analysis field the run never produced is None
+StoredAssessment = namedtuple("StoredAssessment", [
+    "entry", "df", "summary", "bullet_summary", "maturity_gaps", "maturity_drivers",
+    "recommendation_results", "rules_hash"
+])
+
+# An analysed entry of another assessment and the Jaccard similarity of its answers
+SimilarEntry = namedtuple("SimilarEntry", ["entry", "similarity"])
+
+# maturity: Category, maturity_before, maturity_after, change (Overall last);
+# recommendations_added/removed: recommendation titles; changed_questions: a count
+AssessmentComparison = namedtuple("AssessmentComparison", [
+    "maturity", "recommendations_added", "recommendations_removed", "changed_questions"
+])
+
+_ENTRY_COLUMNS = ", ".join(StoredEntry._fields)
+
+
+def dataframe_hash(df):
+    """
+    Content hash of an assessment held only as a DataFrame (e.g. after edits).
+    """
+    return hashlib.sha256(df.to_csv(index=False).encode("utf-8")).hexdigest()
+
+
+def entry_id(client, assessment_date, content_hash):
+    key = json.dumps([client, str(assessment_date), content_hash], ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:20]
+
+
+def _parquet_ready(df):
+    """
+    df with object columns as strings (missing values kept), since Parquet needs
+    one type per column and edited answers can mix numbers and text.
+    """
+    df = df.reset_index(drop=True)
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    df.columns = [str(column) for column in df.columns]
+    return df
+
+
+def _write_parquet(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    _parquet_ready(df).to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
+
+
+def _read_parquet(path):
+    return pd.read_parquet(path) if os.path.exists(path) else None
+
+
+class AssessmentStore:
+    """
+    Saves and loads analysed assessments under root; safe to share between threads.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_PATH):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, INDEX_FILE), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " client TEXT NOT NULL,"
+            " assessment_date TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " rows INTEGER NOT NULL,"
+            " overall_maturity REAL,"
+            " step INTEGER NOT NULL DEFAULT 0,"
+            " rules_version INTEGER,"
+            " rules_hash TEXT,"
+            " summary TEXT,"
+            " bullet_summary TEXT,"
+            " recommendation_results TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (client, assessment_date, content_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_content_hash ON entries (content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_updated_at ON entries (updated_at)")
+        self.similarity = SimilarityIndex(self._conn, self._lock)
+        self._similarity_complete = False
+
+    def _assessment_path(self, content_hash):
+        return os.path.join(self.root, "assessments", f"{content_hash}.parquet")
+
+    def _entry_dir(self, client, assessment_date, content_hash):
+        return os.path.join(self.root, "entries", entry_id(client, assessment_date, content_hash))
+
+    def save(self, client, assessment_date, content_hash, df, summary=None, bullet_summary=None,
+             maturity_gaps=None, maturity_drivers=None, recommendation_results=None, step=0,
+             rules_version=None, rules_hash=None):
+        """
+        Creates or updates an entry. Analysis fields passed as None keep what the entry
+        already holds, so a run can be saved step by step.
+        """
+        assessment_date = str(assessment_date)
+        assessment_path = self._assessment_path(content_hash)
+        if not os.path.exists(assessment_path):
+            _write_parquet(df, assessment_path)
+        if content_hash not in self.similarity:
+            self.similarity.add(content_hash, answer_shingles(df))
+        entry_dir = self._entry_dir(client, assessment_date, content_hash)
+        if maturity_gaps is not None:
+            _write_parquet(maturity_gaps, os.path.join(entry_dir, "gaps.parquet"))
+        if maturity_drivers is not None:
+            _write_parquet(maturity_drivers, os.path.join(entry_dir, "drivers.parquet"))
+
+        overall = calculate_maturity_levels(df).overall['maturity_level']
+        results_json = None if recommendation_results is None else json.dumps(recommendation_results)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO entries (client, assessment_date, content_hash, rows, overall_maturity, step,"
+                " rules_version, rules_hash, summary, bullet_summary, recommendation_results, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (client, assessment_date, content_hash) DO UPDATE SET"
+                " step = MAX(step, excluded.step),"
+                " rules_version = COALESCE(excluded.rules_version, rules_version),"
+                " rules_hash = COALESCE(excluded.rules_hash, rules_hash),"
+                " summary = COALESCE(excluded.summary, summary),"
+                " bullet_summary = COALESCE(excluded.bullet_summary, bullet_summary),"
+                " recommendation_results = COALESCE(excluded.recommendation_results, recommendation_results),"
+                " updated_at = excluded.updated_at",
+                (client, assessment_date, content_hash, len(df), None if pd.isna(overall) else float(overall), step,
+                 rules_version, rules_hash, summary, bullet_summary, results_json, now, now)
+            )
+
+    def _entries(self, where, params):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE {where} ORDER BY assessment_date DESC, updated_at DESC",
+                params
+            ).fetchall()
+        return [StoredEntry(*row) for row in rows]
+
+    def find(self, content_hash):
+        """
+        Entries of any client analysing exactly this data, newest first.
+        """
+        return self._entries("content_hash = ?", (content_hash,))
+
+    def history(self, client):
+        """
+        A client's entries, newest assessment first.
+        """
+        return self._entries("client = ?", (client,))
+
+    def clients(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT client FROM entries ORDER BY client")]
+
+    def similar(self, df, threshold=None, content_hash=None):
+        """
+        SimilarEntries for the analysed assessments (step > 0) whose answers are at
+        least threshold (default GMP_SIMILARITY_THRESHOLD) Jaccard-similar to df's,
+        most similar first, with the newest entry of each. content_hash, df's own hash,
+        is left out, as find() covers exact matches.
+        """
+        threshold = similarity_threshold() if threshold is None else threshold
+        if threshold <= 0:
+            return []
+        self._index_unindexed()
+        similar = []
+        for match in self.similarity.query(answer_shingles(df), threshold):
+            if match.content_hash == content_hash:
+                continue
+            analysed = [entry for entry in self.find(match.content_hash) if entry.step > 0]
+            if analysed:
+                similar.append(SimilarEntry(analysed[0], match.similarity))
+        return similar
+
+    def _index_unindexed(self):
+        # Once per process: stores written before the similarity index existed are indexed in full
+        if self._similarity_complete:
+            return
+        indexed = self.similarity.indexed_hashes()
+        with self._lock:
+            stored = [row[0] for row in self._conn.execute("SELECT DISTINCT content_hash FROM entries")]
+        for content_hash in stored:
+            path = self._assessment_path(content_hash)
+            if content_hash not in indexed and os.path.exists(path):
+                self.similarity.add(content_hash, answer_shingles(pd.read_parquet(path)))
+        self._similarity_complete = True
+
+    def load(self, entry):
+        """
+        The StoredAssessment for a StoredEntry (or a (client, date, content_hash) key).
+        """
+        client, assessment_date, content_hash = entry[:3]
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_ENTRY_COLUMNS}, summary, bullet_summary, recommendation_results, rules_hash"
+                " FROM entries WHERE client = ? AND assessment_date = ? AND content_hash = ?",
+                (client, str(assessment_date), content_hash)
+            ).fetchone()
+        if row is None:
+            raise KeyError(f"no stored assessment for {client} on {assessment_date} ({content_hash[:12]})")
+        fields = len(StoredEntry._fields)
+        summary, bullet_summary, results_json, rules_hash = row[fields:]
+        entry_dir = self._entry_dir(client, assessment_date, content_hash)
+        return StoredAssessment(
+            entry=StoredEntry(*row[:fields]),
+            df=pd.read_parquet(self._assessment_path(content_hash)),
+            summary=summary,
+            bullet_summary=bullet_summary,
+            maturity_gaps=_read_parquet(os.path.join(entry_dir, "gaps.parquet")),
+            maturity_drivers=_read_parquet(os.path.join(entry_dir, "drivers.parquet")),
+            recommendation_results=None if results_json is None else json.loads(results_json),
+            rules_hash=rules_hash
+        )
+
+
+def compare_assessments(before_df, after_df, before_results=None, after_results=None):
+    """
+    AssessmentComparison of two assessments of the same client, e.g. a year apart.
+    The results are their run_recommendation_analysis outputs, when known.
+    """
+    levels = pd.merge(
+        _maturity_rows(before_df).rename(columns={'maturity_level': 'maturity_before'}),
+        _maturity_rows(after_df).rename(columns={'maturity_level': 'maturity_after'}),
+        on='Category', how='outer', sort=False
+    )
+    levels['change'] = (levels['maturity_after'] - levels['maturity_before']).round(2)
+    # Keep Overall as the last row after the outer merge
+    is_overall = levels['Category'] == OVERALL_CATEGORY
+    levels = pd.concat([levels[~is_overall], levels[is_overall]], ignore_index=True)
+
+    titles_before = _recommendation_titles(before_results)
+    titles_after = _recommendation_titles(after_results)
+    return AssessmentComparison(
+        maturity=levels,
+        recommendations_added=[title for title in titles_after if title not in titles_before],
+        recommendations_removed=[title for title in titles_before if title not in titles_after],
+        changed_questions=len(diff_answer_maps(build_answer_map(before_df), build_answer_map(after_df)))
+    )
+
+
+def _maturity_rows(df):
+    scores = calculate_maturity_levels(df)
+    overall = pd.DataFrame([{'Category': OVERALL_CATEGORY, 'maturity_level': scores.overall['maturity_level']}])
+    return pd.concat([scores.categories[['Category', 'maturity_level']], overall], ignore_index=True)
+
+
+def _recommendation_titles(results):
+    if not results:
+        return []
+    return [match['recommendation'] for match in results['matched_recommendations']]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_assessment_store():
+    """
+    Process-wide store at GMP_STORE_PATH. Returns None (nothing is stored) when
+    GMP_STORE_PATH is set but empty.
+    """
+    global _store
+    path = os.environ.get("GMP_STORE_PATH", DEFAULT_STORE_PATH)
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = AssessmentStore(path)
+        return _store
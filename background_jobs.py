@@ -0,0 +1,199 @@
+"""
+Background execution of the app's LLM steps.
+
+The Streamlit script thread submits a step to the shared JobExecutor and keeps
+only the returned Job in st.session_state. It then polls the job, showing queue
+position, elapsed time and the text streamed so far, and applies the result on
+completion, so no server thread is held for the length of an OpenAI call. The
+executor is capped at GMP_JOB_WORKERS threads for the whole process, and jobs
+wait in submission order, so one consultant's long run cannot starve the others.
+
+Cancellation is cooperative: Job.cancel() drops a job that has not started, and
+a running job raises JobCancelled at its next LLM request or streamed chunk (see
+check_cancelled), leaving the rest of its calls unsent. A job cancelled while its
+last calls were in flight has its result discarded.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOB_WORKERS = 8
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job once it was cancelled, and by Job.result() for such a job.
+    """
+
+
+_current_job = contextvars.ContextVar("gmp_background_job", default=None)
+
+
+def check_cancelled():
+    """
+    Raises JobCancelled if the job running in this context was cancelled. A no-op
+    outside background jobs.
+    """
+    job = _current_job.get()
+    if job is not None and job.cancel_requested:
+        raise JobCancelled(f"{job.label} was cancelled")
+
+
+def report_progress(text):
+    """
+    Appends text to the current job's progress output (e.g. a streamed chunk).
+    """
+    job = _current_job.get()
+    if job is not None:
+        job._chunks.append(text)
+
+
+def collect_stream(chunks):
+    """
+    Consumes a text stream inside a job, reporting each chunk; returns the full text.
+    """
+    parts = []
+    for chunk in chunks:
+        check_cancelled()
+        parts.append(chunk)
+        report_progress(chunk)
+    return "".join(parts)
+
+
+class Job:
+    """
+    Handle on one submitted step. name identifies what the result is for; label is
+    shown to the user.
+    """
+    __slots__ = ("name", "label", "submitted_at", "started_at", "finished_at", "future", "_cancel", "_chunks")
+
+    def __init__(self, name, label):
+        self.name = name
+        self.label = label
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._chunks = []
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def status(self):
+        """
+        queued, running, cancelling, cancelled, failed or done.
+        """
+        if not self.future.done():
+            if self.started_at is None:
+                return "queued"
+            return "cancelling" if self.cancel_requested else "running"
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return "cancelled"
+        return "failed" if self.future.exception() is not None else "done"
+
+    def done(self):
+        return self.future.done()
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def progress_text(self):
+        return "".join(self._chunks)
+
+    def cancel(self):
+        self._cancel.set()
+        self.future.cancel()
+
+    def result(self):
+        """
+        The step's return value. Raises JobCancelled for a cancelled job and re-raises
+        the step's own exception if it failed.
+        """
+        if self.future.cancelled():
+            raise JobCancelled(f"{self.label} was cancelled")
+        return self.future.result()
+
+
+class JobExecutor:
+    """
+    Capped thread pool for Jobs. Each job runs in a copy of the submitting context,
+    so its LLM calls are metered against the caller's usage ledger.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gmp-llm-job")
+        self._queue = []
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, name, label, func, *args, **kwargs):
+        job = Job(name, label)
+        with self._lock:
+            self._queue.append(job)
+        job.future = self._executor.submit(contextvars.copy_context().run, self._run, job, func, args, kwargs)
+        job.future.add_done_callback(lambda _: self._dequeue(job))
+        return job
+
+    def _dequeue(self, job):
+        with self._lock:
+            if job in self._queue:
+                self._queue.remove(job)
+
+    def _run(self, job, func, args, kwargs):
+        with self._lock:
+            if job in self._queue:
+                self._queue.remove(job)
+            self._running += 1
+        job.started_at = time.time()
+        _current_job.set(job)
+        try:
+            check_cancelled()
+            result = func(*args, **kwargs)
+            # Calls already in flight when the job was cancelled still complete; their
+            # responses stay in the LLM cache, but the step's result is dropped
+            check_cancelled()
+            return result
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._running -= 1
+
+    def queue_position(self, job):
+        """
+        Number of jobs ahead of job in the queue (0 once it is running).
+        """
+        with self._lock:
+            return self._queue.index(job) if job in self._queue else 0
+
+    def has_idle_worker(self):
+        """
+        True when a job submitted now would start without waiting.
+        """
+        with self._lock:
+            return not self._queue and self._running < self.max_workers
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """
+    Process-wide JobExecutor with GMP_JOB_WORKERS threads, shared by all sessions.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = JobExecutor(max(1, int(os.environ.get("GMP_JOB_WORKERS", DEFAULT_JOB_WORKERS))))
+        return _executor
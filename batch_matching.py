@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+from recommendation_agent import (
+    get_rule_plan,
+    normalize_question_column,
+    normalize_answer_column
+)
+
+# matches: one row per (client, matched recommendation), in client then rule order
+# totals: one row per client with the same totals run_recommendation_analysis returns
+BatchAnalysis = namedtuple("BatchAnalysis", ["matches", "totals"])
+
+
+FEATURE_SEPARATOR = "\x1f"
+
+
+def feature_key(question, answer):
+    """
+    Flat string key for a (normalized question, normalized answer) feature, so whole
+    columns can be mapped to feature ids with one vectorized lookup.
+    """
+    return question + FEATURE_SEPARATOR + answer
+
+
+class RuleMasks:
+    """
+    Boolean matrix form of a RulePlan.
+    Features are the (question, answer) pairs named by any condition; questions are the
+    distinct questions any condition needs.
+    """
+    __slots__ = ("questions", "question_ids", "features", "feature_ids",
+                 "condition_features", "condition_questions", "condition_negative",
+                 "condition_rules", "rule_sizes", "rules")
+
+    def __init__(self, plan):
+        self.rules = plan.rules
+        self.questions = sorted(plan.question_index)
+        self.question_ids = {q: i for i, q in enumerate(self.questions)}
+
+        conditions = [(rule.index, c) for rule in plan.rules for c in rule.conditions]
+        self.features = sorted({(c.question, a) for _, c in conditions for a in c.answers})
+        self.feature_ids = {feature_key(q, a): i for i, (q, a) in enumerate(self.features)}
+
+        # condition_features[f, c]: answer feature f satisfies the answer list of condition c
+        self.condition_features = np.zeros((len(self.features), len(conditions)), dtype=bool)
+        # condition_rules[c, r]: condition c belongs to rule r
+        self.condition_rules = np.zeros((len(conditions), len(plan.rules)), dtype=np.int32)
+        self.condition_questions = np.empty(len(conditions), dtype=np.intp)
+        self.condition_negative = np.zeros(len(conditions), dtype=bool)
+
+        for c, (rule_index, condition) in enumerate(conditions):
+            for answer in condition.answers:
+                self.condition_features[self.feature_ids[feature_key(condition.question, answer)], c] = True
+            self.condition_rules[c, rule_index] = 1
+            self.condition_questions[c] = self.question_ids[condition.question]
+            self.condition_negative[c] = condition.negative
+
+        self.rule_sizes = self.condition_rules.sum(axis=0)
+
+
+_MASK_CACHE = {}
+
+
+def get_rule_masks(plan=None):
+    """
+    Returns the RuleMasks for a plan, building them once per plan object.
+    """
+    plan = plan or get_rule_plan()
+    cached = _MASK_CACHE.get(id(plan))
+    if cached is None or cached[0] is not plan:
+        cached = (plan, RuleMasks(plan))
+        if len(_MASK_CACHE) >= 4:
+            # Hot-reloaded rule sets would otherwise keep every old plan alive
+            _MASK_CACHE.clear()
+        _MASK_CACHE[id(plan)] = cached
+    return cached[1]
+
+
+def run_batch_recommendation_analysis(df, client_column="ClientId", plan=None):
+    """
+    Matches every client in a long assessment DataFrame (Question, Answer, Score,
+    MaxWeight plus a client id column) against the rule plan in one pass. Rows
+    without a client id are ignored.
+
+    Each client is encoded as a boolean row over (question, answer) features, so the
+    per-condition answer tests, rule matches and score/maxweight totals for all clients
+    come out of a handful of matrix operations. Per-client results equal
+    run_recommendation_analysis on that client's rows (up to float summation order).
+    Returns a BatchAnalysis of two tidy DataFrames.
+    """
+    masks = get_rule_masks(plan)
+
+    # Rows without a client id belong to no client; factorize would code them -1,
+    # which indexes the last client's row of every matrix below
+    df = df[df[client_column].notna()]
+    client_codes, clients = pd.factorize(df[client_column])
+    n_clients = len(clients)
+
+    question_keys = normalize_question_column(df['Question'])
+    question_codes = question_keys.map(masks.question_ids).to_numpy()
+    relevant = ~pd.isna(question_codes)
+
+    # Only rows for questions some rule looks at can influence a match
+    client_codes = client_codes[relevant]
+    question_codes = question_codes[relevant].astype(np.intp)
+    answer_keys = normalize_answer_column(df['Answer'])[relevant]
+    scores = np.clip(df['Score'].astype(float).fillna(0.0).to_numpy()[relevant], 0.0, None)
+    max_weights = np.clip(df['MaxWeight'].astype(float).fillna(0.0).to_numpy()[relevant], 0.0, None)
+
+    n_questions = len(masks.questions)
+
+    # Question presence and first-row score/maxweight per (client, question)
+    cell_codes = client_codes.astype(np.int64) * n_questions + question_codes
+    _, first_rows = np.unique(cell_codes, return_index=True)
+    first_clients = client_codes[first_rows]
+    first_questions = question_codes[first_rows]
+
+    present = np.zeros((n_clients, n_questions), dtype=bool)
+    present[first_clients, first_questions] = True
+    question_scores = np.zeros((n_clients, n_questions))
+    question_scores[first_clients, first_questions] = scores[first_rows]
+    question_max_weights = np.zeros((n_clients, n_questions))
+    question_max_weights[first_clients, first_questions] = max_weights[first_rows]
+
+    # Client x feature answer matrix; answers no condition mentions stay unencoded
+    feature_codes = (question_keys[relevant] + FEATURE_SEPARATOR + answer_keys).map(masks.feature_ids).to_numpy()
+    known = ~pd.isna(feature_codes)
+    answered = np.zeros((n_clients, len(masks.features)), dtype=bool)
+    answered[client_codes[known], feature_codes[known].astype(np.intp)] = True
+
+    # hits[i, c]: client i gave at least one answer from condition c's list
+    hits = answered @ masks.condition_features
+    condition_present = present[:, masks.condition_questions]
+    condition_met = condition_present & (hits != masks.condition_negative)
+
+    matched = (condition_met.astype(np.int32) @ masks.condition_rules) == masks.rule_sizes
+    rule_scores = question_scores[:, masks.condition_questions] @ masks.condition_rules
+    rule_max_weights = question_max_weights[:, masks.condition_questions] @ masks.condition_rules
+
+    match_clients, match_rules = np.nonzero(matched)
+    rules = [masks.rules[r] for r in match_rules]
+    matches = pd.DataFrame({
+        client_column: clients[match_clients],
+        'rule_index': match_rules,
+        'recommendation': [rule.recommendation for rule in rules],
+        'overview': [rule.overview for rule in rules],
+        'gmp_impact': [rule.gmp_impact for rule in rules],
+        'business_impact': [rule.business_impact for rule in rules],
+        'score': rule_scores[match_clients, match_rules],
+        'maxweight': rule_max_weights[match_clients, match_rules]
+    })
+
+    totals = pd.DataFrame({
+        client_column: clients,
+        'total_matched_recommendations': matched.sum(axis=1),
+        'total_score': np.where(matched, rule_scores, 0.0).sum(axis=1),
+        'total_max_score': np.where(matched, rule_max_weights, 0.0).sum(axis=1)
+    })
+
+    return BatchAnalysis(matches, totals)
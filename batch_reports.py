@@ -0,0 +1,291 @@
+"""
+Headless batch runner: turns a folder of GMP assessment CSVs into per-client reports.
+
+    python batch_reports.py assessments/ reports/ --workers 8
+    python batch_reports.py export.parquet reports/ --client-column ClientId
+
+Each <client>.csv produces reports/<client>/ with summary.md, bullet_summary.md,
+gaps.csv, drivers.csv, recommendations.csv, maturity.csv and results.json (plus
+report.pdf with --pdf, rendered on a separate process pool). After each run the
+portfolio's maturity percentile table is rebuilt in reports/maturity_percentiles.npz
+from every client's maturity.csv, and saved where the app reads it (see
+--percentile-table). Progress is checkpointed in reports/checkpoint.json after every client, so a crashed run resumes
+where it stopped, and clients whose CSV content has not changed since their last
+successful run (under the same rule set) are skipped.
+
+A single multi-client export (CSV or Parquet with a client id column) is streamed
+in chunks instead (see assessment_io.iter_client_assessments), with each client's
+report in reports/<client id>/. Only a bounded number of clients is held in memory
+at a time, so exports larger than memory can be processed; pass --unsorted when
+the export is not grouped by client.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+import pandas as pd
+
+from recommendation_agent import (
+    run_recommendation_analysis,
+    generate_full_analysis,
+    recommendations_to_dataframe,
+    calculate_maturity_levels,
+    OVERALL_CATEGORY,
+    get_rule_set,
+    build_analysis_payload
+)
+from llm_usage import start_run
+from assessment_io import read_assessment, iter_client_assessments, DEFAULT_CLIENT_COLUMN, DEFAULT_CHUNK_ROWS
+from assessment_store import dataframe_hash
+from maturity_benchmarks import DEFAULT_PERCENTILE_TABLE_PATH, PercentileTable, load_portfolio_levels
+from report_pdf import warm_fonts, write_report_pdf
+
+CHECKPOINT_FILE = "checkpoint.json"
+PERCENTILE_TABLE_FILE = "maturity_percentiles.npz"
+
+logger = logging.getLogger("batch_reports")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path) or "."
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False, suffix=".tmp") as f:
+        f.write(text)
+        temp_path = f.name
+    os.replace(temp_path, path)
+
+
+class Checkpoint:
+    """
+    client id -> {input_hash, rules_hash, status, finished_at, error}, rewritten atomically after
+    every client so it survives a crash mid-run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def is_current(self, client_id, input_hash, skip_llm=False, rules_hash=None):
+        entry = self.entries.get(client_id)
+        if not entry or entry.get("status") != "done" or entry.get("input_hash") != input_hash:
+            return False
+        # Recommendations computed under an older rule file are out of date
+        if rules_hash is not None and entry.get("rules_hash") != rules_hash:
+            return False
+        # A recommendations-only run does not satisfy a later run that needs the LLM sections
+        return skip_llm or not entry.get("skip_llm")
+
+    def update(self, client_id, **entry):
+        with self._lock:
+            self.entries[client_id] = entry
+            _write_atomic(self.path, json.dumps(self.entries, indent=2, sort_keys=True))
+
+
+def process_client(source, client_dir, skip_llm=False):
+    """
+    Runs the full analysis for one assessment (a file path or a DataFrame) and writes
+    its report files. Returns the results.json content.
+    """
+    df = source if isinstance(source, pd.DataFrame) else read_assessment(source)
+
+    os.makedirs(client_dir, exist_ok=True)
+    ledger = start_run()
+
+    results = run_recommendation_analysis(df)
+    recommendations_to_dataframe(results).to_csv(os.path.join(client_dir, "recommendations.csv"), index=False)
+    maturity = calculate_maturity_levels(df)
+    pd.concat([maturity.categories, pd.DataFrame([{"Category": OVERALL_CATEGORY, **maturity.overall}])],
+              ignore_index=True).to_csv(os.path.join(client_dir, "maturity.csv"), index=False)
+
+    if not skip_llm:
+        analysis = generate_full_analysis(df, payload=build_analysis_payload(df))
+        _write_atomic(os.path.join(client_dir, "summary.md"), analysis.summary or "")
+        _write_atomic(os.path.join(client_dir, "bullet_summary.md"), analysis.bullet_summary or "")
+        analysis.maturity_gaps.to_csv(os.path.join(client_dir, "gaps.csv"), index=False)
+        analysis.maturity_drivers.to_csv(os.path.join(client_dir, "drivers.csv"), index=False)
+
+    report = {
+        "total_matched_recommendations": results['total_matched_recommendations'],
+        "total_score": results['total_score'],
+        "total_max_score": results['total_max_score'],
+        "rules_version": get_rule_set().version,
+        "maturity_level": None if pd.isna(maturity.overall["maturity_level"]) else maturity.overall["maturity_level"],
+        "llm_usage": ledger.summary()
+    }
+    _write_atomic(os.path.join(client_dir, "results.json"), json.dumps(report, indent=2))
+    return report
+
+
+def run_batch(input_dir, output_dir, workers=4, pattern="*.csv", force=False, skip_llm=False,
+              pdf=False, pdf_workers=None, percentile_table=None):
+    """
+    Processes every CSV in input_dir on a pool of worker threads. With pdf=True each
+    finished client's report.pdf is rendered on a process pool while other clients
+    are still being analysed. The rebuilt percentile table is also saved to
+    percentile_table when given.
+    Returns {"done": [...], "skipped": [...], "failed": [...]} client ids.
+    """
+    def clients():
+        for csv_path in sorted(glob.glob(os.path.join(input_dir, pattern))):
+            yield os.path.splitext(os.path.basename(csv_path))[0], csv_path, file_sha256(csv_path)
+
+    return _process_all(clients(), output_dir, workers, force, skip_llm, pdf, pdf_workers, percentile_table)
+
+
+def run_export_batch(export_path, output_dir, workers=4, force=False, skip_llm=False, pdf=False,
+                     pdf_workers=None, client_column=DEFAULT_CLIENT_COLUMN, chunk_rows=DEFAULT_CHUNK_ROWS,
+                     grouped=True, percentile_table=None):
+    """
+    Like run_batch, for a single CSV or Parquet export holding many clients'
+    assessments, identified by client_column. grouped=False accepts an export that
+    is not sorted by client (see iter_client_assessments). A client's checkpoint hash
+    is that of its rows, so unchanged clients are skipped as with run_batch.
+    """
+    def clients():
+        for client_id, df in iter_client_assessments(export_path, client_column, chunk_rows, grouped):
+            yield client_id, df, dataframe_hash(df)
+
+    return _process_all(clients(), output_dir, workers, force, skip_llm, pdf, pdf_workers, percentile_table)
+
+
+def _client_dir(output_dir, client_id):
+    if not client_id or client_id in (".", "..") or os.path.basename(client_id) != client_id:
+        raise ValueError(f"client id {client_id!r} cannot be used as a folder name")
+    return os.path.join(output_dir, client_id)
+
+
+def _process_all(clients, output_dir, workers, force, skip_llm, pdf, pdf_workers, percentile_table=None):
+    """
+    Runs process_client for each (client id, source, input hash) in clients. Clients
+    are drawn lazily, at most two per worker ahead, so a streamed export is never
+    held in memory as a whole.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(output_dir, CHECKPOINT_FILE))
+    outcome = {"done": [], "skipped": [], "failed": []}
+    rules_hash = get_rule_set().source_hash
+    max_pending = 2 * max(1, workers)
+
+    pdf_executor = ProcessPoolExecutor(max_workers=pdf_workers, initializer=warm_fonts) if pdf else None
+    pdf_futures = {}
+
+    def finish(future):
+        client_id, input_hash = futures.pop(future)
+        try:
+            report = future.result()
+        except Exception as e:
+            logger.error("%s failed: %s", client_id, e)
+            checkpoint.update(client_id, input_hash=input_hash, status="failed", finished_at=time.time(), error=str(e))
+            outcome["failed"].append(client_id)
+            return
+        checkpoint.update(client_id, input_hash=input_hash, status="done", finished_at=time.time(),
+                          skip_llm=skip_llm, rules_hash=rules_hash, cost=report["llm_usage"]["cost"])
+        outcome["done"].append(client_id)
+        logger.info("%s done (%d recommendations)", client_id, report["total_matched_recommendations"])
+        if pdf_executor is not None:
+            pdf_futures[pdf_executor.submit(write_report_pdf, os.path.join(output_dir, client_id))] = client_id
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="gmp-batch") as executor:
+        try:
+            for client_id, source, input_hash in clients:
+                if not force and checkpoint.is_current(client_id, input_hash, skip_llm, rules_hash):
+                    outcome["skipped"].append(client_id)
+                    continue
+                try:
+                    client_dir = _client_dir(output_dir, client_id)
+                except ValueError as e:
+                    logger.error("%s failed: %s", client_id, e)
+                    outcome["failed"].append(client_id)
+                    continue
+                while len(futures) >= max_pending:
+                    for future in wait(futures, return_when=FIRST_COMPLETED).done:
+                        finish(future)
+                futures[executor.submit(process_client, source, client_dir, skip_llm)] = (client_id, input_hash)
+        finally:
+            # Also on a read error mid-export, so clients already submitted are checkpointed
+            for future in as_completed(list(futures)):
+                finish(future)
+
+    logger.info("%d clients processed, %d unchanged and skipped", len(outcome["done"]) + len(outcome["failed"]),
+                len(outcome["skipped"]))
+
+    if outcome["done"]:
+        levels = load_portfolio_levels(output_dir)
+        table = PercentileTable.from_portfolio(levels)
+        table.save(os.path.join(output_dir, PERCENTILE_TABLE_FILE))
+        if percentile_table:
+            table.save(percentile_table)
+        logger.info("maturity percentiles rebuilt from %d clients", levels['ClientId'].nunique())
+
+    if pdf_executor is not None:
+        for future in as_completed(pdf_futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error("%s PDF rendering failed: %s", pdf_futures[future], e)
+        pdf_executor.shutdown()
+
+    return outcome
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", help="Folder of assessment CSVs, one per client, or a multi-client export file")
+    parser.add_argument("output_dir", help="Folder to write per-client reports and the checkpoint to")
+    parser.add_argument("--workers", type=int, default=4, help="Clients processed in parallel")
+    parser.add_argument("--pattern", default="*.csv", help="Glob for assessment files inside input_dir")
+    parser.add_argument("--force", action="store_true", help="Reprocess clients even if their input is unchanged")
+    parser.add_argument("--skip-llm", action="store_true", help="Only compute recommendations, no OpenAI calls")
+    parser.add_argument("--pdf", action="store_true", help="Also render report.pdf for each processed client")
+    parser.add_argument("--pdf-workers", type=int, default=None, help="Processes used for PDF rendering")
+    parser.add_argument("--client-column", default=DEFAULT_CLIENT_COLUMN,
+                        help="Client id column of a multi-client export")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Rows read at a time from a multi-client export")
+    parser.add_argument("--unsorted", action="store_true",
+                        help="The export is not grouped by client (spills it to a temporary folder first)")
+    parser.add_argument("--percentile-table",
+                        default=os.environ.get("GMP_PERCENTILE_TABLE_PATH", DEFAULT_PERCENTILE_TABLE_PATH),
+                        help="Where to also save the portfolio percentile table for the app "
+                             "(default GMP_PERCENTILE_TABLE_PATH or .cache/maturity_percentiles.npz; empty to skip)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if os.path.isfile(args.input_dir):
+        try:
+            outcome = run_export_batch(args.input_dir, args.output_dir, args.workers, args.force, args.skip_llm,
+                                       args.pdf, args.pdf_workers, args.client_column, args.chunk_rows,
+                                       grouped=not args.unsorted, percentile_table=args.percentile_table)
+        except ValueError as e:
+            # Clients processed before the error are checkpointed, so a rerun skips them
+            logger.error("%s cannot be processed: %s", args.input_dir, e)
+            return 1
+    else:
+        outcome = run_batch(args.input_dir, args.output_dir, args.workers, args.pattern, args.force,
+                            args.skip_llm, args.pdf, args.pdf_workers, args.percentile_table)
+    logger.info("done: %d, skipped: %d, failed: %d", len(outcome["done"]), len(outcome["skipped"]), len(outcome["failed"]))
+    return 1 if outcome["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
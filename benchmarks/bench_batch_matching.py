@@ -0,0 +1,53 @@
+"""
+Benchmark for the portfolio batch matcher.
+
+Times run_batch_recommendation_analysis on synthetic portfolios of increasing size
+and, for the smaller sizes, the equivalent loop of run_recommendation_analysis calls.
+BLAS is pinned to one thread so the numbers reflect a single core.
+
+    python benchmarks/bench_batch_matching.py --clients 1000 10000 20000
+"""
+import os
+
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recommendation_agent import run_recommendation_analysis
+from batch_matching import run_batch_recommendation_analysis
+from synthetic import make_portfolio
+
+
+def _time(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def _loop(df):
+    for _, client_df in df.groupby('ClientId', sort=False):
+        run_recommendation_analysis(client_df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1000, 10000, 20000])
+    parser.add_argument("--loop-limit", type=int, default=2000,
+                        help="Largest portfolio to also time with the per-client loop")
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'rows':>10} {'batch s':>9} {'clients/s':>11} {'loop s':>9}")
+    for n_clients in args.clients:
+        df = make_portfolio(n_clients)
+        batch_seconds = _time(run_batch_recommendation_analysis, df)
+        loop_seconds = _time(_loop, df) if n_clients <= args.loop_limit else float("nan")
+        print(f"{n_clients:>8} {len(df):>10} {batch_seconds:>9.3f} {n_clients / batch_seconds:>11.0f} {loop_seconds:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
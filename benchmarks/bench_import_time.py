@@ -0,0 +1,80 @@
+"""
+Import-time benchmark for worker start-up.
+
+Each scenario is imported in a fresh interpreter, several times, and the median
+import time, process wall time and peak RSS are reported, together with which heavy
+optional dependencies ended up loaded. "eager" imports the LLM and PDF modules up
+front, which is what importing recommendation_agent used to cost.
+
+    python benchmarks/bench_import_time.py --repeat 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "core": "import recommendation_agent",
+    "batch_matching": "import batch_matching",
+    "eager": "import recommendation_agent, llm_client, llm_cache, llm_usage, prompt_payload, report_pdf"
+}
+
+HEAVY_MODULES = ("openai", "streamlit", "fpdf", "tiktoken", "sqlite3")
+
+_CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "import_seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+
+def measure(statement, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", _CHILD.format(statement=statement, heavy=HEAVY_MODULES)],
+            cwd=REPO_ROOT, env=dict(os.environ, GMP_RULES_POLL_SECONDS="0"),
+            check=True, capture_output=True, text=True
+        ).stdout
+        run = json.loads(output.strip().splitlines()[-1])
+        run["process_seconds"] = time.perf_counter() - started
+        runs.append(run)
+    return {
+        "import_ms": round(statistics.median(r["import_seconds"] for r in runs) * 1000, 1),
+        "process_ms": round(statistics.median(r["process_seconds"] for r in runs) * 1000, 1),
+        "max_rss_mb": round(statistics.median(r["max_rss_mb"] for r in runs), 1),
+        "heavy_modules": runs[-1]["heavy_modules"]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per scenario")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {name: measure(statement, args.repeat) for name, statement in SCENARIOS.items()}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'scenario':<16}{'import ms':>12}{'process ms':>12}{'peak RSS MB':>13}  heavy modules loaded")
+    for name, result in results.items():
+        print(f"{name:<16}{result['import_ms']:>12}{result['process_ms']:>12}{result['max_rss_mb']:>13}  "
+              f"{', '.join(result['heavy_modules']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+End-to-end benchmark of the full five-step pipeline against an OpenAI-compatible stub.
+
+Each synthetic assessment goes through what the app's "Generate Full Analysis" does
+(category summary, bullet summary, gaps and drivers, recommendations) plus PDF
+rendering, with the LLM response cache disabled. Assessments run --concurrency at a
+time, and per-assessment latency percentiles and overall throughput are reported.
+No network access or API key is needed: the bundled llm_stub_server runs in-process
+unless --base-url points elsewhere. With GMP_LLM_TRANSPORT=replay the recorded
+cassettes are used instead.
+
+    python benchmarks/bench_pipeline.py --assessments 40 --concurrency 8 --profile typical
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_stub_server import LATENCY_PROFILES, StubServer
+from synthetic import make_assessment
+
+
+def run_pipeline(df):
+    """
+    All five steps plus the PDF for one assessment; returns (seconds, usage summary).
+    """
+    from llm_usage import start_run
+    from recommendation_agent import (
+        build_analysis_payload,
+        generate_full_analysis,
+        run_recommendation_analysis,
+        recommendations_to_dataframe
+    )
+    from report_pdf import create_full_report_pdf
+
+    ledger = start_run()
+    started = time.perf_counter()
+    analysis = generate_full_analysis(df, use_cache=False, payload=build_analysis_payload(df, use_cache=False))
+    results = run_recommendation_analysis(df)
+    create_full_report_pdf(analysis.summary, analysis.bullet_summary, analysis.maturity_gaps,
+                           analysis.maturity_drivers, recommendations_to_dataframe(results))
+    return time.perf_counter() - started, ledger.summary()
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assessments", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="Assessments processed at once")
+    parser.add_argument("--rows", type=int, default=300, help="Rows per synthetic assessment")
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="typical",
+                        help="Latency profile of the in-process stub")
+    parser.add_argument("--base-url", default=None, help="Use an already running stub (or other endpoint) instead")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.base_url is None and os.environ.get("GMP_LLM_TRANSPORT", "live") != "replay":
+        server = StubServer(profile=args.profile).start()
+    os.environ["OPENAI_BASE_URL"] = args.base_url or (server.url if server else os.environ.get("OPENAI_BASE_URL", ""))
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["GMP_LLM_CACHE_PATH"] = ""
+    os.environ.setdefault("GMP_USAGE_LOG_PATH", "")
+    # The real account limits are irrelevant against the stub
+    os.environ.setdefault("GMP_OPENAI_RPM", "1000000")
+    os.environ.setdefault("GMP_OPENAI_TPM", "1000000000")
+
+    assessments = [make_assessment(args.rows, seed=i) for i in range(args.assessments)]
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            runs = list(executor.map(run_pipeline, assessments))
+    finally:
+        if server is not None:
+            server.stop()
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds for seconds, _ in runs]
+    report = {
+        "assessments": args.assessments,
+        "concurrency": args.concurrency,
+        "rows": args.rows,
+        "profile": args.profile if server else None,
+        "transport": os.environ.get("GMP_LLM_TRANSPORT", "live"),
+        "elapsed_seconds": round(elapsed, 3),
+        "assessments_per_minute": round(60 * args.assessments / elapsed, 2),
+        "latency_p50": round(statistics.median(latencies), 3),
+        "latency_p95": round(_percentile(latencies, 95), 3),
+        "latency_max": round(max(latencies), 3),
+        "llm_calls": sum(usage["calls"] for _, usage in runs),
+        "prompt_tokens": sum(usage["prompt_tokens"] for _, usage in runs),
+        "completion_tokens": sum(usage["completion_tokens"] for _, usage in runs)
+    }
+    for name, value in report.items():
+        print(f"{name:<24}{value}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
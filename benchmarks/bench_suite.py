@@ -0,0 +1,278 @@
+"""
+Benchmark suite for the deterministic parts of the pipeline.
+
+Times CSV ingestion, answer-map building, run_recommendation_analysis, maturity
+scoring, prompt building, gap/driver parsing (structured JSON and legacy markdown),
+PDF rendering, reloading a stored analysis, portfolio batch matching, maturity
+percentile ranking and near-duplicate lookup on synthetic assessments of increasing size. No LLM calls are
+made. Each stage is run --repeat times after a warm-up call and the median and
+minimum are recorded. For each assessment size the input tokens of the four
+analysis prompts are also recorded (PromptPayload.token_report), against the old
+repr-list format.
+
+Results are written as JSON (by default to benchmarks/results/<commit>.json) so runs
+on two commits can be compared:
+
+    python benchmarks/bench_suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/bench_suite.py --compare before.json
+"""
+import os
+
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import io
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+import pandas as pd
+
+from recommendation_agent import (
+    build_answer_map,
+    calculate_maturity_levels,
+    maturity_table,
+    run_recommendation_analysis,
+    recommendations_to_dataframe,
+    parse_maturity_items,
+    parse_maturity_markdown
+)
+from assessment_io import read_assessment
+from assessment_store import AssessmentStore, dataframe_hash
+from batch_matching import run_batch_recommendation_analysis
+from maturity_benchmarks import PercentileTable
+from prompt_payload import build_prompt_payload
+from report_pdf import create_full_report_pdf
+from similarity_index import DEFAULT_SIMILARITY_THRESHOLD, SimilarityIndex, answer_shingles
+from synthetic import make_assessment, make_portfolio
+
+DEFAULT_ROWS = (100, 500, 2000, 10000)
+DEFAULT_CLIENTS = (100, 1000)
+DEFAULT_MATURITY_ITEMS = (5, 50)
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def time_stage(func, repeat):
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "repeat": repeat
+    }
+
+
+def _maturity_items(n_items):
+    return [
+        {
+            "heading": f"Maturity item {i}",
+            "context": "First-party data is collected but rarely activated across GMP products.",
+            "impact": "Limits audience precision and measurement, slowing optimisation."
+        }
+        for i in range(n_items)
+    ]
+
+
+def _maturity_markdown(items):
+    return "\n".join(
+        f"{i}. **Heading**: {item['heading']}\n   **Context**: {item['context']}\n   **Impact**: {item['impact']}"
+        for i, item in enumerate(items, start=1)
+    )
+
+
+def assessment_stages(rows):
+    """
+    (stage name, callable) pairs for one synthetic assessment of about rows rows.
+    """
+    df = make_assessment(rows, seed=rows)
+    csv_bytes = df.to_csv(index=False).encode("utf-8")
+    recommendations_df = recommendations_to_dataframe(run_recommendation_analysis(df))
+    summary = " ".join(df['Comment'].dropna().head(40))
+    store = AssessmentStore(tempfile.mkdtemp(prefix="gmp-bench-store-"))
+    stored_key = ("Bench Client", "2025-01-01", dataframe_hash(df))
+    store.save(*stored_key, df, summary=summary, bullet_summary=summary,
+               recommendation_results=run_recommendation_analysis(df), step=5)
+    return [
+        ("ingest_csv", lambda: pd.read_csv(io.BytesIO(csv_bytes))),
+        ("ingest_csv_typed", lambda: read_assessment(io.BytesIO(csv_bytes), fmt="csv")),
+        ("build_answer_map", lambda: build_answer_map(df)),
+        ("run_recommendation_analysis", lambda: run_recommendation_analysis(df)),
+        ("calculate_maturity_levels", lambda: calculate_maturity_levels(df)),
+        ("build_prompt_payload", lambda: build_prompt_payload(df)),
+        ("render_pdf", lambda: create_full_report_pdf(summary, summary, None, None, recommendations_df)),
+        ("store_load", lambda: store.load(stored_key))
+    ]
+
+
+def prompt_token_report(rows):
+    """
+    PromptPayload.token_report of the synthetic assessment the rows-sized stages use.
+    """
+    return {"rows": rows, **build_prompt_payload(make_assessment(rows, seed=rows)).token_report()}
+
+
+def parsing_stages(n_items):
+    items = _maturity_items(n_items)
+    response = json.dumps({"gaps": items, "drivers": items})
+    markdown = _maturity_markdown(items)
+
+    def parse_structured():
+        analysis = json.loads(response)
+        return parse_maturity_items(analysis["gaps"]), parse_maturity_items(analysis["drivers"])
+
+    return [
+        ("parse_gaps_drivers_json", parse_structured),
+        ("parse_gaps_drivers_markdown", lambda: (parse_maturity_markdown(markdown), parse_maturity_markdown(markdown)))
+    ]
+
+
+def _similarity_index(portfolio):
+    index = SimilarityIndex(sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False), threading.Lock())
+    for client, client_df in portfolio.groupby('ClientId', sort=False):
+        index.add(client, answer_shingles(client_df))
+    return index
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run_suite(rows=DEFAULT_ROWS, clients=DEFAULT_CLIENTS, maturity_items=DEFAULT_MATURITY_ITEMS, repeat=5):
+    """
+    Runs every stage and returns {"meta": {...}, "results": [{stage, size_kind, size, median_ms, ...}],
+    "prompt_tokens": [{rows, legacy_tokens, payload_tokens, ...}]}.
+    """
+    results = []
+    prompt_tokens = []
+
+    def record(stage, size_kind, size, func):
+        result = time_stage(func, repeat)
+        results.append({"stage": stage, "size_kind": size_kind, "size": size, **result})
+        print(f"{stage:<34}{size_kind:>8}{size:>8}{result['median_ms']:>12.3f}{result['min_ms']:>12.3f}", flush=True)
+
+    print(f"{'stage':<34}{'size':>16}{'median ms':>12}{'min ms':>12}")
+    for n_rows in rows:
+        for stage, func in assessment_stages(n_rows):
+            record(stage, "rows", n_rows, func)
+        prompt_tokens.append(prompt_token_report(n_rows))
+    for n_items in maturity_items:
+        for stage, func in parsing_stages(n_items):
+            record(stage, "items", n_items, func)
+    for n_clients in clients:
+        portfolio = make_portfolio(n_clients)
+        record("run_batch_recommendation_analysis", "clients", n_clients,
+               lambda: run_batch_recommendation_analysis(portfolio))
+        record("portfolio_maturity_table", "clients", n_clients, lambda: maturity_table(portfolio, ['ClientId']))
+        percentiles = PercentileTable.from_portfolio(maturity_table(portfolio, ['ClientId']))
+        scores = calculate_maturity_levels(make_assessment(seed=n_clients))
+        record("percentile_rank", "clients", n_clients, lambda: percentiles.rank(scores))
+        index = _similarity_index(portfolio)
+        shingles = answer_shingles(make_assessment(seed=n_clients))
+        record("similar_lookup", "clients", n_clients, lambda: index.query(shingles, DEFAULT_SIMILARITY_THRESHOLD))
+
+    print(f"\n{'prompt tokens':<34}{'rows':>16}{'legacy':>12}{'payload':>12}{'saved %':>8}{'omitted':>9}")
+    for report in prompt_tokens:
+        print(f"{'analysis_prompts':<34}{report['rows']:>16}{report['legacy_tokens']:>12}"
+              f"{report['payload_tokens']:>12}{report['saved_pct']:>8.1f}{report['omitted_questions']:>9}")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat
+        },
+        "results": results,
+        "prompt_tokens": prompt_tokens
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints median time ratios (current / baseline) per stage and size. Returns the
+    entries slower than threshold.
+    """
+    previous = {(r["stage"], r["size_kind"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\ncompared with {baseline['meta'].get('commit')}:")
+    print(f"{'stage':<34}{'size':>16}{'before ms':>12}{'after ms':>12}{'ratio':>8}")
+    for result in current["results"]:
+        before = previous.get((result["stage"], result["size_kind"], result["size"]))
+        if before is None or not before["median_ms"]:
+            continue
+        ratio = result["median_ms"] / before["median_ms"]
+        flag = "  <- slower" if ratio > threshold else ""
+        print(f"{result['stage']:<34}{result['size_kind']:>8}{result['size']:>8}"
+              f"{before['median_ms']:>12.3f}{result['median_ms']:>12.3f}{ratio:>8.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(result)
+
+    previous_tokens = {r["rows"]: r for r in baseline.get("prompt_tokens", [])}
+    for report in current.get("prompt_tokens", []):
+        before = previous_tokens.get(report["rows"])
+        if before is not None and before["payload_tokens"] != report["payload_tokens"]:
+            print(f"{'analysis_prompt_tokens':<34}{'rows':>8}{report['rows']:>8}"
+                  f"{before['payload_tokens']:>12}{report['payload_tokens']:>12}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="Assessment sizes in rows")
+    parser.add_argument("--clients", type=int, nargs="+", default=list(DEFAULT_CLIENTS),
+                        help="Portfolio sizes for batch matching")
+    parser.add_argument("--items", type=int, nargs="+", default=list(DEFAULT_MATURITY_ITEMS),
+                        help="Gap/driver counts for the parsing stages")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per stage")
+    parser.add_argument("--output", default=None, help="JSON results path (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Ratio above which a stage counts as a regression in --compare")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.rows, args.clients, args.items, args.repeat)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit'] or time.strftime('%Y%m%d-%H%M%S')}.json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Synthetic GMP assessment generator for benchmarks.
+
+Questions and answers come from the active recommendation rule set, so generated
+assessments trigger real rule matches. Rule questions are padded with generic filler
+questions to reach the requested row count. Multi-select questions span several
+rows, categories follow a configurable mix, and a share of questions carries free-text
+comments. Output is deterministic for a given seed.
+
+    python benchmarks/synthetic.py assessments/ --clients 50 --rows 400
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from recommendation_agent import get_rule_set
+
+DEFAULT_CATEGORY_MIX = {
+    "Media Activation": 0.3,
+    "Data & Measurement": 0.3,
+    "Technology & Integration": 0.25,
+    "Business": 0.15
+}
+
+COLUMNS = ('Category', 'Question', 'Answer', 'Score', 'MaxWeight', 'Comment')
+
+# Answers the rules never test for, so not every question matches something
+EXTRA_ANSWERS = ["yes", "no", "partially", "other", "n/a"]
+
+_COMMENT_PHRASES = [
+    "We rolled this out for our largest markets last year.",
+    "Performance has been mixed and we are reviewing the setup with our agency.",
+    "The team lacks the bandwidth to maintain this consistently.",
+    "This is on the roadmap for the next two quarters.",
+    "Data sharing between teams is still largely manual.",
+    "Results were positive in the pilot, with a noticeable lift in conversions.",
+    "Legal review of the data flows is ongoing.",
+    "We rely on our media agency for most of the day-to-day management."
+]
+
+
+def answer_vocabulary(rules=None):
+    """
+    {question: [answers]} for every question the rule set tests, with the answers it
+    accepts plus EXTRA_ANSWERS.
+    """
+    vocabulary = {}
+    for item in rules if rules is not None else get_rule_set().rules:
+        for sub_item in item.get('questions', [item]):
+            answers = sub_item['answer'] if isinstance(sub_item['answer'], list) else [sub_item['answer']]
+            vocabulary.setdefault(sub_item['question'], set()).update(answers)
+    return {question: sorted(answers | set(EXTRA_ANSWERS)) for question, answers in vocabulary.items()}
+
+
+def _comment(rng):
+    return " ".join(rng.sample(_COMMENT_PHRASES, rng.randint(1, 3)))
+
+
+def _fill(columns, rng, vocabulary, rows, category_mix, max_selections, comment_rate, answer_rate):
+    categories, weights = zip(*(category_mix or DEFAULT_CATEGORY_MIX).items())
+    start = len(columns['Question'])
+
+    def add_question(question, answers):
+        category = rng.choices(categories, weights)[0]
+        comment = _comment(rng) if rng.random() < comment_rate else None
+        score = rng.choice([0, 1, 2, 3])
+        for answer in rng.sample(answers, min(len(answers), rng.randint(1, max_selections))):
+            columns['Category'].append(category)
+            columns['Question'].append(question)
+            columns['Answer'].append(answer)
+            columns['Score'].append(score)
+            columns['MaxWeight'].append(3)
+            columns['Comment'].append(comment)
+
+    for question, answers in vocabulary:
+        if rows is not None and len(columns['Question']) - start >= rows:
+            break
+        if rng.random() < answer_rate:
+            add_question(question, answers)
+
+    filler = 0
+    while rows is not None and len(columns['Question']) - start < rows:
+        filler += 1
+        add_question(f"additional assessment question {filler}?", EXTRA_ANSWERS)
+    return len(columns['Question']) - start
+
+
+def make_assessment(rows=None, seed=0, category_mix=None, max_selections=3, comment_rate=0.3,
+                    answer_rate=0.9, vocabulary=None):
+    """
+    One assessment DataFrame with Category, Question, Answer, Score, MaxWeight and Comment.
+
+    rows: approximate target row count. Rule questions come first (answer_rate of them
+    are answered), and filler questions are added until the target is reached. None
+    keeps only the rule questions.
+    max_selections: upper bound on answers per multi-select question (one row each).
+    comment_rate: share of questions whose rows carry a comment.
+    """
+    columns = {column: [] for column in COLUMNS}
+    _fill(columns, random.Random(seed), list((vocabulary or answer_vocabulary()).items()), rows,
+          category_mix, max_selections, comment_rate, answer_rate)
+    return pd.DataFrame(columns)
+
+
+def make_portfolio(n_clients, rows=None, seed=0, category_mix=None, max_selections=3, comment_rate=0.3,
+                   answer_rate=0.9):
+    """
+    n_clients assessments stacked into one DataFrame with a leading ClientId column.
+    """
+    rng = random.Random(seed)
+    vocabulary = list(answer_vocabulary().items())
+    columns = {'ClientId': [], **{column: [] for column in COLUMNS}}
+    for client in range(n_clients):
+        added = _fill(columns, rng, vocabulary, rows, category_mix, max_selections, comment_rate, answer_rate)
+        columns['ClientId'].extend([f"client-{client}"] * added)
+    return pd.DataFrame(columns)
+
+
+def write_assessment_csvs(directory, n_clients, rows=None, seed=0, **options):
+    """
+    Writes client-<n>.csv files (the layout batch_reports.py reads) and returns their paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    vocabulary = answer_vocabulary()
+    paths = []
+    for client in range(n_clients):
+        path = os.path.join(directory, f"client-{client}.csv")
+        make_assessment(rows, seed=seed * 1_000_003 + client, vocabulary=vocabulary, **options).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir", help="Folder to write the assessment CSVs to")
+    parser.add_argument("--clients", type=int, default=10, help="Number of assessments to generate")
+    parser.add_argument("--rows", type=int, default=None, help="Approximate rows per assessment")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-selections", type=int, default=3, help="Most answers per multi-select question")
+    parser.add_argument("--comment-rate", type=float, default=0.3, help="Share of questions with a comment")
+    args = parser.parse_args(argv)
+
+    paths = write_assessment_csvs(args.output_dir, args.clients, args.rows, args.seed,
+                                  max_selections=args.max_selections, comment_rate=args.comment_rate)
+    print(f"wrote {len(paths)} assessments to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Record/replay of chat completion requests ("cassettes") for offline runs.
+
+With GMP_LLM_TRANSPORT=record every live response is also written to
+GMP_LLM_CASSETTE_DIR, one JSON file per distinct request. With
+GMP_LLM_TRANSPORT=replay requests are answered from those files only, with no
+network, API key or rate limiting, and a request that was never recorded raises
+CassetteMissError. GMP_LLM_REPLAY_SPEED replays the recorded timing (1 = as
+recorded, 2 = twice as fast, 0 = instant, the default).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_CASSETTE_DIR = "cassettes"
+TRANSPORT_MODES = ("live", "record", "replay")
+
+
+class CassetteMissError(LookupError):
+    """
+    Raised in replay mode for a request with no recorded cassette.
+    """
+
+
+def request_key(request):
+    """
+    Content address of a full request, including stream options.
+    """
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _dump(obj):
+    return obj.model_dump(mode="json") if hasattr(obj, "model_dump") else obj
+
+
+class CassetteStore:
+    """
+    Directory of <request key>.json cassettes. Each holds the request, the response
+    (a completion, or the list of stream chunks) and the timing it was recorded with.
+    """
+
+    def __init__(self, directory=DEFAULT_CASSETTE_DIR, replay_speed=0.0):
+        self.directory = directory
+        self.replay_speed = replay_speed
+
+    def path_for(self, request):
+        return os.path.join(self.directory, f"{request_key(request)}.json")
+
+    def _write(self, request, cassette):
+        os.makedirs(self.directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.directory, delete=False, suffix=".tmp") as f:
+            json.dump({"request": request, **cassette}, f, indent=2, ensure_ascii=False)
+            temp_path = f.name
+        os.replace(temp_path, self.path_for(request))
+
+    def record(self, request, response, started):
+        """
+        Writes the cassette for a live response and returns a response the caller can
+        use in its place. Streams are passed through chunk by chunk and written only
+        once fully consumed.
+        """
+        if not request.get("stream"):
+            self._write(request, {
+                "stream": False,
+                "response": _dump(response),
+                "elapsed": round(time.perf_counter() - started, 4),
+                "recorded_at": time.time()
+            })
+            return response
+        return self._record_stream(request, response, started)
+
+    def _record_stream(self, request, stream, started):
+        chunks = []
+        offsets = []
+        for chunk in stream:
+            chunks.append(_dump(chunk))
+            offsets.append(round(time.perf_counter() - started, 4))
+            yield chunk
+        self._write(request, {"stream": True, "response": chunks, "offsets": offsets, "recorded_at": time.time()})
+
+    def replay(self, request):
+        """
+        The recorded response for request, rebuilt as the SDK's response objects.
+        """
+        from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+        path = self.path_for(request)
+        try:
+            with open(path, encoding="utf-8") as f:
+                cassette = json.load(f)
+        except FileNotFoundError:
+            raise CassetteMissError(
+                f"no cassette for this request in {self.directory} ({os.path.basename(path)}); "
+                "record it with GMP_LLM_TRANSPORT=record"
+            )
+        if not cassette["stream"]:
+            if self.replay_speed:
+                time.sleep(cassette.get("elapsed", 0.0) / self.replay_speed)
+            return ChatCompletion.model_validate(cassette["response"])
+        return self._replay_stream(
+            [ChatCompletionChunk.model_validate(chunk) for chunk in cassette["response"]],
+            cassette.get("offsets") or [0.0] * len(cassette["response"])
+        )
+
+    def _replay_stream(self, chunks, offsets):
+        started = time.perf_counter()
+        for chunk, offset in zip(chunks, offsets):
+            if self.replay_speed:
+                delay = offset / self.replay_speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk
+
+
+def get_transport_mode():
+    mode = os.environ.get("GMP_LLM_TRANSPORT", "live").strip().lower() or "live"
+    if mode not in TRANSPORT_MODES:
+        raise ValueError(f"GMP_LLM_TRANSPORT must be one of {', '.join(TRANSPORT_MODES)}, not {mode!r}")
+    return mode
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cassette_store():
+    """
+    Process-wide CassetteStore from GMP_LLM_CASSETTE_DIR and GMP_LLM_REPLAY_SPEED.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CassetteStore(
+                directory=os.environ.get("GMP_LLM_CASSETTE_DIR") or DEFAULT_CASSETTE_DIR,
+                replay_speed=float(os.environ.get("GMP_LLM_REPLAY_SPEED") or 0.0)
+            )
+        return _store
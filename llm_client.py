@@ -0,0 +1,175 @@
+import os
+import random
+import threading
+import time
+
+import openai
+
+from background_jobs import check_cancelled
+from llm_cassette import get_cassette_store, get_transport_mode
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+DEFAULT_MAX_RETRIES = 5
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to capacity units and refills at capacity per
+    period seconds. acquire() blocks until the requested units are available;
+    waiters are queued so earlier callers are served first.
+    """
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._queue = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount=1.0):
+        # A single request bigger than the bucket would wait forever; let it drain the bucket instead
+        amount = min(float(amount), self.capacity)
+        with self._queue:
+            while True:
+                with self._lock:
+                    self._refill()
+                    if self.available >= amount:
+                        self.available -= amount
+                        return
+                    wait = (amount - self.available) / self.rate
+                time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets shared by every LLM call in the process.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, estimated_tokens):
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+
+
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def call_with_retries(func, *args, max_retries=DEFAULT_MAX_RETRIES, base_delay=1.0, max_delay=30.0, **kwargs):
+    """
+    Calls func, retrying 429/5xx/connection errors with exponential backoff and full
+    jitter (or the server's Retry-After when given).
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except openai.OpenAIError as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = _retry_after_seconds(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            time.sleep(delay)
+
+
+def get_api_key():
+    """
+    OpenAI key from OPENAI_API_KEY / OPEN_AI_KEY, falling back to Streamlit secrets
+    so the same code runs headless and inside the app.
+    """
+    api_key = os.environ.get("OPENAI_API_KEY") or os.environ.get("OPEN_AI_KEY")
+    if api_key:
+        return api_key
+    try:
+        import streamlit as st
+        return st.secrets["OPEN_AI_KEY"]
+    except Exception:
+        raise RuntimeError("No OpenAI API key: set OPENAI_API_KEY or OPEN_AI_KEY in Streamlit secrets")
+
+
+_client = None
+_limiter = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """
+    Process-wide OpenAI client. The SDK keeps one keep-alive connection pool per
+    client, so sharing it lets every Streamlit session and worker thread reuse warm
+    connections instead of paying a new TLS handshake per call.
+    Retries are handled by call_with_retries, not the SDK.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = openai.OpenAI(
+                api_key=get_api_key(),
+                base_url=os.environ.get("OPENAI_BASE_URL") or None,
+                max_retries=0
+            )
+        return _client
+
+
+def get_rate_limiter():
+    global _limiter
+    with _client_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=float(os.environ.get("GMP_OPENAI_RPM", DEFAULT_REQUESTS_PER_MINUTE)),
+                tokens_per_minute=float(os.environ.get("GMP_OPENAI_TPM", DEFAULT_TOKENS_PER_MINUTE))
+            )
+        return _limiter
+
+
+def send_chat_request(estimated_tokens, **request):
+    """
+    Sends a chat.completions.create request through the shared client: each attempt
+    waits for rate-limit capacity for one request of estimated_tokens, and transient
+    failures are retried.
+    GMP_LLM_TRANSPORT=record also saves the response as a cassette, and replay
+    answers from cassettes without touching the network (see llm_cassette).
+    Inside a cancelled background job no further attempt is sent.
+    """
+    check_cancelled()
+    mode = get_transport_mode()
+    if mode == "replay":
+        return get_cassette_store().replay(request)
+
+    limiter = get_rate_limiter()
+    client = get_openai_client()
+
+    def attempt():
+        limiter.acquire(estimated_tokens)
+        check_cancelled()
+        return client.chat.completions.create(**request)
+
+    started = time.perf_counter()
+    response = call_with_retries(
+        attempt,
+        max_retries=int(os.environ.get("GMP_OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+    )
+    if mode == "record":
+        return get_cassette_store().record(request, response, started)
+    return response
@@ -0,0 +1,234 @@
+"""
+Local OpenAI-compatible stub for offline runs and load tests.
+
+Serves POST /v1/chat/completions (plain and streamed) with deterministic
+responses: the same request always gets the same answer. Structured requests get
+JSON matching their json_schema response_format, and the markdown gap/driver
+prompts get the numbered Heading/Context/Impact list they ask for. Latency
+follows a profile (time to first token plus a token rate) and a share of requests
+can be answered with 429s to exercise the retry path.
+
+    python llm_stub_server.py --port 8765 --profile typical
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub streamlit run streamlit_app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# name -> (seconds to first token, completion tokens per second; 0 = unpaced)
+LATENCY_PROFILES = {
+    "instant": (0.0, 0),
+    "fast": (0.15, 250),
+    "typical": (0.6, 80),
+    "slow": (1.5, 30)
+}
+
+DEFAULT_COMPLETION_TOKENS = 300
+
+_WORDS = (
+    "the advertiser uses display video 360 search ads 360 and campaign manager 360 with "
+    "first-party data audiences measurement attribution bidding automation floodlight "
+    "analytics integration governance creative reporting optimisation maturity roadmap "
+    "activation consent modelling incrementality partners workflow insights"
+).split()
+
+
+def _rng(request):
+    seed = hashlib.sha256(json.dumps(request.get("messages"), sort_keys=True).encode("utf-8")).hexdigest()
+    return random.Random(seed)
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _from_schema(schema, rng):
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _from_schema(prop, rng) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_from_schema(schema.get("items", {}), rng) for _ in range(5)]
+    if kind in ("number", "integer"):
+        return rng.randint(0, 100)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return _sentence(rng, rng.randint(4, 14))
+
+
+def _markdown_items(rng, count=5):
+    return "\n".join(
+        f"{i}. **Heading**: {_sentence(rng, 4)}\n   **Context**: {_sentence(rng, 14)}\n   **Impact**: {_sentence(rng, 14)}"
+        for i in range(1, count + 1)
+    )
+
+
+def generate_content(request, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+    """
+    Deterministic response text for a chat completion request.
+    """
+    rng = _rng(request)
+    response_format = request.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return json.dumps(_from_schema(response_format["json_schema"]["schema"], rng))
+    prompt = request["messages"][-1]["content"] if request.get("messages") else ""
+    if "**Heading**" in prompt:
+        return _markdown_items(rng)
+    words = min(int(request.get("max_tokens") or completion_tokens), completion_tokens)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentences.append(_sentence(rng, length))
+        words -= length
+    return " ".join(sentences)
+
+
+def estimate_tokens(text):
+    return max(1, (len(text) + 3) // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        if server.error_rate and server.random.random() < server.error_rate:
+            self._send_json(429, {"error": {"message": "stub rate limit", "type": "rate_limit_error"}},
+                            {"Retry-After": "0.2"})
+            return
+
+        content = generate_content(request, server.completion_tokens)
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(m.get("content") or "") for m in request.get("messages", [])),
+            "completion_tokens": estimate_tokens(content)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                "model": request.get("model", "stub")}
+
+        time.sleep(server.ttft)
+        if request.get("stream"):
+            self._stream(base, content, usage, (request.get("stream_options") or {}).get("include_usage"))
+            return
+        if server.tokens_per_second:
+            time.sleep(usage["completion_tokens"] / server.tokens_per_second)
+        self._send_json(200, {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    def _stream(self, base, content, usage, include_usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(chunk):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return {**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        send(chunk({"role": "assistant", "content": ""}))
+        pieces = content.split(" ")
+        for i, piece in enumerate(pieces):
+            send(chunk({"content": piece if i == 0 else " " + piece}))
+            if self.server.tokens_per_second:
+                time.sleep(estimate_tokens(piece + " ") / self.server.tokens_per_second)
+        send(chunk({}, "stop"))
+        if include_usage:
+            send({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    The stub as an embeddable server: start() serves on a daemon thread, url is the
+    base URL to give the OpenAI client.
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, profile="typical", ttft=None, tokens_per_second=None,
+                 completion_tokens=DEFAULT_COMPLETION_TOKENS, error_rate=0.0, seed=0, verbose=False):
+        super().__init__((host, port), StubHandler)
+        profile_ttft, profile_rate = LATENCY_PROFILES[profile]
+        self.ttft = profile_ttft if ttft is None else ttft
+        self.tokens_per_second = profile_rate if tokens_per_second is None else tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.verbose = verbose
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="gmp-llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="typical")
+    parser.add_argument("--ttft", type=float, default=None, help="Seconds to first token (overrides the profile)")
+    parser.add_argument("--tokens-per-second", type=float, default=None,
+                        help="Completion token rate, 0 for unpaced (overrides the profile)")
+    parser.add_argument("--completion-tokens", type=int, default=DEFAULT_COMPLETION_TOKENS,
+                        help="Length of free-text responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    server = StubServer(args.host, args.port, args.profile, args.ttft, args.tokens_per_second,
+                        args.completion_tokens, args.error_rate, verbose=args.verbose)
+    print(f"OpenAI-compatible stub listening on {server.url} (profile {args.profile}, "
+          f"ttft {server.ttft}s, {server.tokens_per_second or 'unpaced'} tokens/s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import contextvars
+import json
+import os
+import threading
+import uuid
+from collections import namedtuple
+
+# USD per 1M (prompt, completion) tokens
+MODEL_PRICING = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40)
+}
+
+DEFAULT_USAGE_LOG_PATH = os.path.join(".cache", "llm_usage.jsonl")
+
+UsageRecord = namedtuple("UsageRecord", [
+    "run_id", "label", "model", "started_at", "wall_seconds",
+    "prompt_tokens", "completion_tokens", "cost", "cached"
+])
+
+
+class BudgetExceededError(RuntimeError):
+    """
+    Raised before an LLM call that would take a run over its token or cost budget.
+    """
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def _env_float(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+class UsageLedger:
+    """
+    Per-run record of every LLM call: wall time, tokens from response.usage and
+    estimated cost. Each record is also appended to a JSON lines log.
+
+    token_budget / cost_budget cap the run. Before each call the worst case
+    (prompt plus max_tokens of completion) is reserved; a call that would not fit
+    is switched to downgrade_model when that fits, otherwise refused with
+    BudgetExceededError.
+    """
+
+    def __init__(self, token_budget=None, cost_budget=None, downgrade_model=None,
+                 log_path=DEFAULT_USAGE_LOG_PATH, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.downgrade_model = downgrade_model
+        self.log_path = log_path
+        self.records = []
+        self._reserved_tokens = 0
+        self._reserved_cost = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """
+        Ledger with budgets from GMP_RUN_TOKEN_BUDGET, GMP_RUN_COST_BUDGET and
+        GMP_DOWNGRADE_MODEL, logging to GMP_USAGE_LOG_PATH.
+        """
+        token_budget = _env_float("GMP_RUN_TOKEN_BUDGET")
+        options = {
+            "token_budget": int(token_budget) if token_budget is not None else None,
+            "cost_budget": _env_float("GMP_RUN_COST_BUDGET"),
+            "downgrade_model": os.environ.get("GMP_DOWNGRADE_MODEL") or None,
+            "log_path": os.environ.get("GMP_USAGE_LOG_PATH", DEFAULT_USAGE_LOG_PATH)
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    def _fits(self, tokens, cost):
+        if self.token_budget is not None and self.total_tokens + self._reserved_tokens + tokens > self.token_budget:
+            return False
+        if self.cost_budget is not None and self.total_cost + self._reserved_cost + cost > self.cost_budget:
+            return False
+        return True
+
+    def authorize(self, model, prompt_tokens, max_tokens):
+        """
+        Reserves the worst-case usage of a call and returns (model to use, reservation).
+        The reservation must be passed back to record() or release().
+        """
+        tokens = prompt_tokens + max_tokens
+        with self._lock:
+            for candidate in (model, self.downgrade_model):
+                if candidate is None:
+                    continue
+                cost = estimate_cost(candidate, prompt_tokens, max_tokens)
+                if self._fits(tokens, cost):
+                    self._reserved_tokens += tokens
+                    self._reserved_cost += cost
+                    return candidate, (tokens, cost)
+        raise BudgetExceededError(
+            f"LLM call of up to {tokens} tokens would exceed the run budget "
+            f"(tokens used {self.total_tokens}/{self.token_budget}, cost used ${self.total_cost:.4f}/{self.cost_budget})"
+        )
+
+    def release(self, reservation):
+        with self._lock:
+            self._reserved_tokens -= reservation[0]
+            self._reserved_cost -= reservation[1]
+
+    def record(self, label, model, started_at, wall_seconds, prompt_tokens=0, completion_tokens=0,
+               cached=False, reservation=None):
+        record = UsageRecord(
+            self.run_id, label, model, started_at, round(wall_seconds, 4),
+            prompt_tokens, completion_tokens,
+            0.0 if cached else estimate_cost(model, prompt_tokens, completion_tokens),
+            cached
+        )
+        with self._lock:
+            if reservation is not None:
+                self._reserved_tokens -= reservation[0]
+                self._reserved_cost -= reservation[1]
+            self.records.append(record)
+            if self.log_path:
+                directory = os.path.dirname(self.log_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as log_file:
+                    log_file.write(json.dumps(record._asdict()) + "\n")
+        return record
+
+    @property
+    def total_tokens(self):
+        return sum(r.prompt_tokens + r.completion_tokens for r in self.records)
+
+    @property
+    def total_cost(self):
+        return sum(r.cost for r in self.records)
+
+    def summary(self):
+        return {
+            "run_id": self.run_id,
+            "calls": len(self.records),
+            "cached_calls": sum(1 for r in self.records if r.cached),
+            "prompt_tokens": sum(r.prompt_tokens for r in self.records),
+            "completion_tokens": sum(r.completion_tokens for r in self.records),
+            "wall_seconds": round(sum(r.wall_seconds for r in self.records), 3),
+            "cost": round(self.total_cost, 6),
+            "token_budget": self.token_budget,
+            "cost_budget": self.cost_budget
+        }
+
+
+_current_ledger = contextvars.ContextVar("gmp_usage_ledger", default=None)
+
+
+def get_current_ledger():
+    """
+    The ledger LLM calls in this context are metered against, or None.
+    """
+    return _current_ledger.get()
+
+
+def set_current_ledger(ledger):
+    """
+    Makes ledger the active one for this thread/context. Worker threads need the
+    context copied (contextvars.copy_context) to see it.
+    """
+    return _current_ledger.set(ledger)
+
+
+def start_run(**options):
+    """
+    Creates a ledger (budgets from the environment unless overridden) and makes it current.
+    """
+    ledger = UsageLedger.from_env(**options)
+    set_current_ledger(ledger)
+    return ledger
@@ -0,0 +1,193 @@
+"""
+Map-reduce analysis for assessments too large for a single prompt.
+
+Map: every category block from prompt_payload.build_category_blocks (each at most
+GMP_CATEGORY_TOKEN_BUDGET tokens) is condensed into short structured notes, all
+blocks in parallel. Reduce: the notes, rendered per category, replace the raw
+responses in the summary, bullet, gap and driver prompts. If the notes themselves
+exceed GMP_REDUCE_TOKEN_BUDGET, groups of them are merged first, so every prompt
+stays bounded however large the assessment is.
+
+A map request depends only on its own block, so when one category changes the
+other categories' notes come straight from the LLM response cache.
+"""
+import contextvars
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_payload import ASSESSMENT_SYSTEM_PROMPT, build_category_blocks, count_tokens
+from recommendation_agent import create_chat_completion
+
+DEFAULT_REDUCE_TOKEN_BUDGET = int(os.environ.get("GMP_REDUCE_TOKEN_BUDGET", 6000))
+NOTES_MAX_TOKENS = 600
+
+CATEGORY_NOTES_TASK = """Condense the responses above into notes for a later analysis of the advertiser's Google Marketing Platform usage and Adtech/Martech maturity.
+- overview: 60 words or less on their current setup and usage in this area
+- strengths: up to 5 short points on what they do well
+- gaps: up to 5 short points on what is missing, manual or immature
+Keep concrete product names, answers and facts from the comments."""
+
+MERGE_NOTES_TASK = """Merge the category notes above into one set of notes that keeps the most important points from every category.
+- overview: 80 words or less
+- strengths: up to 6 short points
+- gaps: up to 6 short points"""
+
+CATEGORY_NOTES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "category_notes",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "overview": {"type": "string"},
+                "strengths": {"type": "array", "items": {"type": "string"}},
+                "gaps": {"type": "array", "items": {"type": "string"}}
+            },
+            "required": ["overview", "strengths", "gaps"],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+def _notes_messages(section_text, task, heading="Assessment responses"):
+    return [
+        {"role": "system", "content": ASSESSMENT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{heading}:\n{section_text}\n\n{task}"}
+    ]
+
+
+def _request_notes(category, messages, use_cache, label):
+    response_text = create_chat_completion(
+        messages,
+        max_tokens=NOTES_MAX_TOKENS,
+        use_cache=use_cache,
+        response_format=CATEGORY_NOTES_RESPONSE_FORMAT,
+        label=label
+    )
+    try:
+        notes = json.loads(response_text)
+    except json.JSONDecodeError:
+        # Keep whatever came back rather than losing the category
+        notes = {"overview": response_text, "strengths": [], "gaps": []}
+    return {
+        "category": category,
+        "overview": str(notes.get("overview") or "").strip(),
+        "strengths": [str(point).strip() for point in notes.get("strengths") or [] if str(point).strip()],
+        "gaps": [str(point).strip() for point in notes.get("gaps") or [] if str(point).strip()]
+    }
+
+
+def summarize_block(block, use_cache=True):
+    """
+    Map step: notes {category, overview, strengths, gaps} for one CategoryBlock.
+    """
+    category = block.category if block.part == 1 else f"{block.category} (part {block.part})"
+    return _request_notes(category, _notes_messages(block.text, CATEGORY_NOTES_TASK), use_cache,
+                          f"map:{category}")
+
+
+def render_notes(notes):
+    lines = []
+    for note in notes:
+        lines.append(f"## {note['category']}")
+        lines.append(f"Overview: {note['overview']}")
+        if note["strengths"]:
+            lines.append("Strengths:")
+            lines.extend(f"- {point}" for point in note["strengths"])
+        if note["gaps"]:
+            lines.append("Gaps:")
+            lines.extend(f"- {point}" for point in note["gaps"])
+    return "\n".join(lines)
+
+
+def _run_parallel(func, items, max_concurrency):
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items))),
+                            thread_name_prefix="gmp-map-reduce") as executor:
+        # Copied contexts keep the calls metered against the current run ledger
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def reduce_notes(notes, token_budget=DEFAULT_REDUCE_TOKEN_BUDGET, use_cache=True, max_concurrency=4):
+    """
+    Merges consecutive groups of notes until their rendering fits token_budget.
+    """
+    while len(notes) > 1 and count_tokens(render_notes(notes)) > token_budget:
+        groups, current, current_tokens = [], [], 0
+        for note in notes:
+            note_tokens = count_tokens(render_notes([note]))
+            if current and current_tokens + note_tokens > token_budget:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(note)
+            current_tokens += note_tokens
+        groups.append(current)
+        if len(groups) == len(notes):
+            break
+
+        def merge(group):
+            if len(group) == 1:
+                return group[0]
+            category = ", ".join(note["category"] for note in group)
+            return _request_notes(category, _notes_messages(render_notes(group), MERGE_NOTES_TASK, "Category notes"),
+                                  use_cache, "merge")
+
+        notes = _run_parallel(merge, groups, max_concurrency)
+    return notes
+
+
+class MapReducePayload:
+    """
+    Drop-in for PromptPayload in the analysis functions. messages() builds the
+    reduce prompt from the category notes; the map calls run once, on first use, and
+    are shared by every analysis stage (concurrent stages wait for the same map
+    phase). text() is the raw category input, which is what stale_analysis_sections
+    compares.
+    """
+    __slots__ = ("blocks", "use_cache", "max_concurrency", "reduce_token_budget", "_notes", "_reduced", "_lock")
+
+    def __init__(self, blocks, use_cache=True, max_concurrency=4, reduce_token_budget=DEFAULT_REDUCE_TOKEN_BUDGET):
+        self.blocks = blocks
+        self.use_cache = use_cache
+        self.max_concurrency = max_concurrency
+        self.reduce_token_budget = reduce_token_budget
+        self._notes = None
+        self._reduced = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dataframe(cls, df, **options):
+        return cls(build_category_blocks(df), **options)
+
+    def text(self, include_business=True):
+        return "\n".join(block.text for block in self.blocks if include_business or block.category != "Business")
+
+    def notes(self):
+        with self._lock:
+            if self._notes is None:
+                self._notes = _run_parallel(lambda block: summarize_block(block, self.use_cache),
+                                            self.blocks, self.max_concurrency)
+            return self._notes
+
+    def reduced_notes(self, include_business=True):
+        notes = self.notes()
+        with self._lock:
+            if include_business not in self._reduced:
+                selected = [
+                    note for note, block in zip(notes, self.blocks)
+                    if include_business or block.category != "Business"
+                ]
+                self._reduced[include_business] = reduce_notes(selected, self.reduce_token_budget, self.use_cache,
+                                                               self.max_concurrency)
+            return self._reduced[include_business]
+
+    def messages(self, task, include_business=True):
+        return _notes_messages(
+            render_notes(self.reduced_notes(include_business)),
+            task,
+            "Assessment notes, one section per category"
+        )
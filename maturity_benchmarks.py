@@ -0,0 +1,103 @@
+"""
+Portfolio benchmarks for category maturity.
+
+A PercentileTable holds, per Category (plus "Overall"), the sorted maturity levels
+of every client in the portfolio. It is built once from the portfolio (for
+example the maturity.csv files batch_reports.py writes) and saved as .npz. Ranking
+a client is then a binary search per category, O(log n) however large the client
+base grows.
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from recommendation_agent import OVERALL_CATEGORY
+
+DEFAULT_PERCENTILE_TABLE_PATH = os.path.join(".cache", "maturity_percentiles.npz")
+
+
+class PercentileTable:
+    """
+    category -> sorted float64 array of client maturity levels.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = values
+
+    @classmethod
+    def from_portfolio(cls, levels):
+        """
+        Builds the table from a long DataFrame with Category and maturity_level columns,
+        one row per client and category, such as maturity_table(df, ["ClientId"]).
+        """
+        values = {}
+        for category, group in levels.groupby('Category', sort=False):
+            column = group['maturity_level'].to_numpy(dtype=float)
+            values[category] = np.sort(column[~np.isnan(column)])
+        return cls(values)
+
+    def size(self, category):
+        column = self.values.get(category)
+        return 0 if column is None else len(column)
+
+    def percentile(self, category, maturity_level):
+        """
+        Share of the portfolio (0-100) scoring below maturity_level in category, ties
+        counted as half. None when the category has no portfolio data.
+        """
+        column = self.values.get(category)
+        if column is None or len(column) == 0 or maturity_level is None or np.isnan(maturity_level):
+            return None
+        below = np.searchsorted(column, maturity_level, side="left")
+        at_or_below = np.searchsorted(column, maturity_level, side="right")
+        return round(100.0 * (below + at_or_below) / (2 * len(column)), 1)
+
+    def rank(self, scores):
+        """
+        The categories of a MaturityScores (plus its overall row) with percentile and
+        portfolio_size columns added.
+        """
+        overall = pd.DataFrame([{"Category": OVERALL_CATEGORY, **scores.overall}])
+        ranked = pd.concat([scores.categories, overall], ignore_index=True)
+        ranked['percentile'] = [
+            self.percentile(category, level)
+            for category, level in zip(ranked['Category'], ranked['maturity_level'])
+        ]
+        ranked['portfolio_size'] = [self.size(category) for category in ranked['Category']]
+        return ranked
+
+    def save(self, path=DEFAULT_PERCENTILE_TABLE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        categories = list(self.values)
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, categories=np.array(categories, dtype=str),
+                 **{f"values_{i}": self.values[category] for i, category in enumerate(categories)})
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PERCENTILE_TABLE_PATH):
+        with np.load(path) as data:
+            return cls({
+                str(category): data[f"values_{i}"]
+                for i, category in enumerate(data['categories'])
+            })
+
+
+def load_portfolio_levels(reports_dir):
+    """
+    Concatenates the maturity.csv of every client folder under reports_dir, with the
+    folder name as ClientId.
+    """
+    frames = []
+    for path in sorted(glob.glob(os.path.join(reports_dir, "*", "maturity.csv"))):
+        frame = pd.read_csv(path)
+        frame.insert(0, 'ClientId', os.path.basename(os.path.dirname(path)))
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=['ClientId', 'Category', 'maturity_level'])
+    return pd.concat(frames, ignore_index=True)
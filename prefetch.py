@@ -0,0 +1,93 @@
+"""
+Speculative prefetch of the app's next analysis step.
+
+The walkthrough is linear, so once a step is on screen the app starts the next
+LLM step (bullet summary after the category summary, gaps and drivers after the
+bullet summary) as a background job (see background_jobs). When the user clicks
+the next step the prefetched job is adopted and the step appears at once, or
+continues streaming if it is still running. Drivers come from the same request as
+the gaps, so step 4 needs no prefetch.
+
+Speculation is capped per session by a PrefetchBudget: the worst-case cost of a
+prefetch is reserved before it starts and counts as wasted if it is discarded
+(Start Over, edited answers, a loaded analysis), and no prefetch starts that
+could take reserved plus wasted cost past GMP_PREFETCH_COST_BUDGET (USD, 0
+disables prefetching). Prefetches also only start while the shared executor has
+an idle worker, so they never delay anyone's requested step.
+"""
+import os
+from collections import namedtuple
+
+from background_jobs import collect_stream
+from llm_usage import estimate_cost
+from recommendation_agent import (
+    LLM_MODEL,
+    identify_gaps_and_drivers,
+    stream_bullet_summary
+)
+
+DEFAULT_PREFETCH_COST_BUDGET = 0.05
+
+# name and label match the job the step's button would start; include_business and
+# max_tokens describe its request for the cost estimate
+PrefetchStep = namedtuple("PrefetchStep", ["name", "label", "include_business", "max_tokens", "run"])
+
+# A prefetch in flight: the job, what it was started for and the cost reserved for it
+Prefetch = namedtuple("Prefetch", ["job", "name", "payload", "cost"])
+
+
+def _bullet_summary(df, payload):
+    return collect_stream(stream_bullet_summary(df, payload=payload))
+
+
+def _gaps_and_drivers(df, payload):
+    return identify_gaps_and_drivers(df, payload=payload)
+
+
+# step on screen -> the step most likely requested next
+NEXT_STEPS = {
+    1: PrefetchStep("bullet_summary", "Bullet summary", False, 1000, _bullet_summary),
+    2: PrefetchStep("gaps_and_drivers", "Maturity gaps", True, 1500, _gaps_and_drivers)
+}
+
+
+def estimate_step_cost(payload, step, model=LLM_MODEL):
+    """
+    Upper bound on the cost of step's request: the full payload text as prompt (more
+    than a map-reduce payload's notes) and max_tokens of completion.
+    """
+    from prompt_payload import count_tokens
+    prompt_tokens = count_tokens(payload.text(include_business=step.include_business))
+    return estimate_cost(model, prompt_tokens, step.max_tokens)
+
+
+class PrefetchBudget:
+    """
+    Per-session account of speculative spend, in USD: reserved for prefetches not yet
+    used, and wasted on discarded ones.
+    """
+    __slots__ = ("limit", "reserved", "wasted")
+
+    def __init__(self, limit=None):
+        if limit is None:
+            limit = float(os.environ.get("GMP_PREFETCH_COST_BUDGET", DEFAULT_PREFETCH_COST_BUDGET))
+        self.limit = limit
+        self.reserved = 0.0
+        self.wasted = 0.0
+
+    def reserve(self, cost):
+        """
+        Reserves cost for a prefetch; False when it does not fit the budget.
+        """
+        if self.limit <= 0 or self.reserved + self.wasted + cost > self.limit:
+            return False
+        self.reserved += cost
+        return True
+
+    def release(self, cost, wasted=False):
+        """
+        Releases a prefetch's reservation; wasted adds its cost to the wasted total.
+        """
+        self.reserved = max(0.0, self.reserved - cost)
+        if wasted:
+            self.wasted += cost
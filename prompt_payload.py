@@ -0,0 +1,262 @@
+import os
+from collections import namedtuple
+
+import pandas as pd
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to a character estimate
+    _ENCODING = None
+
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.environ.get("GMP_PROMPT_TOKEN_BUDGET", 12000))
+DEFAULT_CATEGORY_TOKEN_BUDGET = int(os.environ.get("GMP_CATEGORY_TOKEN_BUDGET", 3000))
+
+# Comment length caps tried in turn before whole questions are dropped
+COMMENT_CAPS = (None, 400, 200, 100, 40, 0)
+
+# Shared by every analysis call so the system prompt and assessment block form a
+# stable prefix that provider-side prompt caching can reuse between calls.
+ASSESSMENT_SYSTEM_PROMPT = (
+    "You are a strategic Adtech/Martech advisor at a marketing agency focused on Google Marketing Platform, "
+    "assessing an advertiser's maturity based on their audit responses."
+)
+
+
+def count_tokens(text):
+    """
+    Token count for the gpt-4.1 family, or a ~4 characters per token estimate
+    when tiktoken is not installed.
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _clean(value):
+    if pd.isna(value):
+        return ""
+    return str(value).strip()
+
+
+def _group_rows(df):
+    """
+    Collapses multi-select rows into one entry per (Category, Question), grouped by
+    category in order of first appearance, de-duplicating answers and comments.
+    """
+    entries = {}
+    has_comments = "Comment" in df.columns
+    for row in df.itertuples(index=False):
+        category = _clean(getattr(row, "Category"))
+        question = _clean(getattr(row, "Question"))
+        entry = entries.setdefault((category, question), ([], []))
+        answer = _clean(getattr(row, "Answer"))
+        if answer and answer not in entry[0]:
+            entry[0].append(answer)
+        comment = _clean(getattr(row, "Comment")) if has_comments else ""
+        if comment and comment not in entry[1]:
+            entry[1].append(comment)
+    category_order = {}
+    for category, _ in entries:
+        category_order.setdefault(category, len(category_order))
+    grouped = sorted(entries.items(), key=lambda item: category_order[item[0][0]])
+    return [(category, question, answers, comments) for (category, question), (answers, comments) in grouped]
+
+
+def _render(entries, comment_cap):
+    lines = []
+    current_category = None
+    for category, question, answers, comments in entries:
+        if category != current_category:
+            lines.append(f"## {category or 'Uncategorized'}")
+            current_category = category
+        lines.append(f"- Q: {question}")
+        lines.append(f"  A: {'; '.join(answers) if answers else 'No answer'}")
+        if comments and comment_cap != 0:
+            comment = " | ".join(comments)
+            if comment_cap is not None and len(comment) > comment_cap:
+                comment = comment[:comment_cap].rstrip() + "…"
+            lines.append(f"  Comment: {comment}")
+    return "\n".join(lines)
+
+
+def _legacy_block(df):
+    """
+    The Questions/Answers/Comments repr lists the prompts used before the payload builder.
+    """
+    questions = df["Question"].tolist()
+    answers = df["Answer"].tolist()
+    comments = df["Comment"].fillna("").tolist() if "Comment" in df.columns else []
+    return f"Questions: {questions}\nAnswers: {answers}\nComments: {comments}"
+
+
+class PromptPayload:
+    """
+    One compact serialization of an assessment shared by all LLM calls.
+    Non-Business categories come first, so the Business-free text used by the summary
+    prompts is a prefix of the full text used by the gap/driver prompts.
+    """
+    __slots__ = ("core_text", "business_text", "omitted_questions", "comment_cap",
+                 "legacy_core_tokens", "legacy_full_tokens")
+
+    def __init__(self, core_text, business_text, omitted_questions, comment_cap,
+                 legacy_core_tokens, legacy_full_tokens):
+        self.core_text = core_text
+        self.business_text = business_text
+        self.omitted_questions = omitted_questions
+        self.comment_cap = comment_cap
+        self.legacy_core_tokens = legacy_core_tokens
+        self.legacy_full_tokens = legacy_full_tokens
+
+    def text(self, include_business=True):
+        if include_business and self.business_text:
+            return f"{self.core_text}\n{self.business_text}" if self.core_text else self.business_text
+        return self.core_text
+
+    def messages(self, task, include_business=True):
+        """
+        Chat messages for one analysis: stable system prompt, then the assessment
+        block, then the task-specific instructions last.
+        """
+        return [
+            {"role": "system", "content": ASSESSMENT_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Assessment responses:\n{self.text(include_business)}\n\n{task}"}
+        ]
+
+    def token_report(self):
+        """
+        Input tokens of the assessment data for the four analysis calls (two without and
+        two with the Business category) compared with the old repr-list format.
+        """
+        core_tokens = count_tokens(self.text(include_business=False))
+        full_tokens = count_tokens(self.text(include_business=True))
+        legacy_tokens = 2 * self.legacy_core_tokens + 2 * self.legacy_full_tokens
+        payload_tokens = 2 * core_tokens + 2 * full_tokens
+        return {
+            "legacy_tokens": legacy_tokens,
+            "payload_tokens": payload_tokens,
+            "saved_tokens": legacy_tokens - payload_tokens,
+            "saved_pct": round(100.0 * (legacy_tokens - payload_tokens) / legacy_tokens, 1) if legacy_tokens else 0.0,
+            "omitted_questions": self.omitted_questions,
+            "comment_cap": self.comment_cap
+        }
+
+
+def build_prompt_payload(df, token_budget=DEFAULT_PROMPT_TOKEN_BUDGET):
+    """
+    Serializes an assessment DataFrame once into a PromptPayload of at most
+    token_budget tokens. Over budget, comments are shortened step by step and then
+    trailing questions (Business first) are dropped, so the same input always
+    produces the same text.
+    """
+    entries = _group_rows(df)
+    core_entries = [entry for entry in entries if entry[0] != "Business"]
+    business_entries = [entry for entry in entries if entry[0] == "Business"]
+    ordered = core_entries + business_entries
+
+    def render(kept, comment_cap):
+        core = _render([e for e in kept if e[0] != "Business"], comment_cap)
+        business = _render([e for e in kept if e[0] == "Business"], comment_cap)
+        omitted = len(ordered) - len(kept)
+        if omitted:
+            note = f"[{omitted} further questions omitted to fit the token budget]"
+            if business:
+                business = f"{business}\n{note}"
+            else:
+                core = f"{core}\n{note}" if core else note
+        return core, business
+
+    def fits(core, business):
+        return count_tokens(f"{core}\n{business}") <= token_budget
+
+    kept = len(ordered)
+    for comment_cap in COMMENT_CAPS:
+        core, business = render(ordered, comment_cap)
+        if token_budget is None or fits(core, business):
+            break
+    else:
+        # Keep the longest prefix of questions that fits
+        low, high = 0, len(ordered)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(*render(ordered[:middle], comment_cap)):
+                low = middle
+            else:
+                high = middle - 1
+        kept = low
+        core, business = render(ordered[:kept], comment_cap)
+
+    subset = df[df["Category"] != "Business"]
+    return PromptPayload(
+        core,
+        business,
+        len(ordered) - kept,
+        comment_cap,
+        count_tokens(_legacy_block(subset)),
+        count_tokens(_legacy_block(df))
+    )
+
+
+# One bounded slice of an assessment for map-reduce analysis: a category, or a part
+# of a category too large for one prompt
+CategoryBlock = namedtuple("CategoryBlock", ["category", "part", "text"])
+
+
+def build_category_blocks(df, token_budget=DEFAULT_CATEGORY_TOKEN_BUDGET):
+    """
+    Serializes an assessment per Category, in order of first appearance, into blocks
+    of at most token_budget tokens each. A category over budget first has its comments
+    shortened (never below COMMENT_CAPS[-2]) and is then split into consecutive parts,
+    so no question is dropped. A block only depends on its own category's rows.
+    """
+    by_category = {}
+    for entry in _group_rows(df):
+        by_category.setdefault(entry[0], []).append(entry)
+
+    blocks = []
+    for category, entries in by_category.items():
+        label = category or "Uncategorized"
+        for comment_cap in COMMENT_CAPS[:-1]:
+            text = _render(entries, comment_cap)
+            if count_tokens(text) <= token_budget:
+                blocks.append(CategoryBlock(label, 1, text))
+                break
+        else:
+            # Per-question counts include the category heading each time, so parts stay under budget
+            part, current, current_tokens = 1, [], 0
+            for entry in entries:
+                entry_tokens = count_tokens(_render([entry], comment_cap))
+                if current and current_tokens + entry_tokens > token_budget:
+                    blocks.append(CategoryBlock(label, part, _render(current, comment_cap)))
+                    part, current, current_tokens = part + 1, [], 0
+                current.append(entry)
+                current_tokens += entry_tokens
+            blocks.append(CategoryBlock(label, part, _render(current, comment_cap)))
+    return blocks
+
+
+def render_response_changes(old_df, new_df, include_business=True):
+    """
+    The questions whose answers or comments differ between two assessments, each with
+    its earlier and current answers, in the payload's Q/A format; "" when none differ.
+    Business questions are left out unless include_business, as in PromptPayload.text.
+    """
+    # (category, question) -> (answers, comments)
+    earlier = {entry[:2]: entry[2:] for entry in _group_rows(old_df)}
+    current = {entry[:2]: entry[2:] for entry in _group_rows(new_df)}
+    lines = []
+    for key in list(current) + [key for key in earlier if key not in current]:
+        category, question = key
+        if (category == "Business" and not include_business) or earlier.get(key) == current.get(key):
+            continue
+        earlier_answers, _ = earlier.get(key, ([], []))
+        answers, comments = current.get(key, ([], []))
+        lines.append(f"- Q: {question}")
+        lines.append(f"  Earlier answer: {'; '.join(earlier_answers) if earlier_answers else 'No answer'}")
+        if key in current:
+            lines.append(f"  Answer now: {'; '.join(answers) if answers else 'No answer'}")
+            if comments:
+                lines.append(f"  Comment now: {' | '.join(comments)}")
+        else:
+            lines.append("  Answer now: question not in this assessment")
+    return "\n".join(lines)
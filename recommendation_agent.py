@@ -1,329 +1,21 @@
 import pandas as pd
+import numpy as np
 import json
-import math # For math.isnan to check for NaN values
-import openai
-import streamlit as st
-import ast
+import os
 import re
-from fpdf import FPDF
-
-# Define the Recommendation Set as provided in your agent's internal knowledge base
-RECOMMENDATION_SET = [
-    {
-        "question": "which automated bidding strategies have you used in dv360? please give further context of the performance in the comments section.",
-        "answer": "n/a",
-        "recommendation": "Utilize automated bidding strategies in DV360 to improve campaign agility.",
-        "overview": "Automated bidding in DV360 leverages machine learning to optimize bids in real-time based on various signals like audience, device and contextual data, aligned with business goals like CPA or ROAS.",
-        "gmpimpact": "Implementing automated bidding strategies increases the bidding precision with DV360 and reduces optimization overheads, while aligning campaign delivery with performance goals.",
-        "businessimpact": "Automated bidding strategies provide an additional avenue for advertisers to drive better outcomes across programmatic investments with less manual intervention and improved campaign agility."
-        
-    },
-    {
-        "question": "have you developed or used any of the following custom bidding algorithms in dv360? please give further context of the objectives and performance in the comments section.",
-        "answer": "n/a",
-        "recommendation": "Utilize custom bidding strategies in DV360 to improve campaign agility",
-        "overview": "Custom Bidding in DV360 allows advertisers to build their own bidding algorithms tailored to very specific high-value performance objectives, assigning custom signals such as Floodlight variables or Google Analytics goals to hit campaign targets.",
-        "gmpimpact": "Custom Bidding leverages Google's bidding infrastructure while using advertiser-defined logic, enhancing optimization precision, integrating unique data and logic and directly aligning campaign delivery with unique business objectives.",
-        "businessimpact": "This drives superior media performance and improves alignment between media investment and business priorities, whilst fostering campaign agility for maximized marketing effectiveness."
-    },
-    {
-        "question": "which automated bidding strategies have you used in sa360?",
-        "answer": "n/a",
-        "recommendation": "Utilize automated bidding strategies in SA360 to improve campaign agility",
-        "overview": "Search Ads 360 offers automated bidding solutions that use historical performance and real-time auction signals to optimize bids across search engines to meet specific business objectives.",
-        "gmpimpact": "Implementing automated bidding strategies increases the bidding precision with SA360 and reduces optimization overheads, while aligning campaign delivery with performance goals.",
-        "businessimpact": "Automated bidding strategies provide an additional avenue for advertisers to drive better outcomes across search investments with less manual intervention and improved campaign agility."
+import time
+import contextvars
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from rule_set import RuleStore, RuleSetWatcher, DEFAULT_POLL_SECONDS
+
+# The matching engine below needs only pandas/NumPy. The LLM modules (openai, the
+# response cache, tokenizer and usage ledger) and report_pdf (fpdf) are imported
+# inside the functions that use them, so batch workers and scripts that only match
+# recommendations do not pay their import time or memory.
 
-    },
-    {
-        "question": "have you used any of the cm360's apis? if so, please provide additional detail in the comments box.",
-        "answer": "n/a",
-        "recommendation": "Utilize CM360 APIs for increased productivity",
-        "overview": "Campaign Manager 360 (CM360) APIs allow for automated campaign trafficking, reporting and creative management, increasing operational efficiency, data access and insight generation.",
-        "gmpimpact": "Increase the productivity and agility of CM360, enhancing the flow of data between wider GMP products and external platforms, whilst minimizing the requirement for manual intervention.",
-        "businessimpact": "Faster execution and deeper insights leading to quicker optimizations, reduced setup time and higher productivity, allowing existing resource to focus on driving innovation."      
-    },
-    {
-        "question": "have you used sa360's api for campaign management and reporting automation? if so, please provide additional detail in the comments box.",
-        "answer": ["no - we are currently not using sa360 apis","n/a"],
-        "recommendation": "Utilize SA360 APIs for increased productivity",
-        "overview": "SA360 APIs provide automated control over search campaigns, allowing bulk edits, custom reporting and integration with internal tools for optimization and analysis.",
-        "gmpimpact": "Increase the productivity of SA360, streamlining campaign management and enhancing the flow of data between wider GMP products and external platforms. ",
-        "businessimpact": "Enhanced automation improves agility and control over search campaigns translate into faster optimizations, increased performance and reduced operational costs."
-    },
-    {
-        "question": "have you used dv360's api for campaign management and reporting automation? if so, please provide additional detail in the comments box.",
-        "answer": "n/a",
-        "recommendation": "Utilize DV360 APIs for increased productivity",
-        "overview": "DV360 APIs provide advertisers automated control to manage and optimize campaigns, targeting, creatives and reporting.",
-        "gmpimpact": "Increase the productivity of DV360, scaling optimizations, creating dynamic campaign adjustments and more agile media buying.",
-        "businessimpact": "Enhanced automation improves the speed of campaign execution and accuracy, resulting in greater operational scale and stronger campaign performance."
-    },
-    {
-        "question": "how are you activating first party data within dv360?",
-        "answer": "n/a",
-        "recommendation": "Utilize 1PD in DV360 for stronger data-driven optimization",
-        "overview": "DV360 allows advertisers to onboard and activate 1st-party data such as CRM lists and site activity to inform and enhance audience targeting, bidding and measurement. Further solutions such as Google's Customer Match can also be utilized ",
-        "gmpimpact": "Bringing 1st-party data in to DV360 unlocks additional platform features and capabilities (such as Customer Match) increasing the utilization of DV360. ",
-        "businessimpact": "Linking 1PD sources to media activation results in higher-quality targeting and greater business outcomes from programmatic investments, with advertisers experiencing on average 2x revenue uplift. "   
-    },
-    {
-        "question": "how are you activating first party data within sa360?",
-        "answer": "n/a",
-        "recommendation": "Utilize 1PD in SA360 for stronger data-driven optimization",
-        "overview": "SA360 supports the integration of 1st-party data to inform bid strategies, audience targeting, and performance measurement across search campaigns.",
-        "gmpimpact": "Bringing 1st-party data in to SA360 unlocks additional platform features and capabilities, increasing the utilization of SA360.",
-        "businessimpact": "Stronger data-driven optimization results in more efficient budget use, higher-quality traffic, and greater business outcomes from paid search investments."        
-    },
-    {
-        "question": "how are you activating first party data within cm360?",
-        "answer": "n/a",
-        "recommendation": "Utilize 1PD in CM360 for enhanced insight of customer interactions and segmentation",
-        "overview": "CM360 supports the use of 1st-party data through floodlight activities and audience lists for more accurate measurement, tracking and attribution. This results in enriched reporting and campaign performance analysis.",
-        "gmpimpact": "Integrating 1st-party data into CM360 unlocks additional platform capabilities and enhances cross-channel measurement, custom audience segments and provides more meaningful attribution and post-campaign analysis.",
-        "businessimpact": "Improved marketing effectiveness through clearer performance insights, better-informed media decisions and a more holistic understanding of customer interactions across media touchpoints."
-    },
-    {
-        "question": "is your instance of google tag manager server-side or client-side?",
-        "answer": "gtm (client-side)",
-        "recommendation": "Consider implementing server-side Google Tag Manager (sGTM) for increased data accuracy and control.",
-        "overview": "Server-side tagging involves routing tag calls through a server rather than directly from a user's browser, improving load speed, data security, and privacy compliance.",
-        "gmpimpact": "A forward thinking & futureproofed utilization of GMP, as server-side tagging ensures more complete, accurate and consistent data signals with more advertiser control over data sharing.",
-        "businessimpact": "Improved data quality with more control, resulting in a more futureproofed tag management set-up in a changing regulatory landscape."
-    },
-    {
-        "question": "which of the following google products are linked to your google analytics instance (ga4/ga360)?",
-        "answer": "n/a",
-        "recommendation": "Leverage Google Cloud and existing GMP investments for advanced audience modelling, insights and streamlined activation",
-        "overview": "Leverage Google Cloud and the existing Google Marketing Platform investments to create a single solution for data storage, modelling & analysis, resulting in a more cost-efficient advanced audience strategy.",
-        "gmpimpact": "Enhance the connectivity between existing Google platforms in place and enable more effective cross-channel targeting, insights & measurement.",
-        "businessimpact": "Optimize the overarching platforms architecture, utilizing existing Google platforms for advanced audience strategy, increasing ROI of MarTech investment."        
-    },
-    {
-        "question": "are your platforms set-up to test privacy sandbox apis (such as protected audience api, topics api, attribution reporting api etc)",
-        "answer": [
-            "yes but we have not begun testing any google privacy sandbox apis",
-            "no we have not tested any google privacy sandbox apis, but we would like to understand what is applicable to our business."
-        ],
-        "recommendation": "Explore Privacy Sandbox API testing, further adapting a changing regulatory landscape",
-        "overview": "Privacy Sandbox is Google's initiative to develop privacy-preserving alternatives for 3rd party cookies and cross-site tracking. APIs like Topics, Attribution Reporting, Private Aggregation and Protected Audience are designed to enable advertising functionalities while minimizing user data exposure.",
-        "gmpimpact": "Exploring and testing Privacy Sandbox APIs is a key step in Google advertisers preparing for continued user privacy changes while maintaining critical functions such as frequency capping, remarketing, and attribution.",
-        "businessimpact": "Proactively exploring and adopting privacy-safe tools aids with media activation & strategy continuity, compliance, and sustained campaign performance in a changing regulatory landscape."        
-    },
-    {
-        "set_id": "bigquery",
-        "questions": [
-            {
-                "question": "is bigquery in use for warehousing ga4/ga360 data?",
-                "answer": "no"
-            },
-            {
-                "question": "which google products are currently being utilized?",
-                "answer": [
-                    "google analytics 4 (ga4)",
-                    "google analytics 360 (ga360)"
-                ]
-            },
-        ],
-        "recommendation": "Consider utilizing BigQuery for warehousing of data",
-        "overview": "BigQuery is Google Cloud's data warehouse. Utilizing BigQuery enables advertisers to store, unify and analyze 1st-party, GMP and external data in one environment. Data stored in BigQuery can be stored in perpetuity while GA4 stores data for a maximum of 14 months.",
-        "gmpimpact": "BigQuery integrates natively with GMP tools, including GA4, DV360, SA360, and CM360, unlocking use cases like improved data storage, predictive modeling, audience segmentation and deeper attribution analysis.",
-        "businessimpact": "Utilization of BigQuery can enhance data-driven decision-making and supports long-term business intelligence strategies that enhance customer value and marketing performance."
-    },
-    {
-        "set_id": "adh",
-        "questions": [
-            {
-                "question": "which google products are currently being utilized?",
-                "answer": "ads data hub (adh)"
-            },
-            {
-                "question": "to what extent is ads data hub (adh) currently being used by your team(s) for measurement and analysis?",
-                "answer": [
-                    "we haven't used adh yet but are interested",
-                    "we've used it a few times for exploratory or one-off analysis",
-                    "we actively use adh for campaign measurement or insights"
-                ]
-            },
-            {
-                "question": "in addition to what is currently being utilized what custom adh analysis would you like to undertake ? select all that apply",
-                "answer": [
-                    "reach & frequency",
-                    "audience overlap",
-                    "conversion lift",
-                    "path to conversion",
-                    "other"
-                ]
-            }
-        ],
-        "recommendation": "Consider deployment of enhanced hands-on optimization strategy within Ads Data Hub (ADH)",
-        "overview": "Deploy hands-on optimization strategy within ADH, enhancing the efficiency and output quality of use cases when utilizing Google's wall-garden clean room.",
-        "gmpimpact": "Increase the value derived from ADH and related GMP ecosystem, through enhanced utilization of its functionalities and measurement mechanisms.",
-        "businessimpact": "More efficient and reliable reporting & measurement outcomes, improving the proven marketing ROI."        
-    },
-    {
-        "set_id": "ga4imp",
-        "questions": [
-            {
-                "question": "which google products are currently being utilized?",
-                "answer": [
-                    "google analytics 4 (ga4)",
-                    "google analytics 360 (ga360)"
-                ]
-            },
-            {
-                "question": "do you have ga4/ga360 maintenance in place: tagging, refreshing internal filters, updating channel groupings, reevaluating audiences and segments, etc?",
-                "answer": [
-                    "platform maintenance processes are implemented but not regularly followed",
-                    "no platform maintenance takes place"
-                ]
-            },
-            {
-                "question": "which of the following best describes the way you use data in ga4/ga360?",
-                "answer": ["we collect pageviews and sporadic event data. we regularly leverage the built-in ga4 reports to gain insights about our customers, improve website/app user experience and campaign performance.",
-                    "we collect only high-level website data and periodically review the basic metics (i.e. page views, unique visitors, bounce rate, top viewed pages) to monitor performance.",
-                    "we have it set up but it is currently not being utilized."
-                ]
-            }
-        ],
-        "recommendation": "Consider GA4 audit of platform implementation & maintenance to increase on-site insights and a more advanced audience strategy",
-        "overview": "GA4 provides cross-platform analytics with advanced event tracking, predictive metrics, advanced audience tools and seamless integration with the wider GMP suite. An audit of GA4 implementation and maintenance ensures correct setup and ongoing data quality.",
-        "gmpimpact": "Auditing and properly maintaining GA4 ensures accurate, holistic data collection that enhances customer insights and audience strategy, whilst also improving the utilization of wider GMP products such as media activation and website and app performance analysis.",
-        "businessimpact": "Reliable GA4 implementation and maintenance supports enhanced insights, a more effective audience strategy and increased return on investment in wider GMP products."
-    },
-    {
-        "set_id": "enhancedconv",
-        "questions": [
-            {
-                "question": "what industry is the brand considered to be in?",
-                "answer": [
-                    "chemical",
-                    "education",
-                    "government",
-                    "healthcare",
-                    "legal",
-                    "military",
-                    "pharmaceuticals",
-                    "toys",
-                    "other",
-                    "n/a"
-                ],
-                "type": "negative_choice"
-            },
-            {
-                "question": "have you implemented conversion api's (capi)? if so please specify across which partners capis have been implemented.",
-                "answer": [
-                    "google enhanced conversions",
-                    "google enhanced conversions for leads"
-                 ],
-                "type": "negative_choice"
-            },
-            {
-                "question": "what google owned & operated inventory is currently being bought in media campaigns?",
-                "answer": [
-                    "google search",
-                    "youtube"
-                ]
-            },
-            {
-                "question": "do any of your media campaign conversion points involve the customer sharing pii?",
-                "answer": [
-                    "yes - at point of conversion we collect advance crm: name, address, email, tel, post code, customerid, maid and more",
-                    "yes - at point of conversion we collect basic crm: email and/or maid only"
-                ]
-            },
-            {
-                "question": "what are your media campaign goals?",
-                "answer": [
-                    "acquisition",
-                    "direct response",
-                    "lead generation",
-                    "retention",
-                    "sales"
-                ]
-            }
-        ],
-        "recommendation": "Implement Google's Enhanced Conversions for more complete conversion data capture",
-        "overview": "Enhanced Conversions is a solution that improves the accuracy of conversion measurement by securely using hashed first-party data to match conversions to ad interactions. This helps recover conversions that may not be tracked due to browser limitations or user privacy settings.",
-        "gmpimpact": "Implementing Enhanced Conversions will allow the advertiser to capture more complete conversion data, improving the reliability of attribution and automated bidding capabilities in Google Ads and SA360.",
-        "businessimpact": "Implementation of Enhanced Conversions will lead to smarter bidding decisions, improved ROI and stronger confidence in marketing spend."
-     },
-    {
-        "set_id": "GCPCDP",
-        "questions": [
-            {
-                "question": "which of the following best describes the types of platforms your organize uses to manage first-party data? select all that apply",
-                "answer": [
-                    "customer data platform (cdp)"
-                ],
-                "type": "negative_choice"
-            },
-            {
-                "question": "which google products are currently being utilized?",
-                "answer": [
-                    "google ads",
-                    "display & video 360 (dv360)",
-                    "search ads 360 (sa360)"
-                ]
-            },
-            {
-                "question": "which google products are currently being utilized?",
-                "answer": [
-                    "google analytics 4 (ga4)",
-                    "google analytics 360 (ga360)"
-                ]
-            },
-            {
-                "question": "which google products are currently being utilized?",
-                "answer": [
-                    "bigquery"
-                ]
-            },
-            {
-                "question": "is bigquery in use for warehousing ga4/ga360 data?",
-                "answer": [
-                    "yes"
-                ]
-            },
-            {
-                "question": "approximately what % of the next 12 months media budget is to be allocated to gmp platforms? give answer in percentages 0-100%",
-                "answer": [
-                    "50-75%",
-                    "75-100%"
-                ]
-            }
-        ],
-        "recommendation": "Leverage Google Cloud and existing GMP investments for advanced audience modelling, insights and streamlined activation",
-        "overview": "Leverage Google Cloud and the existing Google Marketing Platform investments to create a single solution for data storage, modelling & analysis, resulting in a more cost-efficient advanced audience strategy.",
-        "gmpimpact": "Enhance the connectivity between existing Google platforms in place and enable more effective cross-channel targeting, insights & measurement. ",
-        "businessimpact": "Optimize the overarching platforms architecture, utilizing existing Google platforms for advanced audience strategy, increasing ROI of MarTech investment."
-    },
-    {
-        "set_id": "GCPClean",
-        "questions": [
-            {
-                "question": "which of the following data usage activities does your organization currently engage or see value in? select all that apply",
-                "answer": [
-                    "not currently collaborating or sharing data",
-                    "n/a"
-                ],
-                "type": "negative_choice"
-            },
-            {
-                "question": "how important is data privacy and control when sharing data with external platforms, vendors and partners?",
-                "answer": [
-                    "very important, data must stay governed and secure at all times",
-                    "mostly important, we prefer privacy controls but allow some flexibility",
-                    "somewhat important, depends on the partner or use case",
-                ]
-            }
-        ],
-        "recommendation": "Consider utilization of GCP data cleanroom for secure data processing and collaboration",
-        "overview": "A data cleanroom on GCP allows secure data collaboration between the advertiser and partners (e.g., Google, retailers, publishers) without exposing user-level information.",
-        "gmpimpact": "The GCP cleanroom can enable use cases including audience syndication and audience enrichment, as well as analytics use cases such as incrementality and partner overlap without violating data privacy.",
-        "businessimpact": "This delivers stronger insights into media effectiveness, partner value and multi-touch attribution, enabling more strategic media planning and increased privacy controls over data sharing."
-    }
-]
 
 def normalize_answer_for_comparison(answer_value):
     """
@@ -340,245 +32,649 @@ def normalize_answer_for_comparison(answer_value):
 
     return normalized_val
 
-def run_recommendation_analysis(df):
+class RuleCondition:
     """
-    Executes the AI Agent's logic to process DataFrame data, match recommendations,
-    and calculate total scores and max weights.
-    Returns a dictionary containing matched recommendations and summary totals.
+    One question/answer test of a recommendation rule, with the rule's answers
+    normalized once into a frozenset so matching is a set lookup per answer.
     """
-    csv_data_map = {}
-    for index, row in df.iterrows():
-        question_key = str(row['Question']).lower().strip()
-        answer_value = normalize_answer_for_comparison(row['Answer'])
+    __slots__ = ("question", "answers", "negative")
 
-        score = row['Score'] if pd.notna(row['Score']) else 0.0
-        max_weight = row['MaxWeight'] if pd.notna(row['MaxWeight']) else 0.0
+    def __init__(self, question, answers, negative=False):
+        self.question = question
+        self.answers = answers
+        self.negative = negative
 
-        score = max(0.0, float(score))
-        max_weight = max(0.0, float(max_weight))
+    def is_met(self, user_answers):
+        if self.negative:
+            # For negative_choice, the condition is met if NONE of the user's answers are in the specified list
+            return self.answers.isdisjoint(user_answers)
+        # For positive choice (default), the condition is met if ANY of the user's answers are in the specified list
+        return not self.answers.isdisjoint(user_answers)
 
-        # Handle multiple answers from CSV for the same question by storing them as a list
-        if question_key not in csv_data_map:
-            csv_data_map[question_key] = {
-                'answers': [answer_value],
-                'score': score,
-                'maxweight': max_weight
-            }
-        else:
-            csv_data_map[question_key]['answers'].append(answer_value)
 
+class CompiledRule:
+    """
+    A rule set entry (single question or set_id group) reduced to its
+    conditions, the distinct questions it needs and its output fields.
+    """
+    __slots__ = ("index", "set_id", "conditions", "check_order", "required_questions",
+                 "recommendation", "overview", "gmp_impact", "business_impact")
+
+    def __init__(self, index, item):
+        self.index = index
+        self.set_id = item.get('set_id')
+        sub_items = item['questions'] if self.set_id is not None else [item]
+        conditions = []
+        for sub_item in sub_items:
+            raw_answers = sub_item['answer'] if isinstance(sub_item['answer'], list) else [sub_item['answer']]
+            conditions.append(RuleCondition(
+                sub_item['question'].lower().strip(),
+                frozenset(normalize_answer_for_comparison(val) for val in raw_answers),
+                sub_item.get('type') == "negative_choice"
+            ))
+        self.conditions = tuple(conditions)
+        # Evaluate the most selective conditions first so failing groups bail out early:
+        # positive conditions with few accepted answers are the cheapest to fail.
+        self.check_order = tuple(sorted(conditions, key=lambda c: (c.negative, len(c.answers))))
+        self.required_questions = frozenset(c.question for c in conditions)
+        self.recommendation = item['recommendation']
+        self.overview = item.get('overview', 'N/A')
+        self.gmp_impact = item.get('gmpimpact', 'N/A')
+        self.business_impact = item.get('businessimpact', 'N/A')
+
+    def evaluate(self, answer_map):
+        """
+        Returns the matched recommendation dict for this rule, or None.
+        answer_map is the output of build_answer_map.
+        """
+        # Cheapest test first: a question with no CSV answers fails the whole rule
+        for question in self.required_questions:
+            if question not in answer_map:
+                return None
+
+        for condition in self.check_order:
+            if not condition.is_met(answer_map[condition.question].answers):
+                return None
+
+        # Sum in declaration order so totals are identical to the uncompiled evaluation
+        score = 0.0
+        max_weight = 0.0
+        for condition in self.conditions:
+            entry = answer_map[condition.question]
+            score += entry.score
+            max_weight += entry.maxweight
+
+        return {
+            'recommendation': self.recommendation,
+            'overview': self.overview,
+            'gmp_impact': self.gmp_impact,
+            'business_impact': self.business_impact,
+            'score': score,
+            'maxweight': max_weight
+        }
+
+
+class RulePlan:
+    """
+    The compiled form of a recommendation set: rules in their original order plus an
+    inverted index from normalized question to the (rule index, condition index)
+    pairs that reference it.
+    """
+    __slots__ = ("rules", "question_index")
+
+    def __init__(self, rules, question_index):
+        self.rules = rules
+        self.question_index = question_index
+
+    def candidate_rules(self, questions):
+        """
+        Returns, in rule order, only the rules that reference at least one of the given
+        questions; every other rule needs a question the assessment does not have.
+        """
+        rule_indexes = set()
+        for question in questions:
+            for rule_index, _ in self.question_index.get(question, ()):
+                rule_indexes.add(rule_index)
+        return [self.rules[i] for i in sorted(rule_indexes)]
+
+    def match(self, answer_map):
+        matched = []
+        for rule in self.candidate_rules(answer_map):
+            result = rule.evaluate(answer_map)
+            if result is not None:
+                matched.append(result)
+        return matched
+
+
+def compile_rule_plan(recommendation_set):
+    """
+    Compiles a recommendation set into a RulePlan. Done once at import time so each
+    analysis only pays for the rules its questions can trigger.
+    """
+    rules = tuple(CompiledRule(index, item) for index, item in enumerate(recommendation_set))
 
-    matched_recommendations_with_scores = []
-    total_matched_recommendations = 0
-    total_score = 0.0
-    total_max_score = 0.0
+    question_index = {}
+    for rule in rules:
+        for condition_index, condition in enumerate(rule.conditions):
+            question_index.setdefault(condition.question, []).append((rule.index, condition_index))
 
-    for item in RECOMMENDATION_SET:
-        if "set_id" not in item:
-            # A. Single Question Recommendation
-            rec_question = item['question'].lower().strip()
-            rec_answer_raw = item['answer']
-            rec_recommendation = item['recommendation']
-            rec_overview = item.get('overview', 'N/A')
-            rec_gmp_impact = item.get('gmpimpact', 'N/A')
-            rec_business_impact = item.get('businessimpact', 'N/A')
-            rec_type = item.get('type')
-
-            csv_entry = csv_data_map.get(rec_question)
-            user_answers_from_csv = csv_entry['answers'] if csv_entry else [] # Get list of answers
-
-            current_condition_met = False
-            question_score_to_add = 0.0
-            question_max_weight_to_add = 0.0
-
-            if user_answers_from_csv: # Check if there are answers from CSV
-                normalized_rec_answers = []
-                if isinstance(rec_answer_raw, list):
-                    normalized_rec_answers = [normalize_answer_for_comparison(val) for val in rec_answer_raw]
-                else:
-                    normalized_rec_answers = [normalize_answer_for_comparison(rec_answer_raw)]
+    return RulePlan(rules, {question: tuple(refs) for question, refs in question_index.items()})
+
+
+# Bump when CompiledRule/RulePlan change shape so cached compiled plans are rebuilt
+RULE_PLAN_FORMAT = 1
+
+RULE_SET_PATH = os.environ.get("GMP_RULES_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rules", "recommendation_set.json"
+)
+
+RULE_STORE = RuleStore(RULE_SET_PATH, compile_rule_plan, RULE_PLAN_FORMAT,
+                       cache_path=os.environ.get("GMP_RULES_CACHE_PATH"))
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_rule_set():
+    """
+    The active RuleSetSnapshot (version, source hash, raw rules and compiled plan).
+    """
+    return RULE_STORE.snapshot
 
-                if rec_type == "negative_choice":
-                    # For negative_choice, the condition is met if NONE of the user's answers are in the specified list
-                    current_condition_met = all(user_ans not in normalized_rec_answers for user_ans in user_answers_from_csv)
-                else:
-                    # For positive choice (default), the condition is met if ANY of the user's answers are in the specified list
-                    current_condition_met = any(user_ans in normalized_rec_answers for user_ans in user_answers_from_csv)
-
-
-                if current_condition_met and csv_entry: # Also check if csv_entry exists before accessing score/maxweight
-                    # If the condition is met, use the score and maxweight from the CSV row corresponding to this question.
-                    question_score_to_add = csv_entry.get('score', 0.0)
-                    question_max_weight_to_add = csv_entry.get('maxweight', 0.0)
-
-
-            if current_condition_met:
-                matched_recommendations_with_scores.append({
-                    'recommendation': rec_recommendation,
-                    'overview': rec_overview,
-                    'gmp_impact': rec_gmp_impact,
-                    'business_impact': rec_business_impact,
-                    'score': question_score_to_add,
-                    'maxweight': question_max_weight_to_add
-                })
-                total_matched_recommendations += 1
-                total_score += question_score_to_add
-                total_max_score += question_max_weight_to_add
-
-        else:
-            # B. Grouped Questions Recommendation
-            all_sub_questions_match = True
-            group_questions = item['questions']
-            group_recommendation = item['recommendation']
-            rec_overview = item.get('overview', 'N/A')
-            rec_gmp_impact = item.get('gmpimpact', 'N/A')
-            rec_business_impact = item.get('businessimpact', 'N/A')
-
-            current_group_contributing_scores = 0.0
-            current_group_contributing_max_weights = 0.0
-
-            for sub_q_item in group_questions:
-                sub_q_question = sub_q_item['question'].lower().strip()
-                sub_q_answer_raw = sub_q_item['answer']
-                sub_q_type = sub_q_item.get('type')
-
-                csv_sub_q_entry = csv_data_map.get(sub_q_question)
-                user_answers_from_csv_sub_q = csv_sub_q_entry['answers'] if csv_sub_q_entry else [] # Get list of answers
-
-                current_sub_q_condition_met = False
-
-                if user_answers_from_csv_sub_q: # Check if there are answers from CSV for sub-question
-                    normalized_sub_q_answers = []
-                    if isinstance(sub_q_answer_raw, list):
-                        normalized_sub_q_answers = [normalize_answer_for_comparison(val) for val in sub_q_answer_raw]
-                    else:
-                        normalized_sub_q_answers = [normalize_answer_for_comparison(sub_q_answer_raw)]
-
-                    if sub_q_type == "negative_choice":
-                         # For negative_choice, the condition is met if NONE of the user's answers are in the specified list
-                        current_sub_q_condition_met = all(user_ans not in normalized_sub_q_answers for user_ans in user_answers_from_csv_sub_q)
-                    else:
-                        # For positive choice (default), the condition is met if ANY of the user's answers are in the specified list
-                        current_sub_q_condition_met = any(user_ans in normalized_sub_q_answers for user_ans in user_answers_from_csv_sub_q)
-
-                # If any sub-question condition is NOT met, the entire group condition fails
-                if not current_sub_q_condition_met:
-                    all_sub_questions_match = False
-                    break # Exit the inner loop as the group condition has failed
-                else:
-                    # If the sub-question condition IS met, add its score and maxweight
-                    if csv_sub_q_entry:
-                        current_group_contributing_scores += csv_sub_q_entry.get('score', 0.0)
-                        current_group_contributing_max_weights += csv_sub_q_entry.get('maxweight', 0.0)
-
-
-            # After checking all sub-questions, if all matched, add the group recommendation
-            if all_sub_questions_match:
-                matched_recommendations_with_scores.append({
-                    'recommendation': group_recommendation,
-                    'overview': rec_overview,
-                    'gmp_impact': rec_gmp_impact,
-                    'business_impact': rec_business_impact,
-                    'score': current_group_contributing_scores,
-                    'maxweight': current_group_contributing_max_weights
-                })
-                total_matched_recommendations += 1
-                total_score += current_group_contributing_scores
-                total_max_score += current_group_contributing_max_weights
+
+def get_rule_plan():
+    return RULE_STORE.snapshot.plan
+
+
+def __getattr__(name):
+    """
+    RECOMMENDATION_SET, the rule list this module used to define inline, is now read
+    from the rule file: it returns a copy of the active rules on every access.
+    """
+    if name == "RECOMMENDATION_SET":
+        return list(get_rule_set().rules)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def start_rule_watcher(interval=None):
+    """
+    Starts (once per process) the thread that hot-reloads the rule file when it
+    changes. The poll interval comes from GMP_RULES_POLL_SECONDS; 0 disables it.
+    Returns the watcher, or None when disabled.
+    """
+    global _watcher
+    if interval is None:
+        interval = float(os.environ.get("GMP_RULES_POLL_SECONDS", DEFAULT_POLL_SECONDS))
+    if interval <= 0:
+        return None
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = RuleSetWatcher(RULE_STORE, interval)
+            _watcher.start()
+        return _watcher
+
+
+# Normalized answers for one question plus the score/maxweight of its first CSV row
+AnswerEntry = namedtuple("AnswerEntry", ["answers", "score", "maxweight"])
+
+EMPTY_ANSWER_MAP = MappingProxyType({})
+
+
+def normalize_question_column(questions):
+    """
+    Vectorized equivalent of str(question).lower().strip() for a Question column.
+    """
+    keys = questions.astype(str).str.lower().str.strip()
+    return keys.where(questions.notna(), "nan")
+
+
+def normalize_answer_column(answers):
+    """
+    Vectorized equivalent of normalize_answer_for_comparison for an Answer column.
+    """
+    normalized = answers.astype(str).str.lower().str.strip()
+    blank = answers.isna() | (normalized == "n/a")
+    return normalized.where(~blank, "")
+
+
+def build_answer_map(df):
+    """
+    Builds the read-only answer map the rule plan matches against:
+    normalized question -> AnswerEntry(frozenset of normalized answers, score, maxweight).
+    Score and MaxWeight are clipped at 0 and, for multi-select questions spread over
+    several rows, taken from the question's first row.
+    """
+    if df.empty:
+        return EMPTY_ANSWER_MAP
+
+    question_keys = normalize_question_column(df['Question']).to_numpy(dtype=object)
+    answer_values = normalize_answer_column(df['Answer']).to_numpy(dtype=object)
+    scores = np.clip(pd.Series(df['Score']).astype(float).fillna(0.0).to_numpy(), 0.0, None)
+    max_weights = np.clip(pd.Series(df['MaxWeight']).astype(float).fillna(0.0).to_numpy(), 0.0, None)
+
+    # codes follow first appearance, so first_rows[i] is the first CSV row of question i
+    codes, uniques = pd.factorize(question_keys)
+    _, first_rows = np.unique(codes, return_index=True)
+
+    # Group the answers per question with one stable sort instead of a per-row append
+    order = np.argsort(codes, kind="stable")
+    boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+    grouped_answers = np.split(answer_values[order], boundaries)
+
+    return MappingProxyType({
+        question: AnswerEntry(frozenset(answers), float(scores[row]), float(max_weights[row]))
+        for question, answers, row in zip(uniques, grouped_answers, first_rows)
+    })
+
+
+def match_recommendations(answer_map, plan=None):
+    """
+    Matches an answer map against the compiled rule plan and totals the scores.
+    Returns the same dictionary as run_recommendation_analysis.
+    """
+    plan = plan or get_rule_plan()
+    matched_recommendations_with_scores = plan.match(answer_map)
+
+    total_score = 0.0
+    total_max_score = 0.0
+    for match in matched_recommendations_with_scores:
+        total_score += match['score']
+        total_max_score += match['maxweight']
 
     return {
         'matched_recommendations': matched_recommendations_with_scores,
-        'total_matched_recommendations': total_matched_recommendations,
+        'total_matched_recommendations': len(matched_recommendations_with_scores),
         'total_score': total_score,
         'total_max_score': total_max_score
     }
 
+
+def diff_answer_maps(old_map, new_map):
+    """
+    Returns {question: new AnswerEntry, or None if the question was removed} for every
+    question whose answers, score or maxweight differ between two answer maps.
+    """
+    changes = {}
+    for question, entry in new_map.items():
+        if old_map.get(question) != entry:
+            changes[question] = entry
+    for question in old_map:
+        if question not in new_map:
+            changes[question] = None
+    return changes
+
+
+class IncrementalRecommendationAnalysis:
+    """
+    Keeps the matched recommendations of one assessment up to date as answers change.
+    An edit only re-evaluates the rules the rule plan's question index links to the
+    edited questions, and the score totals are adjusted by the difference.
+    """
+
+    def __init__(self, answer_map, plan=None):
+        self.plan = plan or get_rule_plan()
+        self.answer_map = dict(answer_map)
+        self.matches = {}
+        self.total_score = 0.0
+        self.total_max_score = 0.0
+        for rule in self.plan.candidate_rules(self.answer_map):
+            result = rule.evaluate(self.answer_map)
+            if result is not None:
+                self._add(rule.index, result)
+
+    @classmethod
+    def from_dataframe(cls, df, plan=None):
+        return cls(build_answer_map(df), plan)
+
+    def _add(self, rule_index, result):
+        self.matches[rule_index] = result
+        self.total_score += result['score']
+        self.total_max_score += result['maxweight']
+
+    def _remove(self, rule_index):
+        result = self.matches.pop(rule_index, None)
+        if result is not None:
+            self.total_score -= result['score']
+            self.total_max_score -= result['maxweight']
+
+    def apply_changes(self, changes):
+        """
+        Applies the output of diff_answer_maps and returns the indexes of the rules
+        that were re-evaluated.
+        """
+        affected = set()
+        for question, entry in changes.items():
+            if entry is None:
+                self.answer_map.pop(question, None)
+            else:
+                self.answer_map[question] = entry
+            affected.update(rule_index for rule_index, _ in self.plan.question_index.get(question, ()))
+
+        for rule_index in sorted(affected):
+            self._remove(rule_index)
+            result = self.plan.rules[rule_index].evaluate(self.answer_map)
+            if result is not None:
+                self._add(rule_index, result)
+        return affected
+
+    def update_from_dataframe(self, df):
+        """
+        Re-syncs with an edited assessment DataFrame; returns the re-evaluated rule indexes.
+        """
+        return self.apply_changes(diff_answer_maps(self.answer_map, build_answer_map(df)))
+
+    def results(self):
+        """
+        Current results in the run_recommendation_analysis format.
+        """
+        matched = [self.matches[rule_index] for rule_index in sorted(self.matches)]
+        return {
+            'matched_recommendations': matched,
+            'total_matched_recommendations': len(matched),
+            'total_score': self.total_score,
+            'total_max_score': self.total_max_score
+        }
+
+
+def recommendations_to_dataframe(results):
+    """
+    Matched recommendations as the table shown to users, with display column names.
+    """
+    recommendations_df = pd.DataFrame(results['matched_recommendations'])
+    recommendations_df.rename(columns={
+        'recommendation': 'Recommendation',
+        'overview': 'Overview',
+        'gmp_impact': 'GMP Utilization Impact',
+        'business_impact': 'Business Impact'
+    }, inplace=True)
+    expected_cols = [
+        'Recommendation',
+        'Overview',
+        'GMP Utilization Impact',
+        'Business Impact',
+        'score',
+        'maxweight'
+    ]
+    display_cols = [col for col in expected_cols if col in recommendations_df.columns]
+    return recommendations_df[display_cols]
+
+
+def run_recommendation_analysis(df):
+    """
+    Executes the AI Agent's logic to process DataFrame data, match recommendations,
+    and calculate total scores and max weights.
+    Returns a dictionary containing matched recommendations and summary totals.
+    """
+    return match_recommendations(build_answer_map(df))
+
 # (Keep your RECOMMENDATION_SET and normalize_answer_for_comparison function here)
 
 # Place run_recommendation_analysis() function here
 
 # === Step 1: Calculate Maturity Levels ===
-#def calculate_maturity_levels(df):
-#    category_maturity = df.groupby("Category").agg(
-#        total_score=pd.NamedAgg(column="Score", aggfunc="sum"),
-#        total_max_weight=pd.NamedAgg(column="MaxWeight", aggfunc="sum")
-   # )
-#    category_maturity["maturity_level"] = (category_maturity["total_score"] / category_maturity["total_max_weight"] * 100).round(2)
-#    return category_maturity.reset_index()
+OVERALL_CATEGORY = "Overall"
+MATURITY_COLUMNS = ["Category", "total_score", "total_max_weight", "maturity_level", "questions"]
 
+# categories: one row per Category (MATURITY_COLUMNS); overall: the same fields as a dict
+MaturityScores = namedtuple("MaturityScores", ["categories", "overall"])
 
-# === Step 2: Generate Category Summaries with GPT ===
-def generate_category_summary(df):
-    
-    subset = df[df["Category"] != "Business"]
-    questions = subset["Question"].tolist()
-    answers = subset["Answer"].tolist()
-    comments = subset["Comment"].fillna("").tolist() if "Comment" in df.columns else []
-
-    prompt = f"""
-    You are a strategic Adtech/Martech advisor assessing an advertiser’s maturity based on their audit responses
-    Provide a 600 word summary using the answers and comments for all questions focusing on their current usage of Google Marketing Platform and their utilization and maturity of the implementation of Adtech and Martech.
-    Questions: {questions}
-    Answers: {answers}
-    Comments: {comments}
-    """
-
-    client = openai.OpenAI(api_key=st.secrets["OPEN_AI_KEY"])
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "Imagine you are a marketing agency focused on Adtech and Martech and Google Marketing Platform."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1000,
-        temperature=0.7
-    )
 
-    summary = response.choices[0].message.content
-    return summary
+def _group_codes(arrays, size):
+    """
+    Dense codes for the combinations of values in arrays, numbered in order of first
+    appearance (all zeros when there are no arrays).
+    """
+    codes = np.zeros(size, dtype=np.int64)
+    for values in arrays:
+        # Missing values form a group of their own instead of the -1 sentinel, which
+        # would fold them into another group's combined code
+        value_codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        codes, _ = pd.factorize(codes * len(uniques) + value_codes)
+    return codes
+
 
-def generate_bullet_summary(df):
-    
-    subset = df[df["Category"] != "Business"]
-    questions = subset["Question"].tolist()
-    answers = subset["Answer"].tolist()
-    comments = subset["Comment"].fillna("").tolist() if "Comment" in df.columns else []
-
-    prompt = f"""
-    You are a strategic Adtech/Martech advisor assessing an advertiser’s maturity based on their audit responses
-    Provide a summary using the answers and comments for all questions focusing on their current usage of Google Marketing Platform and their utilization and maturity of the implementation of Adtech and Martech.
-    Provide the response in a set of bullet points, these will be emailed and need to be understand by sales, marketing and adtech colleagues.
-    Questions: {questions}
-    Answers: {answers}
-    Comments: {comments}
-    """
-
-    client = openai.OpenAI(api_key=st.secrets["OPEN_AI_KEY"])
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "Imagine you are a marketing agency focused on Adtech and Martech and Google Marketing Platform."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1000,
-        temperature=0.7
+def maturity_table(df, keys=()):
+    """
+    Vectorized maturity aggregates for df grouped by keys (e.g. a client id column)
+    and Category, plus an OVERALL_CATEGORY row per key group: one factorize per
+    column and bincount sums, no Python loop over rows or groups.
+    Each question counts once per key group, using its first row with Score and
+    MaxWeight clipped at 0 as build_answer_map does, so multi-select answers spread
+    over several rows do not inflate the totals. maturity_level is
+    total_score / total_max_weight * 100, NaN where there is no weight.
+    """
+    keys = list(keys)
+    size = len(df)
+    key_values = [df[key].to_numpy(dtype=object) for key in keys]
+    category = df['Category']
+    categories = np.where(category.isna().to_numpy(), "", category.astype(str).str.strip().to_numpy(dtype=object))
+    categories = np.where(categories == "", "Uncategorized", categories)
+    scores = np.clip(pd.to_numeric(df['Score'], errors="coerce").fillna(0.0).to_numpy(float), 0.0, None)
+    weights = np.clip(pd.to_numeric(df['MaxWeight'], errors="coerce").fillna(0.0).to_numpy(float), 0.0, None)
+
+    key_codes = _group_codes(key_values, size)
+    question_codes = _group_codes([key_codes, normalize_question_column(df['Question']).to_numpy(dtype=object)], size)
+    _, first_rows = np.unique(question_codes, return_index=True)
+    first_rows.sort()
+
+    key_codes = key_codes[first_rows]
+    groups = _group_codes([key_codes, categories[first_rows]], len(first_rows))
+    _, group_rows = np.unique(groups, return_index=True)
+    _, key_rows = np.unique(key_codes, return_index=True)
+    n_groups, n_keys = len(group_rows), len(key_rows)
+
+    group_scores = np.bincount(groups, weights=scores[first_rows], minlength=n_groups)
+    group_weights = np.bincount(groups, weights=weights[first_rows], minlength=n_groups)
+    group_questions = np.bincount(groups, minlength=n_groups)
+    overall_scores = np.bincount(key_codes, weights=scores[first_rows], minlength=n_keys)
+    overall_weights = np.bincount(key_codes, weights=weights[first_rows], minlength=n_keys)
+    overall_questions = np.bincount(key_codes, minlength=n_keys)
+
+    # Each key group's categories in order of first appearance, then its overall row
+    row_keys = np.concatenate([key_codes[group_rows], np.arange(n_keys)])
+    position = np.concatenate([np.arange(n_groups), np.full(n_keys, n_groups)])
+    order = np.lexsort((position, row_keys))
+
+    table = {
+        key: np.concatenate([values[first_rows][group_rows], values[first_rows][key_rows]])[order]
+        for key, values in zip(keys, key_values)
+    }
+    total_scores = np.concatenate([group_scores, overall_scores])[order]
+    total_weights = np.concatenate([group_weights, overall_weights])[order]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        levels = np.where(total_weights > 0, total_scores / total_weights * 100, np.nan).round(2)
+    table.update({
+        'Category': np.concatenate([categories[first_rows][group_rows], np.full(n_keys, OVERALL_CATEGORY, dtype=object)])[order],
+        'total_score': total_scores,
+        'total_max_weight': total_weights,
+        'maturity_level': levels,
+        'questions': np.concatenate([group_questions, overall_questions])[order].astype(int)
+    })
+    return pd.DataFrame(table, columns=keys + MATURITY_COLUMNS)
+
+
+def calculate_maturity_levels(df):
+    """
+    Per-Category and overall maturity of one assessment; see maturity_table.
+    Returns MaturityScores.
+    """
+    if df.empty:
+        return MaturityScores(pd.DataFrame(columns=MATURITY_COLUMNS),
+                              {"total_score": 0.0, "total_max_weight": 0.0, "maturity_level": float("nan"), "questions": 0})
+    table = maturity_table(df)
+    is_overall = table['Category'] == OVERALL_CATEGORY
+    overall = table[is_overall].iloc[-1]
+    return MaturityScores(
+        table[~is_overall].reset_index(drop=True),
+        {
+            "total_score": float(overall['total_score']),
+            "total_max_weight": float(overall['total_max_weight']),
+            "maturity_level": float(overall['maturity_level']),
+            "questions": int(overall['questions'])
+        }
     )
 
-    bullet_summary = response.choices[0].message.content
-    return bullet_summary
 
+LLM_MODEL = "gpt-4.1-mini"
 
-def identify_top_maturity_gaps(df):
-    
-    subset = df.copy()
 
-    questions = subset["Question"].tolist()
-    answers = subset["Answer"].tolist()
-    comments = subset["Comment"].fillna("").tolist() if "Comment" in df.columns else []
+def count_message_tokens(messages):
+    from prompt_payload import count_tokens
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+def create_chat_completion(messages, max_tokens=1000, temperature=0.7, use_cache=True, response_format=None,
+                           label=None):
+    """
+    Sends a chat completion request and returns the response text.
+    Responses are stored in the on-disk LLM cache keyed by the full request, so an
+    identical prompt (e.g. re-uploading the same CSV) is answered without an API call.
+    Pass use_cache=False to always go to the API.
+    When a usage ledger is active the call is checked against its budget first and
+    its wall time, tokens and cost are recorded under label.
+    """
+    from llm_cache import get_llm_cache, make_cache_key
+    from llm_client import send_chat_request
+    from llm_usage import get_current_ledger
+
+    ledger = get_current_ledger()
+    started_at = time.time()
+    timer = time.perf_counter()
+
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = make_cache_key(LLM_MODEL, messages, temperature, max_tokens, response_format)
+        cached = cache.get(key)
+        if cached is not None:
+            if ledger is not None:
+                ledger.record(label, LLM_MODEL, started_at, time.perf_counter() - timer, cached=True)
+            return cached
+
+    model, reservation = LLM_MODEL, None
+    if ledger is not None:
+        model, reservation = ledger.authorize(LLM_MODEL, count_message_tokens(messages), max_tokens)
+        if cache is not None and model != LLM_MODEL:
+            key = make_cache_key(model, messages, temperature, max_tokens, response_format)
+
+    request_options = {"response_format": response_format} if response_format is not None else {}
+    try:
+        response = send_chat_request(
+            count_message_tokens(messages) + max_tokens,
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **request_options
+        )
+    except Exception:
+        if reservation is not None:
+            ledger.release(reservation)
+        raise
+
+    if ledger is not None:
+        usage = getattr(response, "usage", None)
+        ledger.record(
+            label, model, started_at, time.perf_counter() - timer,
+            getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0),
+            reservation=reservation
+        )
+
+    choice = response.choices[0]
+    content = choice.message.content
+
+    # Truncated completions (e.g. cut off JSON) are not worth replaying
+    if cache is not None and getattr(choice, "finish_reason", None) in (None, "stop"):
+        cache.set(key, content)
+    return content
+
+
+def stream_chat_completion(messages, max_tokens=1000, temperature=0.7, use_cache=True, label=None):
+    """
+    Streaming counterpart of create_chat_completion: yields the response text in
+    chunks as the model produces them. A cached response is yielded in one chunk;
+    a fresh one is written to the cache once the stream completes, unless it
+    stopped at max_tokens.
+    """
+    from background_jobs import check_cancelled
+    from llm_cache import get_llm_cache, make_cache_key
+    from llm_client import send_chat_request
+    from llm_usage import get_current_ledger
+
+    ledger = get_current_ledger()
+    started_at = time.time()
+    timer = time.perf_counter()
+
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = make_cache_key(LLM_MODEL, messages, temperature, max_tokens)
+        cached = cache.get(key)
+        if cached is not None:
+            if ledger is not None:
+                ledger.record(label, LLM_MODEL, started_at, time.perf_counter() - timer, cached=True)
+            yield cached
+            return
+
+    model, reservation = LLM_MODEL, None
+    if ledger is not None:
+        model, reservation = ledger.authorize(LLM_MODEL, count_message_tokens(messages), max_tokens)
+        if cache is not None and model != LLM_MODEL:
+            key = make_cache_key(model, messages, temperature, max_tokens)
+
+    chunks = []
+    usage = None
+    finish_reason = None
+    stream = None
+    try:
+        stream = send_chat_request(
+            count_message_tokens(messages) + max_tokens,
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            check_cancelled()
+            # With include_usage the final chunk carries token counts and no choices
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = getattr(chunk.choices[0], "finish_reason", None)
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                yield delta
+    finally:
+        if ledger is not None:
+            if stream is None:
+                # The request was never sent
+                ledger.release(reservation)
+            else:
+                if usage is not None:
+                    prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+                else:
+                    # Cancelled or failed before the usage chunk, but the tokens were still billed
+                    from prompt_payload import count_tokens
+                    prompt_tokens, completion_tokens = count_message_tokens(messages), count_tokens("".join(chunks))
+                ledger.record(
+                    label, model, started_at, time.perf_counter() - timer,
+                    prompt_tokens, completion_tokens, reservation=reservation
+                )
 
-    prompt = f"""
-You are a strategic Adtech/Martech advisor assessing an advertiser’s maturity based on their audit responses. 
-Review the following questions, answers, and comments to identify the **most critical marketing maturity gaps**.
+    # As in create_chat_completion, a stream cut off at max_tokens is not cached
+    if cache is not None and finish_reason in (None, "stop"):
+        cache.set(key, "".join(chunks))
+
+
+# === Step 2: Generate Category Summaries with GPT ===
+CATEGORY_SUMMARY_TASK = """Provide a 600 word summary using the answers and comments for all questions focusing on their current usage of Google Marketing Platform and their utilization and maturity of the implementation of Adtech and Martech."""
+
+BULLET_SUMMARY_TASK = """Provide a summary using the answers and comments for all questions focusing on their current usage of Google Marketing Platform and their utilization and maturity of the implementation of Adtech and Martech.
+Provide the response in a set of bullet points, these will be emailed and need to be understand by sales, marketing and adtech colleagues."""
+
+MATURITY_GAPS_TASK = """Review the questions, answers, and comments above to identify the **most critical marketing maturity gaps**.
 
 A "maturity gap" is a disconnect between the current state and a more advanced, effective stage of marketing capability.
 
@@ -590,31 +686,109 @@ Each maturity gap should include:
 Return a list of the gaps as structured objects like:
 1. **Heading**: ...
    **Context**: ...
-   **Impact**: ...
-
-Questions: {questions}
-Answers: {answers}
-Comments: {comments}
-"""
-
-    client = openai.OpenAI(api_key=st.secrets["OPEN_AI_KEY"])
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "You are a marketing maturity consultant focused on identifying key capability gaps from audits."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1000,
-        temperature=0.7
+   **Impact**: ..."""
+
+MATURITY_DRIVERS_TASK = """Review the questions, answers, and comments above to identify the **most critical marketing maturity drivers**.
+
+A "maturity driver" is something that the business is currently doing well that accounts for their current level of marketing maturity, focused on their Google Marketing Platform usage.
+
+Each maturity driver should include:
+- A concise **Heading** (e.g., "Integration of First-Party Data")
+- A brief 25 words or less **Context** (what the maturity driver is and why it matters)
+- A clear 25 words or less **Impact** (how this driver improves the advertiser's maturity or strategic outcomes)
+
+Return a list of the most critical drivers as structured objects like:
+1. **Heading**: ...
+   **Context**: ...
+   **Impact**: ..."""
+
+
+ANALYSIS_MODES = ("auto", "single", "map_reduce")
+
+
+def needs_map_reduce(payload):
+    """
+    True when the single-prompt payload had to shorten comments or drop questions to
+    fit its token budget.
+    """
+    return payload.omitted_questions > 0 or payload.comment_cap is not None
+
+
+def build_analysis_payload(df, mode=None, use_cache=True):
+    """
+    The payload the analysis functions send: one PromptPayload, or a map_reduce
+    MapReducePayload that summarizes each category separately. mode defaults to
+    GMP_ANALYSIS_MODE; "auto" uses map-reduce only when the assessment does not fit
+    a single prompt uncut.
+    """
+    from prompt_payload import build_prompt_payload
+    mode = mode or os.environ.get("GMP_ANALYSIS_MODE", "auto")
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"analysis mode must be one of {', '.join(ANALYSIS_MODES)}, not {mode!r}")
+    if mode == "single":
+        return build_prompt_payload(df)
+    if mode == "auto":
+        payload = build_prompt_payload(df)
+        if not needs_map_reduce(payload):
+            return payload
+    from map_reduce import MapReducePayload
+    return MapReducePayload.from_dataframe(df, use_cache=use_cache)
+
+
+def _build_payload(df):
+    return build_analysis_payload(df)
+
+
+def generate_category_summary(df, use_cache=True, payload=None):
+    payload = payload or _build_payload(df)
+    summary = create_chat_completion(
+        payload.messages(CATEGORY_SUMMARY_TASK, include_business=False),
+        use_cache=use_cache,
+        label="category_summary"
     )
+    return summary
 
-    maturity_gaps_text = response.choices[0].message.content
+def stream_category_summary(df, use_cache=True, payload=None):
+    """
+    Yields the category summary as it is generated, for st.write_stream.
+    """
+    payload = payload or _build_payload(df)
+    yield from stream_chat_completion(
+        payload.messages(CATEGORY_SUMMARY_TASK, include_business=False),
+        use_cache=use_cache,
+        label="category_summary"
+    )
+
+def generate_bullet_summary(df, use_cache=True, payload=None):
+    payload = payload or _build_payload(df)
+    bullet_summary = create_chat_completion(
+        payload.messages(BULLET_SUMMARY_TASK, include_business=False),
+        use_cache=use_cache,
+        label="bullet_summary"
+    )
+    return bullet_summary
+
+def stream_bullet_summary(df, use_cache=True, payload=None):
+    """
+    Yields the bullet point summary as it is generated, for st.write_stream.
+    """
+    payload = payload or _build_payload(df)
+    yield from stream_chat_completion(
+        payload.messages(BULLET_SUMMARY_TASK, include_business=False),
+        use_cache=use_cache,
+        label="bullet_summary"
+    )
 
-    # Parse the maturity gaps text into a list of dictionaries
-    gaps = []
-    gap_entries = re.split(r'\d+\.\s*\*\*Heading\*\*\:', maturity_gaps_text)
 
-    for entry in gap_entries[1:]:
+def parse_maturity_markdown(text):
+    """
+    Parses a numbered "**Heading**: / **Context**: / **Impact**:" list, as requested by
+    MATURITY_GAPS_TASK and MATURITY_DRIVERS_TASK, into a Heading/Context/Impact DataFrame.
+    """
+    items = []
+    entries = re.split(r'\d+\.\s*\*\*Heading\*\*\:', text)
+
+    for entry in entries[1:]:
         heading_match = re.search(r'(.*?)\s*\*\*\s*Context\*\*\:', entry, re.DOTALL)
         context_match = re.search(r'\*\*\s*Context\*\*\:\s*(.*?)\s*\*\*\s*Impact\*\*\:', entry, re.DOTALL)
         impact_match = re.search(r'\*\*\s*Impact\*\*\:\s*(.*)', entry, re.DOTALL)
@@ -623,116 +797,266 @@ Comments: {comments}
         context = context_match.group(1).strip() if context_match else "N/A"
         impact = impact_match.group(1).strip() if impact_match else "N/A"
 
-        gaps.append({
+        items.append({
             "Heading": heading,
             "Context": context,
             "Impact": impact
         })
 
-    # Create a pandas DataFrame
-    mat_gaps_df = pd.DataFrame(gaps)
+    return pd.DataFrame(items)
 
-    return mat_gaps_df
+def identify_top_maturity_gaps(df, use_cache=True, payload=None):
+    payload = payload or _build_payload(df)
+    maturity_gaps_text = create_chat_completion(
+        payload.messages(MATURITY_GAPS_TASK),
+        use_cache=use_cache,
+        label="maturity_gaps"
+    )
+    return parse_maturity_markdown(maturity_gaps_text)
+
+def identify_top_maturity_drivers(df, use_cache=True, payload=None):
+    payload = payload or _build_payload(df)
+    maturity_drivers_text = create_chat_completion(
+        payload.messages(MATURITY_DRIVERS_TASK),
+        use_cache=use_cache,
+        label="maturity_drivers"
+    )
+    return parse_maturity_markdown(maturity_drivers_text)
 
-def identify_top_maturity_drivers(df):
-    subset = df.copy()
+MATURITY_ANALYSIS_TASK = """Review the questions, answers, and comments above to identify the advertiser's **most critical marketing maturity gaps** and **most critical marketing maturity drivers**.
 
-    questions = subset["Question"].tolist()
-    answers = subset["Answer"].tolist()
-    comments = subset["Comment"].fillna("").tolist() if "Comment" in df.columns else []
+A "maturity gap" is a disconnect between the current state and a more advanced, effective stage of marketing capability.
+A "maturity driver" is something that the business is currently doing well that accounts for their current level of marketing maturity, focused on their Google Marketing Platform usage.
 
-    prompt = f"""
-You are a strategic Adtech/Martech advisor assessing an advertiser’s maturity based on their audit responses. 
-Review the following questions, answers, and comments to identify the **most critical marketing maturity drivers**.
+Each gap and each driver should include:
+- heading: a concise heading (e.g., "Lack of First-Party Data Activation" or "Integration of First-Party Data")
+- context: 25 words or less on what the gap or driver is and why it matters
+- impact: 25 words or less on how it affects the advertiser's performance, maturity or strategic outcomes"""
+
+_MATURITY_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "heading": {"type": "string"},
+        "context": {"type": "string"},
+        "impact": {"type": "string"}
+    },
+    "required": ["heading", "context", "impact"],
+    "additionalProperties": False
+}
+
+MATURITY_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "maturity_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "gaps": {"type": "array", "items": _MATURITY_ITEM_SCHEMA},
+                "drivers": {"type": "array", "items": _MATURITY_ITEM_SCHEMA}
+            },
+            "required": ["gaps", "drivers"],
+            "additionalProperties": False
+        }
+    }
+}
 
-A "maturity driver" is something that the business is currently doing well that accounts for their current level of marketing maturity, focused on their Google Marketing Platform usage.
 
-Each maturity driver should include:
-- A concise **Heading** (e.g., "Integration of First-Party Data")
-- A brief 25 words or less **Context** (what the maturity driver is and why it matters)
-- A clear 25 words or less **Impact** (how this driver improves the advertiser's maturity or strategic outcomes)
+def parse_maturity_items(items):
+    """
+    Validates a list of {heading, context, impact} objects into the Heading/Context/Impact
+    DataFrame the app displays. Items without a heading are dropped.
+    """
+    if not isinstance(items, list):
+        raise ValueError("Expected a list of maturity items")
+
+    rows = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        heading = str(item.get("heading") or "").strip()
+        if not heading:
+            continue
+        rows.append({
+            "Heading": heading,
+            "Context": str(item.get("context") or "N/A").strip(),
+            "Impact": str(item.get("impact") or "N/A").strip()
+        })
+    return pd.DataFrame(rows, columns=["Heading", "Context", "Impact"])
 
-Return a list of the most critical drivers as structured objects like:
-1. **Heading**: ...
-   **Context**: ...
-   **Impact**: ...
-
-Questions: {questions}
-Answers: {answers}
-Comments: {comments}
-"""
-
-    client = openai.OpenAI(api_key=st.secrets["OPEN_AI_KEY"])
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "You are a marketing maturity consultant focused on identifying key capability drivers from audits."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1000,
-        temperature=0.7
+
+def identify_gaps_and_drivers(df, use_cache=True, payload=None):
+    """
+    Structured alternative to identify_top_maturity_gaps + identify_top_maturity_drivers:
+    one JSON-schema constrained request returns both lists, so the assessment is sent
+    once and no markdown parsing is needed.
+    Returns (gaps_df, drivers_df).
+    """
+    payload = payload or _build_payload(df)
+    response_text = create_chat_completion(
+        payload.messages(MATURITY_ANALYSIS_TASK),
+        max_tokens=1500,
+        use_cache=use_cache,
+        response_format=MATURITY_ANALYSIS_RESPONSE_FORMAT,
+        label="gaps_and_drivers"
     )
+    return _parse_maturity_analysis(response_text)
 
-    maturity_drivers_text = response.choices[0].message.content
 
-    # Parse the maturity gaps text into a list of dictionaries
-    drivers = []
-    drivers_entries = re.split(r'\d+\.\s*\*\*Heading\*\*\:', maturity_drivers_text)
+def _parse_maturity_analysis(response_text):
+    try:
+        analysis = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Maturity analysis response was not valid JSON: {e}")
+    if not isinstance(analysis, dict):
+        raise ValueError("Maturity analysis response was not a JSON object")
 
-    for entry in drivers_entries[1:]:
-        heading_match = re.search(r'(.*?)\s*\*\*\s*Context\*\*\:', entry, re.DOTALL)
-        context_match = re.search(r'\*\*\s*Context\*\*\:\s*(.*?)\s*\*\*\s*Impact\*\*\:', entry, re.DOTALL)
-        impact_match = re.search(r'\*\*\s*Impact\*\*\:\s*(.*)', entry, re.DOTALL)
+    return parse_maturity_items(analysis.get("gaps")), parse_maturity_items(analysis.get("drivers"))
 
-        heading = heading_match.group(1).strip() if heading_match else "N/A"
-        context = context_match.group(1).strip() if context_match else "N/A"
-        impact = impact_match.group(1).strip() if impact_match else "N/A"
+# Results of the four LLM analysis stages, in the order the app presents them
+FullAnalysis = namedtuple("FullAnalysis", ["summary", "bullet_summary", "maturity_gaps", "maturity_drivers"])
+
+ANALYSIS_STAGES = (
+    generate_category_summary,
+    generate_bullet_summary,
+    identify_top_maturity_gaps,
+    identify_top_maturity_drivers
+)
+
+
+STRUCTURED_ANALYSIS_STAGES = (
+    generate_category_summary,
+    generate_bullet_summary,
+    identify_gaps_and_drivers
+)
 
-        drivers.append({
-            "Heading": heading,
-            "Context": context,
-            "Impact": impact
-        })
 
-    # Create a pandas DataFrame
-    mat_drivers_df = pd.DataFrame(drivers)
+def generate_full_analysis(df, max_concurrency=4, use_cache=True, payload=None, structured=True):
+    """
+    Runs the LLM analysis stages at the same time on a thread pool, so the full
+    report takes as long as the slowest call rather than the sum of all of them.
+    The assessment is serialized into one prompt payload shared by every stage
+    (see build_analysis_payload for when that is a map-reduce payload).
+    With structured=True gaps and drivers come from a single JSON request
+    (three calls in total); otherwise each is parsed from its own markdown response.
+    max_concurrency caps how many OpenAI requests are in flight at once.
+    Raises the first stage error, after the other stages have finished.
+    """
+    payload = payload or _build_payload(df)
+    stages = STRUCTURED_ANALYSIS_STAGES if structured else ANALYSIS_STAGES
+    max_workers = max(1, min(max_concurrency, len(stages)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gmp-analysis") as executor:
+        # Each stage runs in a copy of this context so it is metered against the current run ledger
+        futures = [
+            executor.submit(contextvars.copy_context().run, stage, df, use_cache, payload)
+            for stage in stages
+        ]
+    results = [future.result() for future in futures]
+    if structured:
+        summary, bullet_summary, (maturity_gaps, maturity_drivers) = results
+        return FullAnalysis(summary, bullet_summary, maturity_gaps, maturity_drivers)
+    return FullAnalysis(*results)
+
+
+def stale_analysis_sections(old_payload, new_payload):
+    """
+    Names of the FullAnalysis sections whose prompt input differs between two payloads.
+    The summaries only see the non-Business block; gaps and drivers see all of it.
+    """
+    stale = set()
+    if old_payload.text(include_business=False) != new_payload.text(include_business=False):
+        stale.update(("summary", "bullet_summary"))
+    if old_payload.text(include_business=True) != new_payload.text(include_business=True):
+        stale.update(("maturity_gaps", "maturity_drivers"))
+    return stale
 
-    return mat_drivers_df
 
 def create_full_report_pdf(summary, bullet_points, gaps_df, drivers_df, recommendations_df):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_font("Arial", size=12)
-
-    pdf.set_font(style="B")
-    pdf.cell(0, 10, "Category Summary", ln=True)
-    pdf.set_font(style="")
-    for line in summary.split("\n"):
-        pdf.multi_cell(0, 10, line)
-
-    pdf.set_font(style="B")
-    pdf.cell(0, 10, "\nBullet Summary", ln=True)
-    pdf.set_font(style="")
-    for line in bullet_points.split("\n"):
-        pdf.multi_cell(0, 10, line)
-
-    pdf.set_font(style="B")
-    pdf.cell(0, 10, "\nTop Maturity Gaps", ln=True)
-    pdf.set_font(style="")
-    for _, row in gaps_df.iterrows():
-        pdf.multi_cell(0, 10, f"Heading: {row['Heading']}\nContext: {row['Context']}\nImpact: {row['Impact']}\n")
-
-    pdf.set_font(style="B")
-    pdf.cell(0, 10, "\nTop Maturity Drivers", ln=True)
-    pdf.set_font(style="")
-    for _, row in drivers_df.iterrows():
-        pdf.multi_cell(0, 10, f"Heading: {row['Heading']}\nContext: {row['Context']}\nOpportunity: {row['Opportunity']}\n")
-
-    pdf.set_font(style="B")
-    pdf.cell(0, 10, "\nRecommendations", ln=True)
-    pdf.set_font(style="")
-    for _, row in recommendations_df.iterrows():
-        pdf.multi_cell(0, 10, f"Recommendation: {row['Recommendation']}\nOverview: {row['Overview']}\nGMP Impact: {row['GMP Utilization Impact']}\nBusiness Impact: {row['Business Impact']}\n")
-
-    return pdf.output(dest="S").encode("latin1")
\ No newline at end of file
+    """
+    Renders the full report to PDF bytes; see report_pdf.create_full_report_pdf.
+    """
+    from report_pdf import create_full_report_pdf as render_pdf
+    return render_pdf(summary, bullet_points, gaps_df, drivers_df, recommendations_df)
+
+
+# === Reusing the analysis of a near-identical assessment ===
+ADAPT_TEXT_TASK = """The earlier analysis above was written for an earlier assessment whose responses differ from this advertiser's only in the changed responses listed. Revise it so it is accurate for the current responses: change only what these differences affect and keep the structure, format, length and wording of everything else. Return only the revised text."""
+
+ADAPT_MATURITY_TASK = """The maturity gaps and drivers above were identified for an earlier assessment whose responses differ from this advertiser's only in the changed responses listed. Revise them so they are accurate for the current responses: update, remove or add items only where these differences call for it, and keep the other items as they are.
+Each gap and each driver has a heading, a context of 25 words or less and an impact of 25 words or less."""
+
+
+def _adapt_messages(earlier_text, changes, task):
+    from prompt_payload import ASSESSMENT_SYSTEM_PROMPT
+    return [
+        {"role": "system", "content": ASSESSMENT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Earlier analysis:\n{earlier_text}\n\nChanged responses:\n{changes}\n\n{task}"}
+    ]
+
+
+def _maturity_items(items_df):
+    if items_df is None:
+        return []
+    return [
+        {"heading": row["Heading"], "context": row["Context"], "impact": row["Impact"]}
+        for row in items_df.to_dict("records")
+    ]
+
+
+def adapt_text(text, changes, label, use_cache=True):
+    return create_chat_completion(_adapt_messages(text, changes, ADAPT_TEXT_TASK), use_cache=use_cache, label=label)
+
+
+def adapt_gaps_and_drivers(gaps_df, drivers_df, changes, use_cache=True):
+    """
+    identify_gaps_and_drivers for a near-identical assessment: the earlier lists are
+    revised for the changed responses. Returns (gaps_df, drivers_df).
+    """
+    earlier = json.dumps({"gaps": _maturity_items(gaps_df), "drivers": _maturity_items(drivers_df)}, indent=1)
+    response_text = create_chat_completion(
+        _adapt_messages(earlier, changes, ADAPT_MATURITY_TASK),
+        max_tokens=1500,
+        use_cache=use_cache,
+        response_format=MATURITY_ANALYSIS_RESPONSE_FORMAT,
+        label="adapt_gaps_and_drivers"
+    )
+    return _parse_maturity_analysis(response_text)
+
+
+def adapt_analysis(earlier, earlier_df, df, use_cache=True):
+    """
+    Brings the FullAnalysis of a near-identical assessment (earlier_df) in line with
+    df instead of generating it again. A section whose prompt input is the same for
+    both is reused as is; the others are revised from their earlier text and the
+    changed responses only, a far shorter prompt than the whole assessment, with
+    the revisions sent at the same time. Sections earlier lacks stay None.
+    """
+    from prompt_payload import render_response_changes
+    core_changes = render_response_changes(earlier_df, df, include_business=False)
+    all_changes = render_response_changes(earlier_df, df)
+    calls = {}
+    if earlier.summary is not None and core_changes:
+        calls["summary"] = (adapt_text, earlier.summary, core_changes, "adapt_category_summary", use_cache)
+    if earlier.bullet_summary is not None and core_changes:
+        calls["bullet_summary"] = (adapt_text, earlier.bullet_summary, core_changes, "adapt_bullet_summary", use_cache)
+    if (earlier.maturity_gaps is not None or earlier.maturity_drivers is not None) and all_changes:
+        calls["maturity"] = (adapt_gaps_and_drivers, earlier.maturity_gaps, earlier.maturity_drivers, all_changes,
+                             use_cache)
+    if not calls:
+        return earlier
+
+    with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="gmp-adapt") as executor:
+        futures = {
+            section: executor.submit(contextvars.copy_context().run, *call)
+            for section, call in calls.items()
+        }
+    results = {section: future.result() for section, future in futures.items()}
+    texts = {section: results[section] for section in ("summary", "bullet_summary") if section in results}
+    adapted = earlier._replace(**texts)
+    if "maturity" in results:
+        gaps, drivers = results["maturity"]
+        adapted = adapted._replace(
+            maturity_gaps=gaps if earlier.maturity_gaps is not None else None,
+            maturity_drivers=drivers if earlier.maturity_drivers is not None else None
+        )
+    return adapted
@@ -0,0 +1,157 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+from fpdf import FPDF
+
+FONT_FAMILY = "Arial"
+BODY_SIZE = 10
+HEADING_SIZE = 14
+LINE_HEIGHT = 5
+
+# Core PDF fonts only cover latin-1; map the punctuation LLM output commonly uses
+_PDF_REPLACEMENTS = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "…": "...", "•": "-",
+    " ": " ", "→": "->", "≤": "<=", "≥": ">="
+})
+_MARKDOWN_EMPHASIS = re.compile(r"(\*\*|__|`)")
+_MARKDOWN_HEADING = re.compile(r"^\s*#{1,6}\s*", re.MULTILINE)
+
+
+@lru_cache(maxsize=4096)
+def pdf_text(text):
+    """
+    Text as the core fonts can print it: markdown emphasis stripped, common unicode
+    punctuation mapped to ASCII and anything else outside latin-1 replaced.
+    Cached because the same recommendation texts recur in every report.
+    """
+    text = _MARKDOWN_HEADING.sub("", _MARKDOWN_EMPHASIS.sub("", str(text)))
+    return text.translate(_PDF_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1").strip()
+
+
+def warm_fonts():
+    """
+    Loads the core font metrics once per process; FPDF keeps them in a module-level
+    table, so later reports in the same process skip the metric files entirely.
+    """
+    pdf = FPDF()
+    for style in ("", "B"):
+        pdf.set_font(FONT_FAMILY, style=style, size=BODY_SIZE)
+
+
+def _records(df):
+    if df is None or len(df) == 0:
+        return []
+    return df.fillna("").to_dict("records")
+
+
+def _heading(pdf, title):
+    pdf.ln(2)
+    pdf.set_font(FONT_FAMILY, style="B", size=HEADING_SIZE)
+    pdf.cell(0, 8, title, ln=True)
+    pdf.set_font(FONT_FAMILY, size=BODY_SIZE)
+
+
+def _block(pdf, title, body):
+    # One multi_cell per block: FPDF wraps and breaks pages itself
+    if title:
+        pdf.set_font(FONT_FAMILY, style="B", size=BODY_SIZE)
+        pdf.multi_cell(0, LINE_HEIGHT, pdf_text(title))
+        pdf.set_font(FONT_FAMILY, size=BODY_SIZE)
+    if body:
+        pdf.multi_cell(0, LINE_HEIGHT, body)
+    pdf.ln(2)
+
+
+@lru_cache(maxsize=1024)
+def _item_body(*fields):
+    return "\n".join(f"{label}: {pdf_text(value)}" for label, value in zip(fields[::2], fields[1::2]) if value != "")
+
+
+def create_full_report_pdf(summary, bullet_points, gaps_df, drivers_df, recommendations_df, title="GMP Assessment Report"):
+    """
+    Renders the full analysis (as held in the app's session state) to PDF.
+    Returns the PDF as bytes, built entirely in memory.
+    """
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    pdf.set_font(FONT_FAMILY, style="B", size=18)
+    pdf.cell(0, 10, pdf_text(title), ln=True)
+
+    _heading(pdf, "Category Summary")
+    _block(pdf, None, pdf_text(summary or ""))
+
+    _heading(pdf, "Bullet Summary")
+    _block(pdf, None, pdf_text(bullet_points or ""))
+
+    _heading(pdf, "Top Maturity Gaps")
+    for row in _records(gaps_df):
+        _block(pdf, row.get('Heading'), _item_body("Context", row.get('Context', ""), "Impact", row.get('Impact', "")))
+
+    _heading(pdf, "Top Maturity Drivers")
+    for row in _records(drivers_df):
+        _block(pdf, row.get('Heading'), _item_body("Context", row.get('Context', ""), "Impact", row.get('Impact', "")))
+
+    _heading(pdf, "Recommendations")
+    for row in _records(recommendations_df):
+        _block(pdf, row.get('Recommendation'), _item_body(
+            "Overview", row.get('Overview', ""),
+            "GMP Impact", row.get('GMP Utilization Impact', ""),
+            "Business Impact", row.get('Business Impact', "")
+        ))
+
+    output = pdf.output(dest="S")
+    # pyfpdf returns a latin-1 str, fpdf2 returns a bytearray
+    return output.encode("latin-1") if isinstance(output, str) else bytes(output)
+
+
+def render_report(report):
+    """
+    create_full_report_pdf for a dict with summary, bullet_points, gaps_df,
+    drivers_df, recommendations_df and optionally title.
+    """
+    return create_full_report_pdf(**report)
+
+
+def render_reports_parallel(reports, max_workers=None):
+    """
+    Renders many reports across a process pool whose workers preload the font
+    metrics once. Returns the PDF bytes in the same order as reports.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=warm_fonts) as executor:
+        return list(executor.map(render_report, reports, chunksize=max(1, len(reports) // (4 * (max_workers or os.cpu_count() or 1)))))
+
+
+def _read_text(path):
+    if not os.path.exists(path):
+        return ""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _read_csv(path):
+    return pd.read_csv(path) if os.path.exists(path) and os.path.getsize(path) > 1 else pd.DataFrame()
+
+
+def write_report_pdf(client_dir, title=None):
+    """
+    Renders report.pdf from the files batch_reports.py writes into client_dir.
+    Takes only a path, so it can be submitted to a process pool cheaply.
+    """
+    pdf_bytes = create_full_report_pdf(
+        _read_text(os.path.join(client_dir, "summary.md")),
+        _read_text(os.path.join(client_dir, "bullet_summary.md")),
+        _read_csv(os.path.join(client_dir, "gaps.csv")),
+        _read_csv(os.path.join(client_dir, "drivers.csv")),
+        _read_csv(os.path.join(client_dir, "recommendations.csv")),
+        title=title or f"GMP Assessment Report - {os.path.basename(os.path.normpath(client_dir))}"
+    )
+    path = os.path.join(client_dir, "report.pdf")
+    with open(path, "wb") as f:
+        f.write(pdf_bytes)
+    return path
@@ -0,0 +1,241 @@
+"""
+Loading, validation, compiled-plan caching and hot reload for the recommendation
+rule set (rules/recommendation_set.json by default).
+
+The rule file is a versioned document:
+
+    {"version": 1, "rules": [{"question": ..., "answer": ..., "recommendation": ...}, ...]}
+
+YAML with the same structure is accepted for .yaml/.yml files when PyYAML is installed.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import namedtuple
+
+DEFAULT_RULE_CACHE_DIR = ".cache"
+DEFAULT_POLL_SECONDS = 5.0
+
+OUTPUT_FIELDS = ("recommendation", "overview", "gmpimpact", "businessimpact")
+CONDITION_TYPES = (None, "negative_choice")
+
+logger = logging.getLogger("rule_set")
+
+# One loaded rule file: its declared version, the sha256 of its bytes, the raw rule
+# dicts and their compiled plan. Swapped as a whole so readers never see a mix.
+RuleSetSnapshot = namedtuple("RuleSetSnapshot", ["version", "source_hash", "rules", "plan"])
+
+
+class RuleSetError(ValueError):
+    """
+    Raised for a rule file that cannot be parsed or does not pass validation.
+    """
+
+
+def _parse(path, raw_bytes):
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise RuleSetError(f"{path}: PyYAML is required to load YAML rule sets")
+        try:
+            return yaml.safe_load(raw_bytes)
+        except yaml.YAMLError as e:
+            raise RuleSetError(f"{path}: invalid YAML: {e}")
+    try:
+        return json.loads(raw_bytes)
+    except ValueError as e:
+        raise RuleSetError(f"{path}: invalid JSON: {e}")
+
+
+def _is_text(value):
+    return isinstance(value, str) and value.strip() != ""
+
+
+def _condition_errors(where, condition):
+    errors = []
+    if not _is_text(condition.get('question')):
+        errors.append(f"{where}: 'question' must be a non-empty string")
+    answer = condition.get('answer')
+    answers = answer if isinstance(answer, list) else [answer]
+    if not answers or not all(isinstance(value, str) for value in answers):
+        errors.append(f"{where}: 'answer' must be a string or a non-empty list of strings")
+    if condition.get('type') not in CONDITION_TYPES:
+        errors.append(f"{where}: unknown condition type {condition.get('type')!r}")
+    return errors
+
+
+def validate_rule_set(document):
+    """
+    Checks a parsed rule file and returns (version, rules). Every problem found is
+    reported in a single RuleSetError, so a bad edit can be fixed in one pass.
+    """
+    if not isinstance(document, dict) or not isinstance(document.get('rules'), list):
+        raise RuleSetError("rule set must be an object with a 'version' and a 'rules' list")
+    if document.get('version') is None:
+        raise RuleSetError("rule set is missing its 'version'")
+
+    errors = []
+    set_ids = set()
+    for index, rule in enumerate(document['rules']):
+        where = f"rule {index}"
+        if not isinstance(rule, dict):
+            errors.append(f"{where}: must be an object")
+            continue
+        if not _is_text(rule.get('recommendation')):
+            errors.append(f"{where}: 'recommendation' must be a non-empty string")
+        for field in OUTPUT_FIELDS[1:]:
+            if field in rule and not isinstance(rule[field], str):
+                errors.append(f"{where}: '{field}' must be a string")
+
+        if 'set_id' in rule:
+            if rule['set_id'] in set_ids:
+                errors.append(f"{where}: duplicate set_id {rule['set_id']!r}")
+            set_ids.add(rule['set_id'])
+            questions = rule.get('questions')
+            if not isinstance(questions, list) or not questions:
+                errors.append(f"{where}: a set_id rule needs a non-empty 'questions' list")
+                continue
+            for sub_index, condition in enumerate(questions):
+                if not isinstance(condition, dict):
+                    errors.append(f"{where}, question {sub_index}: must be an object")
+                else:
+                    errors.extend(_condition_errors(f"{where}, question {sub_index}", condition))
+        else:
+            errors.extend(_condition_errors(where, rule))
+
+    if errors:
+        raise RuleSetError("invalid rule set:\n" + "\n".join(errors))
+    return document['version'], document['rules']
+
+
+def _write_atomic_bytes(path, data):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False, suffix=".tmp") as f:
+        f.write(data)
+        temp_path = f.name
+    os.replace(temp_path, path)
+
+
+class RuleStore:
+    """
+    Holds the current RuleSetSnapshot for one rule file.
+
+    Loading validates and compiles the file once and pickles the result to
+    cache_path, keyed on the file's sha256 and plan_format; later processes
+    unpickle that instead of re-parsing while the file is unchanged. reload()
+    swaps in a new snapshot with a single assignment, so concurrent readers of
+    .snapshot see either the old or the new rule set, never a partial one. A file
+    that fails to load leaves the current snapshot in place.
+    """
+
+    def __init__(self, path, compile_plan, plan_format, cache_path=None):
+        self.path = path
+        self.compile_plan = compile_plan
+        self.plan_format = plan_format
+        if cache_path is None:
+            source_id = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+            cache_path = os.path.join(DEFAULT_RULE_CACHE_DIR, f"rule_plan-{source_id}.pickle")
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._stat = None
+        self.snapshot = None
+        self.reload()
+
+    def _stat_key(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_cached(self, source_hash):
+        if not self.cache_path:
+            return None
+        try:
+            with open(self.cache_path, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError):
+            return None
+        if cached.get('source_hash') != source_hash or cached.get('plan_format') != self.plan_format:
+            return None
+        return cached['snapshot']
+
+    def _store_cached(self, snapshot):
+        if not self.cache_path:
+            return
+        try:
+            _write_atomic_bytes(self.cache_path, pickle.dumps({
+                'source_hash': snapshot.source_hash,
+                'plan_format': self.plan_format,
+                'snapshot': snapshot
+            }, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError as e:
+            logger.warning("could not write rule plan cache %s: %s", self.cache_path, e)
+
+    def _build(self, raw_bytes, source_hash):
+        version, rules = validate_rule_set(_parse(self.path, raw_bytes))
+        return RuleSetSnapshot(version, source_hash, tuple(rules), self.compile_plan(rules))
+
+    def reload(self, force=False):
+        """
+        Re-reads the rule file if its mtime/size changed (or force is set) and swaps
+        in the new snapshot. Returns True if the active rule set changed. Raises
+        RuleSetError when the first load fails; later failures are logged and the
+        current rule set is kept.
+        """
+        with self._lock:
+            stat_key = self._stat_key()
+            if not force and stat_key == self._stat and self.snapshot is not None:
+                return False
+            with open(self.path, "rb") as f:
+                raw_bytes = f.read()
+            self._stat = stat_key
+            source_hash = hashlib.sha256(raw_bytes).hexdigest()
+            if self.snapshot is not None and self.snapshot.source_hash == source_hash:
+                return False
+
+            snapshot = self._load_cached(source_hash)
+            if snapshot is None:
+                try:
+                    snapshot = self._build(raw_bytes, source_hash)
+                except RuleSetError as e:
+                    if self.snapshot is None:
+                        raise
+                    logger.error("keeping rule set version %s, %s failed to load: %s",
+                                 self.snapshot.version, self.path, e)
+                    return False
+                self._store_cached(snapshot)
+
+            previous = self.snapshot
+            self.snapshot = snapshot
+        if previous is not None:
+            logger.info("rule set reloaded: version %s -> %s (%d rules)", previous.version, snapshot.version,
+                        len(snapshot.rules))
+        return True
+
+
+class RuleSetWatcher(threading.Thread):
+    """
+    Daemon thread that polls a RuleStore's file every interval seconds and hot-swaps
+    the compiled plan when it changes.
+    """
+
+    def __init__(self, store, interval=DEFAULT_POLL_SECONDS):
+        super().__init__(name="gmp-rule-watcher", daemon=True)
+        self.store = store
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.store.reload()
+            except OSError as e:
+                # The file may be mid-replace by an editor or deploy; try again next poll
+                logger.warning("could not read rule set %s: %s", self.store.path, e)
+
+    def stop(self):
+        self._stopped.set()
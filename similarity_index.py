@@ -0,0 +1,174 @@
+"""
+Near-duplicate lookup of stored assessments by answer profile.
+
+An assessment is reduced to its set of (question, answer) pairs, normalized as the
+recommendation rules see them (build_answer_map, i.e. normalize_answer_for_comparison),
+and summarized by a MinHash signature of SIGNATURE_SIZE hashes. The signature is
+split into LSH_BANDS bands and each band is hashed to a bucket; two assessments
+share a bucket in at least one band with high probability when their Jaccard
+similarity is above about 0.75, and rarely when it is much lower.
+
+SimilarityIndex keeps the buckets in SQLite, keyed by bucket, so a lookup is
+LSH_BANDS primary key probes whatever the size of the archive. At most
+MAX_CANDIDATES candidates (those sharing the most bands) are then checked against
+the exact Jaccard similarity of their stored pair hashes.
+"""
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from recommendation_agent import build_answer_map
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.85
+SIGNATURE_SIZE = 128
+LSH_BANDS = 16
+MAX_CANDIDATES = 50
+
+# Bumped whenever the shingles, hash functions or banding change, to rebuild the index
+INDEX_FORMAT = 1
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_permutation_rng = np.random.default_rng(20240611)
+_PERMUTATION_A = _permutation_rng.integers(1, _MERSENNE_PRIME, SIGNATURE_SIZE, dtype=np.uint64)
+_PERMUTATION_B = _permutation_rng.integers(0, _MERSENNE_PRIME, SIGNATURE_SIZE, dtype=np.uint64)
+
+# content_hash of a stored assessment and the Jaccard similarity of its answer pairs
+SimilarityMatch = namedtuple("SimilarityMatch", ["content_hash", "similarity"])
+
+
+def similarity_threshold():
+    """
+    GMP_SIMILARITY_THRESHOLD, the Jaccard similarity above which an earlier analysis
+    is offered for reuse; 0 turns the offer off.
+    """
+    return float(os.environ.get("GMP_SIMILARITY_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD))
+
+
+def answer_shingles(df):
+    """
+    Sorted unique 32-bit hashes of an assessment's normalized (question, answer) pairs.
+    An unanswered question counts as the pair (question, "").
+    """
+    hashes = {
+        int.from_bytes(hashlib.blake2b(f"{question}\x1f{answer}".encode("utf-8"), digest_size=4).digest(), "big")
+        for question, entry in build_answer_map(df).items()
+        for answer in (entry.answers or ("",))
+    }
+    return np.array(sorted(hashes), dtype=np.uint64)
+
+
+def minhash_signature(shingles):
+    """
+    MinHash signature (SIGNATURE_SIZE uint64 values) of a shingle hash array; the
+    fraction of equal positions in two signatures estimates their Jaccard similarity.
+    """
+    if len(shingles) == 0:
+        return np.full(SIGNATURE_SIZE, _MERSENNE_PRIME, dtype=np.uint64)
+    # Universal hashing (a*x + b) mod p; the uint64 product wraps, as in common MinHash implementations
+    with np.errstate(over="ignore"):
+        permuted = (np.outer(_PERMUTATION_A, shingles) + _PERMUTATION_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def band_buckets(signature):
+    """
+    The LSH buckets of a signature: each band of SIGNATURE_SIZE / LSH_BANDS values
+    hashed, with its band number, to a signed 64-bit integer as SQLite stores it.
+    """
+    return [
+        int.from_bytes(hashlib.blake2b(values.tobytes(), digest_size=8, salt=band.to_bytes(16, "big")).digest(),
+                       "big", signed=True)
+        for band, values in enumerate(np.split(signature, LSH_BANDS))
+    ]
+
+
+def jaccard(shingles_a, shingles_b):
+    union = len(np.union1d(shingles_a, shingles_b))
+    if union == 0:
+        return 1.0
+    return len(np.intersect1d(shingles_a, shingles_b, assume_unique=True)) / union
+
+
+class SimilarityIndex:
+    """
+    LSH index of assessments by content hash, in the tables of an existing SQLite
+    connection (AssessmentStore's index); lock guards the shared connection.
+    """
+
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS similarity_meta (key TEXT PRIMARY KEY, value INTEGER)")
+            row = self._conn.execute("SELECT value FROM similarity_meta WHERE key = 'format'").fetchone()
+            if row is None or row[0] != INDEX_FORMAT:
+                self._conn.execute("DROP TABLE IF EXISTS similarity_shingles")
+                self._conn.execute("DROP TABLE IF EXISTS similarity_buckets")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS similarity_shingles ("
+                " content_hash TEXT PRIMARY KEY,"
+                " shingles BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS similarity_buckets ("
+                " bucket INTEGER NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " PRIMARY KEY (bucket, content_hash)) WITHOUT ROWID"
+            )
+            self._conn.execute("INSERT OR REPLACE INTO similarity_meta VALUES ('format', ?)", (INDEX_FORMAT,))
+
+    def __contains__(self, content_hash):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM similarity_shingles WHERE content_hash = ?", (content_hash,)
+            ).fetchone() is not None
+
+    def indexed_hashes(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT content_hash FROM similarity_shingles")}
+
+    def add(self, content_hash, shingles):
+        """
+        Indexes an assessment's answer_shingles; adding the same content hash again is a no-op.
+        """
+        buckets = band_buckets(minhash_signature(shingles))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO similarity_shingles VALUES (?, ?)",
+                    (content_hash, shingles.astype(np.uint32).tobytes())
+                ).rowcount
+                if inserted:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO similarity_buckets VALUES (?, ?)",
+                        [(bucket, content_hash) for bucket in buckets]
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def query(self, shingles, threshold):
+        """
+        SimilarityMatches of indexed assessments whose Jaccard similarity to shingles
+        is at least threshold, most similar first.
+        """
+        buckets = band_buckets(minhash_signature(shingles))
+        with self._lock:
+            candidates = self._conn.execute(
+                "SELECT s.content_hash, s.shingles FROM similarity_shingles s JOIN ("
+                "  SELECT content_hash, COUNT(*) AS shared_bands FROM similarity_buckets"
+                f"  WHERE bucket IN ({', '.join('?' * len(buckets))})"
+                "  GROUP BY content_hash ORDER BY shared_bands DESC LIMIT ?"
+                ") c ON c.content_hash = s.content_hash",
+                buckets + [MAX_CANDIDATES]
+            ).fetchall()
+        matches = []
+        for content_hash, blob in candidates:
+            similarity = jaccard(shingles, np.frombuffer(blob, dtype=np.uint32).astype(np.uint64))
+            if similarity >= threshold:
+                matches.append(SimilarityMatch(content_hash, similarity))
+        return sorted(matches, key=lambda match: match.similarity, reverse=True)
@@ -2,16 +2,514 @@
 
 import streamlit as st
 import pandas as pd
+import hashlib
+import io
+import os
+import time
+from collections import namedtuple
 from datetime import datetime
 from recommendation_agent import (
     run_recommendation_analysis,
+    stream_category_summary,
+    stream_bullet_summary,
+    identify_gaps_and_drivers,
+    generate_full_analysis,
     generate_category_summary,
     generate_bullet_summary,
-    identify_top_maturity_gaps,
-    identify_top_maturity_drivers
+    recommendations_to_dataframe,
+    IncrementalRecommendationAnalysis,
+    stale_analysis_sections,
+    get_rule_set,
+    build_analysis_payload,
+    calculate_maturity_levels,
+    start_rule_watcher,
+    adapt_analysis,
+    FullAnalysis
 )
-from fpdf import FPDF
-import base64
+from llm_usage import start_run, set_current_ledger
+from report_pdf import create_full_report_pdf
+from maturity_benchmarks import PercentileTable, DEFAULT_PERCENTILE_TABLE_PATH
+from assessment_store import get_assessment_store, compare_assessments, dataframe_hash
+from background_jobs import get_job_executor, collect_stream, JobCancelled
+from prefetch import NEXT_STEPS, Prefetch, PrefetchBudget, estimate_step_cost
+from prompt_payload import render_response_changes
+from assessment_io import read_assessment, file_format, MissingColumnsError, REQUIRED_COLUMNS, UPLOAD_TYPES
+
+JOB_POLL_SECONDS = 0.5
+
+
+def hash_upload(uploaded_file):
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+
+# The cached helpers below are keyed on the upload's content hash only (arguments starting
+# with "_" are not hashed by Streamlit), so reruns and other sessions uploading the
+# same file reuse the work.
+@st.cache_data(show_spinner=False, max_entries=64)
+def load_assessment(content_hash, fmt, _file_bytes):
+    """
+    Parses and validates an uploaded assessment (csv, parquet or excel).
+    Returns (df, missing required columns); the header is checked before any rows are read.
+    """
+    try:
+        return read_assessment(io.BytesIO(_file_bytes), fmt=fmt), []
+    except MissingColumnsError as e:
+        return None, e.missing
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_recommendation_analysis(content_hash, rules_hash, _df):
+    # rules_hash keys the result on the rule set too, so a hot-reloaded rule file is picked up
+    return run_recommendation_analysis(_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_maturity_levels(content_hash, _df):
+    return calculate_maturity_levels(_df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_percentile_table(path, modified_at):
+    # modified_at is only part of the cache key, so a rebuilt table is picked up
+    return PercentileTable.load(path)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def cached_prompt_payload(content_hash, run_id, _df):
+    """
+    The analysis payload of an upload, kept across reruns. A cache_resource value is
+    one shared object, not a copy, and a MapReducePayload runs its map-phase LLM
+    calls once, on first use, metered against whichever ledger is current then. So
+    it is keyed on the session's run_id as well: each session meters its own map
+    phase, which another session's identical upload answers from the LLM cache.
+    """
+    return build_analysis_payload(_df)
+
+
+# Session keys holding the consultant's edits to the uploaded answers
+EDIT_STATE_KEYS = ["edited_df", "edited_payload", "edited_for", "edited_hash", "incremental", "last_edit",
+                   "pending_edit"]
+
+# Sections an edit can make stale: (stale_analysis_sections name, session key, label, walkthrough step)
+EDITABLE_SECTIONS = [
+    ("summary", "summary_text", "category summary", 1),
+    ("bullet_summary", "bullet_summary", "bullet summary", 2),
+    ("maturity_gaps", "maturity_gap_df", "gaps and drivers", 3)
+]
+
+# An applied edit whose stale sections are being regenerated: the rules note for
+# last_edit and the EDITABLE_SECTIONS names being regenerated
+PendingEdit = namedtuple("PendingEdit", ["rules_note", "sections"])
+
+# Session keys holding the generated analysis of the current assessment
+ANALYSIS_STATE_KEYS = [
+    "step", "summary_text", "bullet_summary", "maturity_gap_df", "maturity_driver_df",
+    "recommendation_results", "recommendation_rules", "recommendations_df", "report_pdf", "saved_signature",
+    "reused_from"
+]
+
+
+def current_recommendation_results(content_hash, df):
+    rule_set = get_rule_set()
+    incremental = st.session_state.get("incremental")
+    if incremental is not None:
+        if incremental.plan is not rule_set.plan:
+            # The rule file was reloaded since the edits were applied
+            incremental = IncrementalRecommendationAnalysis.from_dataframe(df)
+            st.session_state.incremental = incremental
+        return incremental.results()
+    return cached_recommendation_analysis(content_hash, rule_set.source_hash, df)
+
+
+def apply_answer_edits(edited_df, df, payload, content_hash):
+    """
+    Brings every generated section in line with edited answers, doing only the work
+    the edit requires: affected rules are re-evaluated incrementally and an LLM
+    section is regenerated only if its serialized input changed. The regeneration
+    runs as a background job; finish_llm_job swaps the new sections in.
+    """
+    started = time.perf_counter()
+    incremental = st.session_state.get("incremental")
+    if incremental is None or incremental.plan is not get_rule_set().plan:
+        incremental = IncrementalRecommendationAnalysis.from_dataframe(df)
+    affected_rules = incremental.update_from_dataframe(edited_df)
+    st.session_state.incremental = incremental
+    if "recommendation_results" in st.session_state:
+        st.session_state.recommendation_results = incremental.results()
+        st.session_state.recommendation_rules = get_rule_set().source_hash
+    rules_ms = (time.perf_counter() - started) * 1000
+
+    new_payload = build_analysis_payload(edited_df)
+    stale = stale_analysis_sections(payload, new_payload)
+    sections = [name for name, key, _, _ in EDITABLE_SECTIONS if name in stale and key in st.session_state]
+
+    st.session_state.edited_df = edited_df
+    st.session_state.edited_payload = new_payload
+    st.session_state.edited_for = content_hash
+    st.session_state.edited_hash = dataframe_hash(edited_df)
+    st.session_state.pop("report_pdf", None)
+    rules_note = f"Re-evaluated {len(affected_rules)} recommendation rules in {rules_ms:.1f} ms."
+    if not sections:
+        st.session_state.last_edit = f"{rules_note} Regenerated: nothing, the LLM inputs are unchanged."
+        return
+    st.session_state.pending_edit = PendingEdit(rules_note, sections)
+    st.session_state.last_edit = f"{rules_note} Regenerating: {section_labels(sections)}..."
+    start_llm_job("edit_sections", "Regenerating the edited sections", regenerate_sections,
+                  edited_df, new_payload, sections)
+
+
+def section_labels(sections):
+    return ", ".join(label for name, _, label, _ in EDITABLE_SECTIONS if name in sections)
+
+
+def regenerate_sections(df, payload, sections):
+    """
+    Background job: the named EDITABLE_SECTIONS generated for edited answers, as
+    {session key: value}.
+    """
+    updates = {}
+    if "summary" in sections:
+        updates["summary_text"] = generate_category_summary(df, payload=payload)
+    if "bullet_summary" in sections:
+        updates["bullet_summary"] = generate_bullet_summary(df, payload=payload)
+    if "maturity_gaps" in sections:
+        updates["maturity_gap_df"], updates["maturity_driver_df"] = identify_gaps_and_drivers(df, payload=payload)
+    return updates
+
+
+def finish_answer_edits(updates):
+    pending = st.session_state.pop("pending_edit")
+    for key, value in updates.items():
+        st.session_state[key] = value
+    # The PDF may have been rendered from the old sections while they were regenerated
+    st.session_state.pop("report_pdf", None)
+    st.session_state.last_edit = f"{pending.rules_note} Regenerated: {section_labels(pending.sections)}."
+
+
+def discard_answer_edit_sections():
+    """
+    After a cancelled regeneration, drops the sections that no longer match the
+    answers and steps the walkthrough back to the first of them.
+    """
+    pending = st.session_state.pop("pending_edit", None)
+    if pending is None:
+        return
+    for name, key, _, step in EDITABLE_SECTIONS:
+        if name in pending.sections:
+            st.session_state.pop(key, None)
+            st.session_state.step = min(st.session_state.get("step", 0), step - 1)
+    if "maturity_gaps" in pending.sections:
+        st.session_state.pop("maturity_driver_df", None)
+    st.session_state.pop("report_pdf", None)
+    st.session_state.last_edit = (f"{pending.rules_note} Regenerating the {section_labels(pending.sections)} "
+                                  "was cancelled; generate them again from the steps below.")
+
+
+def display_maturity(content_hash, df):
+    """
+    Category and overall maturity, ranked against the portfolio percentile table at
+    GMP_PERCENTILE_TABLE_PATH when there is one.
+    """
+    scores = calculate_maturity_levels(df) if "edited_df" in st.session_state else cached_maturity_levels(content_hash, df)
+    table_path = os.environ.get("GMP_PERCENTILE_TABLE_PATH", DEFAULT_PERCENTILE_TABLE_PATH)
+    with st.expander("📊 Category Maturity"):
+        overall = scores.overall['maturity_level']
+        st.metric("Overall Maturity", "n/a" if pd.isna(overall) else f"{overall:.1f}%")
+        if table_path and os.path.exists(table_path):
+            ranked = load_percentile_table(table_path, os.path.getmtime(table_path)).rank(scores)
+            st.dataframe(ranked[['Category', 'maturity_level', 'percentile', 'portfolio_size']], hide_index=True,
+                         width="stretch")
+        else:
+            st.dataframe(scores.categories[['Category', 'maturity_level', 'total_score', 'total_max_weight']],
+                         hide_index=True, width="stretch")
+
+
+def reset_analysis_state():
+    cancel_llm_job()
+    discard_prefetch()
+    for key in ANALYSIS_STATE_KEYS + EDIT_STATE_KEYS + ["stored_entry", "stored_df"]:
+        st.session_state.pop(key, None)
+
+
+def restore_stored_analysis(stored, open_data=False):
+    """
+    Puts a stored run into the session as if it had just been generated, so nothing
+    is sent to the LLM again. With open_data the stored answers replace the upload.
+    """
+    reset_analysis_state()
+    if open_data:
+        st.session_state.stored_entry = stored.entry
+        st.session_state.stored_df = stored.df
+        # A fresh uploader key clears the current upload, which would otherwise take precedence
+        st.session_state.upload_generation = st.session_state.get("upload_generation", 0) + 1
+    restored = {
+        "summary_text": stored.summary,
+        "bullet_summary": stored.bullet_summary,
+        "maturity_gap_df": stored.maturity_gaps,
+        "maturity_driver_df": stored.maturity_drivers,
+        "recommendation_results": stored.recommendation_results,
+        "recommendation_rules": stored.rules_hash
+    }
+    for key, value in restored.items():
+        if value is not None:
+            st.session_state[key] = value
+    st.session_state.step = stored.entry.step
+    # The restored state is what the store already holds
+    st.session_state.saved_signature = (stored.entry[:3], stored.entry.step, None, stored.rules_hash)
+
+
+def stored_full_analysis(stored):
+    return FullAnalysis(stored.summary, stored.bullet_summary, stored.maturity_gaps, stored.maturity_drivers)
+
+
+def adapt_stored_analysis(stored, df):
+    """
+    Background job: the stored analysis of a near-identical assessment revised for df.
+    """
+    return stored.entry, adapt_analysis(stored_full_analysis(stored), stored.df, df)
+
+
+def reuse_analysis(entry, analysis):
+    """
+    Puts another assessment's analysis (as stored, or adapted) into the session for
+    the current answers, up to the step that assessment reached. Recommendations are
+    not reused; they are matched against the current answers at step 5.
+    """
+    reused = {
+        "summary_text": analysis.summary,
+        "bullet_summary": analysis.bullet_summary,
+        "maturity_gap_df": analysis.maturity_gaps,
+        "maturity_driver_df": analysis.maturity_drivers
+    }
+    for key, value in reused.items():
+        if value is not None:
+            st.session_state[key] = value
+    st.session_state.step = entry.step
+    st.session_state.reused_from = entry
+
+
+def offer_similar_analysis(store, content_hash, df):
+    """
+    Offers the analysis of the most similar stored assessment, adapted to the
+    differing responses, instead of a full generation. It is offered as it is only
+    when no answer or comment the LLM saw differs; the similarity ignores comments.
+    """
+    similar = store.similar(df, content_hash=content_hash)
+    if not similar:
+        return
+    match = similar[0]
+    stored = store.load(match.entry)
+    verbatim = render_response_changes(stored.df, df) == ""
+    st.info(f"These answers match **{match.similarity:.0%}** of those of **{match.entry.client}** "
+            f"({match.entry.assessment_date}), analysed up to step {match.entry.step}."
+            + ("" if verbatim else " Some answers or comments differ, so it can only be adapted to them."))
+    reuse_column, adapt_column = st.columns(2)
+    if verbatim and reuse_column.button("♻️ Reuse That Analysis"):
+        reuse_analysis(match.entry, stored_full_analysis(stored))
+        st.rerun()
+    if adapt_column.button("✏️ Adapt It To These Answers"):
+        start_llm_job("adapt_analysis", "Adapting the similar analysis", adapt_stored_analysis, stored, df)
+
+
+def save_analysis(store, client, assessment_date, content_hash, df):
+    """
+    Saves the session's analysis whenever a step, an edit or the rule set changed it.
+    """
+    step = st.session_state.get("step", 0)
+    # Until an edit's sections are regenerated they describe the previous answers
+    if store is None or step == 0 or not client or "pending_edit" in st.session_state:
+        return
+    key = (client, str(assessment_date), content_hash)
+    signature = (key, step, st.session_state.get("last_edit"), st.session_state.get("recommendation_rules"))
+    if st.session_state.get("saved_signature") == signature:
+        return
+    results = st.session_state.get("recommendation_results")
+    store.save(
+        *key, df,
+        summary=st.session_state.get("summary_text"),
+        bullet_summary=st.session_state.get("bullet_summary"),
+        maturity_gaps=st.session_state.get("maturity_gap_df"),
+        maturity_drivers=st.session_state.get("maturity_driver_df"),
+        recommendation_results=results,
+        step=step,
+        rules_version=get_rule_set().version if results is not None else None,
+        rules_hash=st.session_state.get("recommendation_rules")
+    )
+    st.session_state.saved_signature = signature
+
+
+def describe_entry(entry):
+    maturity = "n/a" if entry.overall_maturity is None else f"{entry.overall_maturity:.1f}%"
+    return f"{entry.assessment_date} · maturity {maturity} · step {entry.step} · {entry.content_hash[:8]}"
+
+
+def display_store_sidebar(store):
+    clients = store.clients()
+    if not clients:
+        return
+    st.sidebar.subheader("📁 Saved Assessments")
+    client = st.sidebar.selectbox("Client", clients, key="stored_client")
+    entries = store.history(client)
+    entry = st.sidebar.selectbox("Assessment", entries, format_func=describe_entry, key="stored_choice")
+    if st.sidebar.button("Open Saved Analysis"):
+        restore_stored_analysis(store.load(entry), open_data=True)
+        st.rerun()
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_comparison(other, assessment_date, content_hash, rules_hash, _store, _df):
+    stored = _store.load(other)
+    current_results = current_recommendation_results(content_hash, _df)
+    if other.assessment_date <= assessment_date:
+        return compare_assessments(stored.df, _df, stored.recommendation_results, current_results)
+    return compare_assessments(_df, stored.df, current_results, stored.recommendation_results)
+
+
+def display_comparison(store, client, assessment_date, content_hash, df):
+    """
+    Maturity and recommendation changes between this assessment and another stored
+    assessment of the same client, the older one taken as the baseline.
+    """
+    others = [entry for entry in store.history(client) if entry[:3] != (client, str(assessment_date), content_hash)]
+    if not others:
+        return
+    with st.expander("📈 Compare With Another Assessment"):
+        other = st.selectbox("Compare with", others, format_func=describe_entry, key="compare_with")
+        comparison = cached_comparison(other, str(assessment_date), content_hash, get_rule_set().source_hash,
+                                       store, df)
+        st.dataframe(comparison.maturity, hide_index=True, width="stretch")
+        st.write(f"**Questions with changed answers:** {comparison.changed_questions}")
+        if comparison.recommendations_added:
+            st.write("**New recommendations:** " + "; ".join(comparison.recommendations_added))
+        if comparison.recommendations_removed:
+            st.write("**No longer recommended:** " + "; ".join(comparison.recommendations_removed))
+
+
+def start_llm_job(name, label, func, *args, **kwargs):
+    """
+    Runs an LLM step on the shared background executor; the script thread only keeps
+    the Job handle and polls it (see display_llm_job).
+    """
+    st.session_state.llm_job = get_job_executor().submit(name, label, func, *args, **kwargs)
+    st.rerun()
+
+
+def cancel_llm_job():
+    job = st.session_state.pop("llm_job", None)
+    if job is not None:
+        job.cancel()
+
+
+def start_prefetch(step, df, payload):
+    """
+    Starts the step most likely requested next in the background while the current
+    one is being read, within the session's PrefetchBudget and only on an idle worker.
+    """
+    next_step = NEXT_STEPS.get(step)
+    prefetch = st.session_state.get("prefetch")
+    if prefetch is not None:
+        if next_step is not None and prefetch.name == next_step.name and prefetch.payload is payload:
+            return
+        # Stale: the answers were edited or the walkthrough moved on another way
+        discard_prefetch()
+    if next_step is None or not get_job_executor().has_idle_worker():
+        return
+    if "prefetch_budget" not in st.session_state:
+        st.session_state.prefetch_budget = PrefetchBudget()
+    cost = estimate_step_cost(payload, next_step)
+    if not st.session_state.prefetch_budget.reserve(cost):
+        return
+    job = get_job_executor().submit(next_step.name, next_step.label, next_step.run, df, payload)
+    st.session_state.prefetch = Prefetch(job, next_step.name, payload, cost)
+
+
+def discard_prefetch():
+    prefetch = st.session_state.pop("prefetch", None)
+    if prefetch is not None:
+        prefetch.job.cancel()
+        # A prefetch cancelled before it started cost nothing
+        st.session_state.prefetch_budget.release(prefetch.cost, wasted=prefetch.job.started_at is not None)
+
+
+def adopt_prefetch(name, payload):
+    """
+    Makes a matching prefetch the step's job, so its result shows at once (or keeps
+    streaming). Returns False when there is none to adopt.
+    """
+    prefetch = st.session_state.get("prefetch")
+    if prefetch is None or prefetch.name != name or prefetch.payload is not payload:
+        return False
+    if prefetch.job.status in ("cancelled", "failed"):
+        discard_prefetch()
+        return False
+    del st.session_state.prefetch
+    st.session_state.prefetch_budget.release(prefetch.cost)
+    st.session_state.llm_job = prefetch.job
+    st.rerun()
+
+
+def finish_llm_job(job, content_hash, df):
+    """
+    Moves a completed job's result into the session and advances the step. A failed
+    job's exception propagates to the caller.
+    """
+    st.session_state.pop("llm_job", None)
+    try:
+        result = job.result()
+    except JobCancelled:
+        st.warning(f"{job.label} was cancelled.")
+        if job.name == "edit_sections":
+            discard_answer_edit_sections()
+        return
+    if job.name == "summary":
+        st.session_state.summary_text = result
+        st.session_state.step = 1
+    elif job.name == "bullet_summary":
+        st.session_state.bullet_summary = result
+        st.session_state.step = 2
+    elif job.name == "gaps_and_drivers":
+        # Drivers come back from the same structured request and are shown at step 4
+        st.session_state.maturity_gap_df, st.session_state.maturity_driver_df = result
+        st.session_state.step = 3
+    elif job.name == "drivers":
+        _, st.session_state.maturity_driver_df = result
+        st.session_state.step = 4
+    elif job.name == "full_analysis":
+        st.session_state.summary_text = result.summary
+        st.session_state.bullet_summary = result.bullet_summary
+        st.session_state.maturity_gap_df = result.maturity_gaps
+        st.session_state.maturity_driver_df = result.maturity_drivers
+        st.session_state.recommendation_results = current_recommendation_results(content_hash, df)
+        st.session_state.step = 5
+    elif job.name == "adapt_analysis":
+        reuse_analysis(*result)
+    elif job.name == "edit_sections":
+        finish_answer_edits(result)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def display_llm_job():
+    """
+    Polls the session's running job without rerunning the whole page, until it
+    finishes and a full rerun picks up its result.
+    """
+    job = st.session_state.get("llm_job")
+    if job is None:
+        return
+    if job.done():
+        st.rerun()
+    status = job.status
+    if status == "queued":
+        ahead = get_job_executor().queue_position(job)
+        st.info(f"⏳ {job.label}: waiting for a free worker ({ahead} ahead)")
+    else:
+        st.info(f"⏳ {job.label}: {status} for {job.elapsed():.0f}s")
+    progress = job.progress_text()
+    if progress:
+        st.write(progress)
+    if status != "cancelling" and st.button("✖ Cancel", key="cancel_llm_job"):
+        job.cancel()
+
 
 def display_breadcrumb(step):
     steps = [
@@ -28,112 +526,221 @@ def display_breadcrumb(step):
     st.markdown(f"#### Progress: {breadcrumb}")
 
 
+def display_usage_sidebar(ledger):
+    summary = ledger.summary()
+    st.sidebar.subheader("LLM Usage")
+    st.sidebar.metric("Estimated Cost (USD)", f"${summary['cost']:.4f}")
+    st.sidebar.write(f"**Calls:** {summary['calls']} ({summary['cached_calls']} cached)")
+    st.sidebar.write(f"**Tokens:** {summary['prompt_tokens']} prompt / {summary['completion_tokens']} completion")
+    st.sidebar.write(f"**LLM Time:** {summary['wall_seconds']}s")
+    budget = st.session_state.get("prefetch_budget")
+    if budget is not None and budget.wasted:
+        st.sidebar.caption(f"Unused prefetches: ${budget.wasted:.4f} of the ${budget.limit} prefetch budget")
+    if summary['token_budget'] is not None or summary['cost_budget'] is not None:
+        st.sidebar.caption(f"Run budget: {summary['token_budget'] or '∞'} tokens / ${summary['cost_budget'] or '∞'}")
+    if ledger.records:
+        st.sidebar.dataframe(
+            pd.DataFrame([record._asdict() for record in ledger.records])[
+                ['label', 'model', 'wall_seconds', 'prompt_tokens', 'completion_tokens', 'cost', 'cached']
+            ],
+            hide_index=True
+        )
+
+
 def main():
+    start_rule_watcher()
+
+    # Every LLM call in this session is metered against one run ledger until "Start Over"
+    if "usage_ledger" not in st.session_state:
+        st.session_state.usage_ledger = start_run()
+    else:
+        set_current_ledger(st.session_state.usage_ledger)
+    display_usage_sidebar(st.session_state.usage_ledger)
+    store = get_assessment_store()
+    if store is not None:
+        display_store_sidebar(store)
+
     now = datetime.now()
     formatted_date_time = now.strftime("%Y-%m-%d")
 
     st.image('acx_logo.png', width=100)
     st.title("GMP Assessment Analysis")
     st.write(f"The current date and time is: **{formatted_date_time}**")
-    st.write("Upload a CSV file of the results from the GMP Assessment. Step through the process to receive the summary, bullet points, gaps, drivers and recommendations. This tool helps streamline and standardize GMP Assessment analysis.")
+    st.write("Upload a CSV, Parquet or Excel file of the results from the GMP Assessment. Step through the process to receive the summary, bullet points, gaps, drivers and recommendations. This tool helps streamline and standardize GMP Assessment analysis.")
 
-    uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
+    uploaded_file = st.file_uploader("Choose an assessment file", type=UPLOAD_TYPES,
+                                     key=f"upload_{st.session_state.get('upload_generation', 0)}")
 
-    if uploaded_file is not None:
+    if uploaded_file is not None or "stored_entry" in st.session_state:
         try:
-            df = pd.read_csv(uploaded_file)
-            required_columns = ['Category', 'Question', 'Answer', 'Score', 'MaxWeight']
-            if not all(col in df.columns for col in required_columns):
-                st.error(f"The uploaded CSV must contain the following columns: **{', '.join(required_columns)}**")
-                return
+            if uploaded_file is not None:
+                content_hash = hash_upload(uploaded_file)
+                df, missing_columns = load_assessment(content_hash, file_format(uploaded_file),
+                                                      uploaded_file.getvalue())
+                if missing_columns:
+                    st.error(f"The uploaded file must contain the following columns: **{', '.join(REQUIRED_COLUMNS)}**")
+                    return
+                stored_entry = st.session_state.pop("stored_entry", None)
+                if stored_entry is not None and stored_entry.content_hash != content_hash:
+                    # A new upload replaces the opened saved analysis
+                    reset_analysis_state()
+                st.session_state.pop("stored_df", None)
+                client = st.text_input("Client", value=os.path.splitext(uploaded_file.name)[0])
+                assessment_date = st.date_input("Assessment date", value=now.date())
+                st.success("Assessment file successfully loaded! See sample below.")
+            else:
+                entry = st.session_state.stored_entry
+                content_hash = entry.content_hash
+                df = st.session_state.stored_df
+                client, assessment_date = entry.client, entry.assessment_date
+                st.info(f"Showing the saved analysis of **{client}** from {assessment_date}.")
+            payload = cached_prompt_payload(content_hash, st.session_state.usage_ledger.run_id, df)
+
+            # Edits only apply to the upload they were made on
+            if st.session_state.get("edited_for") not in (None, content_hash):
+                for key in EDIT_STATE_KEYS:
+                    st.session_state.pop(key, None)
+            if "edited_df" in st.session_state:
+                df = st.session_state.edited_df
+                payload = st.session_state.edited_payload
 
-            st.success("CSV file successfully loaded! See sample below.")
             st.dataframe(df.head())
 
+            with st.expander("✏️ Edit Answers"):
+                with st.form("edit_answers"):
+                    # Categorical columns would limit the editor to the values already present
+                    editable_df = df.astype({column: 'str' for column in df.select_dtypes('category').columns})
+                    edited_df = st.data_editor(editable_df, num_rows="dynamic", width="stretch", key="answer_editor")
+                    # Edits wait for a running step, whose result is for the current answers
+                    if st.form_submit_button("Apply Edits", disabled="llm_job" in st.session_state):
+                        apply_answer_edits(edited_df, df, payload, content_hash)
+                        st.rerun()
+                if "last_edit" in st.session_state:
+                    st.caption(st.session_state.last_edit)
+
+            # Edited answers are stored as their own version of the assessment
+            analysed_hash = st.session_state.get("edited_hash", content_hash)
+            display_maturity(content_hash, df)
+            if store is not None:
+                display_comparison(store, client, assessment_date, analysed_hash, df)
+
             if "step" not in st.session_state:
                 st.session_state.step = 0
 
+            if store is not None and st.session_state.step == 0:
+                saved = [entry for entry in store.find(analysed_hash) if entry.step > 0]
+                if saved:
+                    st.info(f"This assessment was already analysed for **{saved[0].client}** on "
+                            f"{saved[0].assessment_date} (up to step {saved[0].step}).")
+                    if st.button("📂 Load Saved Analysis"):
+                        restore_stored_analysis(store.load(saved[0]))
+                        st.rerun()
+                elif "llm_job" not in st.session_state:
+                    offer_similar_analysis(store, analysed_hash, df)
+
+            job = st.session_state.get("llm_job")
+            if job is not None and job.done():
+                finish_llm_job(job, content_hash, df)
+            busy = "llm_job" in st.session_state
+            if not busy:
+                start_prefetch(st.session_state.step, df, payload)
+
             display_breadcrumb(st.session_state.step)
+            reused_from = st.session_state.get("reused_from")
+            if reused_from is not None:
+                st.caption(f"Analysis reused from {reused_from.client} ({reused_from.assessment_date}).")
 
-            if st.session_state.step == 0:
+            if st.session_state.step == 0 and not busy:
                 if st.button("1️⃣ Generate Category Summary"):
-                    st.session_state.summary_text = generate_category_summary(df)
-                    st.session_state.step = 1
-                    st.rerun()
+                    start_llm_job("summary", "Category summary", collect_stream,
+                                  stream_category_summary(df, payload=payload))
+                if st.button("⚡ Generate Full Analysis"):
+                    start_llm_job("full_analysis", "Full analysis", generate_full_analysis, df, payload=payload)
 
             if st.session_state.step >= 1:
                 st.subheader("1️⃣ Category Summary")
                 st.write(st.session_state.summary_text)
 
-            if st.session_state.step == 1:
-                if st.button("2️⃣ Generate Bullet Summary"):
-                    st.session_state.bullet_summary = generate_bullet_summary(df)
-                    st.session_state.step = 2
-                    st.rerun()
+            if st.session_state.step == 1 and not busy:
+                if st.button("2️⃣ Generate Bullet Summary") and not adopt_prefetch("bullet_summary", payload):
+                    start_llm_job("bullet_summary", "Bullet summary", collect_stream,
+                                  stream_bullet_summary(df, payload=payload))
 
             if st.session_state.step >= 2:
                 st.subheader("2️⃣ Bullet Point Summary")
                 st.write("Please copy and paste the text below into your email or document.")
                 st.write(st.session_state.bullet_summary)
 
-            if st.session_state.step == 2:
-                if st.button("3️⃣ Identify Maturity Gaps"):
-                    st.session_state.maturity_gap_df = identify_top_maturity_gaps(df)
-                    st.session_state.step = 3
-                    st.rerun()
+            if st.session_state.step == 2 and not busy:
+                if st.button("3️⃣ Identify Maturity Gaps") and not adopt_prefetch("gaps_and_drivers", payload):
+                    start_llm_job("gaps_and_drivers", "Maturity gaps", identify_gaps_and_drivers, df, payload=payload)
 
             if st.session_state.step >= 3:
                 st.subheader("3️⃣ Maturity Gaps")
-                st.dataframe(st.session_state.maturity_gap_df, use_container_width=True)
+                st.dataframe(st.session_state.maturity_gap_df, width="stretch")
 
-            if st.session_state.step == 3:
+            if st.session_state.step == 3 and not busy:
                 if st.button("4️⃣ Identify Maturity Drivers"):
-                    st.session_state.maturity_driver_df = identify_top_maturity_drivers(df)
-                    st.session_state.step = 4
-                    st.rerun()
+                    if "maturity_driver_df" in st.session_state:
+                        st.session_state.step = 4
+                        st.rerun()
+                    start_llm_job("drivers", "Maturity drivers", identify_gaps_and_drivers, df, payload=payload)
 
             if st.session_state.step >= 4:
                 st.subheader("4️⃣ Maturity Drivers")
-                st.dataframe(st.session_state.maturity_driver_df, use_container_width=True)
+                st.dataframe(st.session_state.maturity_driver_df, width="stretch")
+
+            if busy:
+                display_llm_job()
 
             if st.session_state.step == 4:
                 if st.button("5️⃣ Run Recommendations Analysis"):
-                    st.session_state.recommendation_results = run_recommendation_analysis(df)
+                    st.session_state.recommendation_results = current_recommendation_results(content_hash, df)
                     st.session_state.step = 5
                     st.rerun()
 
             if st.session_state.step >= 5:
                 st.subheader("5️⃣ Capability Recommendations")
+                rule_set = get_rule_set()
+                if st.session_state.get("recommendation_rules") != rule_set.source_hash:
+                    # First display, or the rule file changed under this session
+                    st.session_state.recommendation_results = current_recommendation_results(content_hash, df)
+                    st.session_state.recommendation_rules = rule_set.source_hash
+                    st.session_state.pop("report_pdf", None)
+                st.caption(f"Recommendation rules version {rule_set.version}")
                 results = st.session_state.recommendation_results
                 if results and results['matched_recommendations']:
-                    recommendations_df = pd.DataFrame(results['matched_recommendations'])
-                    recommendations_df.rename(columns={
-                        'recommendation': 'Recommendation',
-                        'overview': 'Overview',
-                        'gmp_impact': 'GMP Utilization Impact',
-                        'business_impact': 'Business Impact'
-                    }, inplace=True)
-                    expected_cols = [
-                        'Recommendation',
-                        'Overview',
-                        'GMP Utilization Impact',
-                        'Business Impact',
-                        'score',
-                        'maxweight'
-                    ]
-                    display_cols = [col for col in expected_cols if col in recommendations_df.columns]
-                    st.session_state.recommendations_df = recommendations_df[display_cols]
-                    st.dataframe(st.session_state.recommendations_df, hide_index=True, use_container_width=True)
+                    st.session_state.recommendations_df = recommendations_to_dataframe(results)
+                    st.dataframe(st.session_state.recommendations_df, hide_index=True, width="stretch")
 
                 else:
                     st.info("No recommendations matched based on the provided data.")
                 st.write(f"**Total Recommendations:** {results['total_matched_recommendations']}")
 
+                if "report_pdf" not in st.session_state:
+                    st.session_state.report_pdf = create_full_report_pdf(
+                        st.session_state.get("summary_text"),
+                        st.session_state.get("bullet_summary"),
+                        st.session_state.get("maturity_gap_df"),
+                        st.session_state.get("maturity_driver_df"),
+                        st.session_state.get("recommendations_df")
+                    )
+                st.download_button(
+                    "📄 Download PDF Report",
+                    data=st.session_state.report_pdf,
+                    file_name=f"gmp_assessment_report_{formatted_date_time}.pdf",
+                    mime="application/pdf"
+                )
+
+            save_analysis(store, client, assessment_date, analysed_hash, df)
+
         except Exception as e:
-            st.error(f"An error occurred while processing the CSV file: {e}")
+            st.error(f"An error occurred while processing the assessment file: {e}")
 
     if "step" in st.session_state and st.session_state.step > 0:
         if st.button("🔄 Start Over"):
+            cancel_llm_job()
+            discard_prefetch()
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
@@ -0,0 +1,85 @@
+"""
+Offline stand-ins for llm_client.send_chat_request: canned chat completions and
+streams shaped like the OpenAI SDK's objects, with the finish_reason and usage
+the tests need (the stub server always finishes with "stop").
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+import llm_client
+
+
+def completion(text, finish_reason="stop", prompt_tokens=20, completion_tokens=10):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason=finish_reason)],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    )
+
+
+def stream(pieces, finish_reason="stop", usage=None, fail_after=None):
+    """
+    Chunks of a streamed completion. usage=(prompt, completion) adds the final
+    include_usage chunk; fail_after=n raises ConnectionError after n pieces.
+    """
+    for i, piece in enumerate(pieces):
+        if fail_after is not None and i == fail_after:
+            raise ConnectionError("stream dropped")
+        yield SimpleNamespace(usage=None, choices=[
+            SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason=None)])
+    yield SimpleNamespace(usage=None, choices=[
+        SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason=finish_reason)])
+    if usage is not None:
+        yield SimpleNamespace(usage=SimpleNamespace(prompt_tokens=usage[0], completion_tokens=usage[1]),
+                              choices=[])
+
+
+class FakeTransport:
+    """
+    Replaces send_chat_request; respond(request) returns a completion or a stream.
+    Every request is kept in .requests.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+
+    def __call__(self, estimated_tokens, **request):
+        self.requests.append(request)
+        return self.respond(request)
+
+
+@pytest.fixture
+def llm_cache_path(tmp_path, monkeypatch):
+    """
+    A fresh process-wide LLM cache in tmp_path.
+    """
+    path = tmp_path / "llm_responses.sqlite3"
+    monkeypatch.setenv("GMP_LLM_CACHE_PATH", str(path))
+    monkeypatch.setattr(llm_cache, "_cache", None)
+    return path
+
+
+def install(monkeypatch, respond):
+    transport = FakeTransport(respond)
+    monkeypatch.setattr(llm_client, "send_chat_request", transport)
+    return transport
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """
+    The in-process OpenAI-compatible stub, with the shared client pointed at it and
+    caching off so every call reaches it.
+    """
+    from llm_stub_server import StubServer
+
+    server = StubServer(profile="instant").start()
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setenv("GMP_LLM_CACHE_PATH", "")
+    monkeypatch.delenv("GMP_LLM_TRANSPORT", raising=False)
+    monkeypatch.setattr(llm_client, "_client", None)
+    yield server
+    server.stop()
@@ -0,0 +1,109 @@
+"""
+The row-by-row matcher the rule plan replaced, kept as the reference the compiled,
+vectorized, batch and incremental matchers are tested against, plus helpers to
+make synthetic assessments look like real exports.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommendation_agent import normalize_answer_for_comparison
+
+
+def baseline_answer_map(df):
+    """
+    {question: {'answers': [...], 'score': ..., 'maxweight': ...}} as the original
+    loop built it from df.iterrows().
+    """
+    csv_data_map = {}
+    for _, row in df.iterrows():
+        question_key = str(row['Question']).lower().strip()
+        answer_value = normalize_answer_for_comparison(row['Answer'])
+        score = max(0.0, float(row['Score'] if pd.notna(row['Score']) else 0.0))
+        max_weight = max(0.0, float(row['MaxWeight'] if pd.notna(row['MaxWeight']) else 0.0))
+        if question_key not in csv_data_map:
+            csv_data_map[question_key] = {'answers': [answer_value], 'score': score, 'maxweight': max_weight}
+        else:
+            csv_data_map[question_key]['answers'].append(answer_value)
+    return csv_data_map
+
+
+def baseline_analysis(df, recommendation_set):
+    """
+    The original run_recommendation_analysis.
+    """
+    csv_data_map = baseline_answer_map(df)
+    matched = []
+    for item in recommendation_set:
+        score = 0.0
+        max_weight = 0.0
+        all_met = True
+        for sub_item in item.get('questions', [item]):
+            entry = csv_data_map.get(sub_item['question'].lower().strip())
+            raw_answers = sub_item['answer'] if isinstance(sub_item['answer'], list) else [sub_item['answer']]
+            rule_answers = [normalize_answer_for_comparison(value) for value in raw_answers]
+            met = False
+            if entry:
+                if sub_item.get('type') == "negative_choice":
+                    met = all(answer not in rule_answers for answer in entry['answers'])
+                else:
+                    met = any(answer in rule_answers for answer in entry['answers'])
+            if not met:
+                all_met = False
+                break
+            score += entry['score']
+            max_weight += entry['maxweight']
+        if all_met:
+            matched.append({
+                'recommendation': item['recommendation'],
+                'overview': item.get('overview', 'N/A'),
+                'gmp_impact': item.get('gmpimpact', 'N/A'),
+                'business_impact': item.get('businessimpact', 'N/A'),
+                'score': score,
+                'maxweight': max_weight
+            })
+
+    return {
+        'matched_recommendations': matched,
+        'total_matched_recommendations': len(matched),
+        'total_score': sum(match['score'] for match in matched),
+        'total_max_score': sum(match['maxweight'] for match in matched)
+    }
+
+
+def roughen(df, seed):
+    """
+    Blanks and "N/A"s some answers, blanks some scores and comments and changes the
+    case and padding of some questions, as exported assessments do.
+    """
+    rng = random.Random(seed)
+    df = df.copy()
+    df['Answer'] = df['Answer'].astype(object)
+    df['Question'] = df['Question'].astype(object)
+    df['Score'] = df['Score'].astype(float)
+    for row in range(len(df)):
+        roll = rng.random()
+        if roll < 0.05:
+            df.at[row, 'Answer'] = None
+        elif roll < 0.08:
+            df.at[row, 'Answer'] = " N/A "
+        elif roll < 0.12:
+            df.at[row, 'Answer'] = df.at[row, 'Answer'].upper()
+        if rng.random() < 0.05:
+            df.at[row, 'Score'] = np.nan
+        if rng.random() < 0.05:
+            df.at[row, 'Question'] = f"  {df.at[row, 'Question'].title()} "
+    df.loc[df.sample(frac=0.5, random_state=seed).index, 'Comment'] = None
+    return df
+
+
+def assert_same_results(actual, expected):
+    assert actual['total_matched_recommendations'] == expected['total_matched_recommendations']
+    assert [match['recommendation'] for match in actual['matched_recommendations']] == \
+        [match['recommendation'] for match in expected['matched_recommendations']]
+    for got, want in zip(actual['matched_recommendations'], expected['matched_recommendations']):
+        assert got == pytest.approx(want)
+    assert actual['total_score'] == pytest.approx(expected['total_score'])
+    assert actual['total_max_score'] == pytest.approx(expected['total_max_score'])
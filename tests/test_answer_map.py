@@ -0,0 +1,60 @@
+"""
+The vectorized answer map (build_answer_map and the column normalizers) against
+the iterrows loop it replaced.
+
+    python -m pytest tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from matching_reference import baseline_answer_map, roughen
+from recommendation_agent import (build_answer_map, normalize_answer_column, normalize_answer_for_comparison,
+                                  normalize_question_column)
+from synthetic import make_assessment
+
+VALUES = ["Yes", "  N/A ", "n/a", "", None, np.nan, " Target CPA ", "NO", 3, "ÜBER"]
+
+
+def test_column_normalizers_match_scalar_normalization():
+    answers = pd.Series(VALUES, dtype=object)
+    assert list(normalize_answer_column(answers)) == [normalize_answer_for_comparison(value) for value in VALUES]
+    # Missing questions read from a file are NaN, which both render as "nan"
+    questions = pd.Series([np.nan if value is None else value for value in VALUES], dtype=object)
+    assert list(normalize_question_column(questions)) == [str(value).lower().strip() for value in questions]
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_build_answer_map_matches_baseline(seed):
+    df = make_assessment(seed=seed, max_selections=4)
+    if seed % 2:
+        df = roughen(df, seed)
+    expected = baseline_answer_map(df)
+    answer_map = build_answer_map(df)
+    assert list(answer_map) == list(expected)
+    for question, entry in expected.items():
+        assert answer_map[question].answers == frozenset(entry['answers'])
+        assert answer_map[question].score == entry['score']
+        assert answer_map[question].maxweight == entry['maxweight']
+
+
+def test_multi_select_uses_the_first_row_and_clips_negatives():
+    df = pd.DataFrame({
+        'Question': ["Q?", " q? ", "Other?"],
+        'Answer': ["a", "B", None],
+        'Score': [-2, 3, np.nan],
+        'MaxWeight': [4, 5, 2]
+    })
+    answer_map = build_answer_map(df)
+    assert answer_map["q?"].answers == frozenset({"a", "b"})
+    assert (answer_map["q?"].score, answer_map["q?"].maxweight) == (0.0, 4.0)
+    assert answer_map["other?"] == (frozenset({""}), 0.0, 2.0)
+
+
+def test_categorical_columns_and_empty_frames():
+    df = make_assessment(seed=2)
+    typed = df.astype({'Question': 'category', 'Answer': 'category'})
+    assert dict(build_answer_map(typed)) == dict(build_answer_map(df))
+    assert dict(build_answer_map(df.iloc[0:0])) == {}
+    with pytest.raises(TypeError):
+        build_answer_map(df)["new"] = None
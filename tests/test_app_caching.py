@@ -0,0 +1,92 @@
+"""
+The app's content-hash keyed caches: an upload is parsed and analysed once per
+content hash, across reruns and sessions, and the recommendation results follow
+the active rule set.
+
+    python -m pytest tests
+"""
+import io
+import logging
+
+import pytest
+import streamlit as st
+
+import streamlit_app
+from synthetic import make_assessment
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    # Outside a running app Streamlit warns that it falls back to in-memory caches
+    logging.getLogger("streamlit.runtime.caching.cache_data_api").setLevel(logging.ERROR)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    yield
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def counting(monkeypatch, name):
+    calls = []
+    original = getattr(streamlit_app, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(streamlit_app, name, wrapper)
+    return calls
+
+
+def csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+class Upload(io.BytesIO):
+    name = "assessment.csv"
+
+
+def test_upload_is_parsed_once_per_content_hash(monkeypatch):
+    calls = counting(monkeypatch, "read_assessment")
+    data = csv_bytes(make_assessment(rows=30, seed=1))
+    content_hash = streamlit_app.hash_upload(Upload(data))
+    assert content_hash == streamlit_app.hash_upload(Upload(bytes(data)))
+
+    df, missing = streamlit_app.load_assessment(content_hash, "csv", data)
+    again, _ = streamlit_app.load_assessment(content_hash, "csv", data)
+    assert len(calls) == 1 and missing == []
+    assert again.equals(df)
+    # Each rerun gets its own copy, so one session's edits cannot leak into another's
+    df.loc[df.index[0], 'Score'] = 99
+    assert streamlit_app.load_assessment(content_hash, "csv", data)[0].loc[0, 'Score'] != 99
+
+    other = csv_bytes(make_assessment(rows=30, seed=2))
+    streamlit_app.load_assessment(streamlit_app.hash_upload(Upload(other)), "csv", other)
+    assert len(calls) == 2
+
+
+def test_missing_columns_are_reported_not_raised():
+    data = csv_bytes(make_assessment(rows=10, seed=1).drop(columns=['Score', 'MaxWeight']))
+    df, missing = streamlit_app.load_assessment(streamlit_app.hash_upload(Upload(data)), "csv", data)
+    assert df is None and sorted(missing) == ['MaxWeight', 'Score']
+
+
+def test_recommendations_are_cached_per_content_and_rule_set(monkeypatch):
+    calls = counting(monkeypatch, "run_recommendation_analysis")
+    df = make_assessment(rows=30, seed=3)
+    first = streamlit_app.cached_recommendation_analysis("content", "rules-1", df)
+    assert streamlit_app.cached_recommendation_analysis("content", "rules-1", df) == first
+    assert len(calls) == 1
+    # A reloaded rule file has a new hash, so the results are recomputed
+    streamlit_app.cached_recommendation_analysis("content", "rules-2", df)
+    assert len(calls) == 2
+
+
+def test_each_session_gets_its_own_analysis_payload(monkeypatch):
+    calls = counting(monkeypatch, "build_analysis_payload")
+    df = make_assessment(rows=30, seed=4)
+    payload = streamlit_app.cached_prompt_payload("content", "run-a", df)
+    assert streamlit_app.cached_prompt_payload("content", "run-a", df) is payload
+    # A shared map-reduce payload would meter its map phase against the first session only
+    assert streamlit_app.cached_prompt_payload("content", "run-b", df) is not payload
+    assert len(calls) == 2
@@ -0,0 +1,147 @@
+"""
+Assessment ingestion: typed, column-pruned reads of CSV, Parquet and Excel, the
+header check before any rows, and multi-client exports streamed one client at a
+time, sorted or not, into the batch runner.
+
+    python -m pytest tests
+"""
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from assessment_io import (ASSESSMENT_COLUMNS, UPLOAD_TYPES, MissingColumnsError, file_format, iter_client_assessments,
+                           read_assessment, read_header)
+from batch_reports import main, run_export_batch
+from synthetic import make_assessment, make_portfolio
+
+
+@pytest.fixture
+def df():
+    assessment = make_assessment(rows=80, seed=9)
+    assessment['Extra'] = "not an assessment column"
+    return assessment
+
+
+def pandas_read(path):
+    # What the untyped pandas readers make of the file, e.g. "n/a" answers in a CSV are missing
+    readers = {"csv": pd.read_csv, "parquet": pd.read_parquet, "excel": pd.read_excel}
+    return readers[file_format(path)](path)
+
+
+def expected(df):
+    return as_text(df[ASSESSMENT_COLUMNS])
+
+
+def as_text(df):
+    df = df.astype({column: float for column in ('Score', 'MaxWeight') if column in df.columns})
+    return df.astype(str).reset_index(drop=True)
+
+
+def check_typed(loaded, reference):
+    assert list(loaded.columns) == ASSESSMENT_COLUMNS
+    assert all(isinstance(loaded[column].dtype, pd.CategoricalDtype) for column in ('Category', 'Question', 'Answer'))
+    assert (loaded['Score'].dtype, loaded['MaxWeight'].dtype) == ("float64", "float64")
+    pd.testing.assert_frame_equal(as_text(loaded), expected(reference))
+
+
+@pytest.mark.parametrize("name, write", [
+    ("assessment.csv", lambda df, path: df.to_csv(path, index=False)),
+    ("assessment.parquet", lambda df, path: df.to_parquet(path, index=False)),
+    ("assessment.xlsx", lambda df, path: df.to_excel(path, index=False))
+])
+def test_read_assessment_is_typed_and_pruned(tmp_path, df, name, write):
+    if name.endswith(".xlsx"):
+        pytest.importorskip("openpyxl")
+    path = str(tmp_path / name)
+    write(df, path)
+    check_typed(read_assessment(path), pandas_read(path))
+    with open(path, "rb") as f:
+        check_typed(read_assessment(f, fmt=file_format(name)), pandas_read(path))
+
+
+def test_uploads_and_ragged_csv(df):
+    data = df.to_csv(index=False).encode("utf-8-sig")
+    assert read_header(io.BytesIO(data))[:2] == ['Category', 'Question']
+    check_typed(read_assessment(io.BytesIO(data), fmt="csv"), pd.read_csv(io.BytesIO(data)))
+
+    # A row with a missing trailing field is rejected by pyarrow and read by the C parser
+    ragged = b"Category,Question,Answer,Score,MaxWeight,Comment\nMedia,Uses DV360?,yes,2,3,ok\nMedia,Uses SA360?,no,1,3\n"
+    loaded = read_assessment(io.BytesIO(ragged), fmt="csv")
+    assert len(loaded) == 2 and pd.isna(loaded.loc[1, 'Comment'])
+
+
+def test_missing_columns_are_reported_before_reading_rows():
+    data = b"Category,Question,Answer\n" + b"Media,Uses DV360?,yes\n" * 1000
+    with pytest.raises(MissingColumnsError) as raised:
+        read_assessment(io.BytesIO(data), fmt="csv")
+    assert raised.value.missing == ['Score', 'MaxWeight']
+
+
+def test_file_format():
+    assert [file_format(name) for name in ("a.CSV", "a.parquet", "a.pq", "a.xlsx", "a.xls", "a")] == [
+        "csv", "parquet", "parquet", "excel", "csv", "csv"]
+    # Legacy .xls would need xlrd as well
+    assert UPLOAD_TYPES == ["csv", "parquet", "pq", "xlsx"]
+
+
+@pytest.fixture
+def portfolio():
+    return make_portfolio(5, rows=40, seed=4)
+
+
+def clients_of(path):
+    return {client: expected(rows) for client, rows in pandas_read(path).groupby('ClientId', sort=False)}
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+@pytest.mark.parametrize("chunk_rows", [7, 64, 10_000])
+def test_grouped_export_is_streamed_per_client(tmp_path, portfolio, suffix, chunk_rows):
+    path = str(tmp_path / f"export{suffix}")
+    portfolio.to_csv(path, index=False) if suffix == ".csv" else portfolio.to_parquet(path, index=False)
+    streamed = list(iter_client_assessments(path, chunk_rows=chunk_rows))
+    assert [client for client, _ in streamed] == [f"client-{i}" for i in range(5)]
+    for client, assessment in streamed:
+        assert isinstance(assessment['Answer'].dtype, pd.CategoricalDtype)
+        pd.testing.assert_frame_equal(as_text(assessment), clients_of(path)[client])
+
+
+def test_unsorted_export_needs_grouped_false(tmp_path, portfolio):
+    shuffled = portfolio.sample(frac=1.0, random_state=1)
+    shuffled.loc[shuffled.index[:3], 'ClientId'] = None
+    path = str(tmp_path / "export.csv")
+    shuffled.to_csv(path, index=False)
+    with pytest.raises(ValueError, match="not contiguous"):
+        list(iter_client_assessments(path, chunk_rows=50))
+
+    streamed = dict(iter_client_assessments(path, chunk_rows=50, grouped=False))
+    assert list(streamed) == list(shuffled['ClientId'].dropna().unique())
+    for client, rows in clients_of(path).items():
+        pd.testing.assert_frame_equal(as_text(streamed[client]), rows)
+
+
+def test_exports_that_cannot_be_streamed(tmp_path, portfolio):
+    path = str(tmp_path / "export.csv")
+    portfolio.to_csv(path, index=False)
+    with pytest.raises(MissingColumnsError, match="Account"):
+        next(iter_client_assessments(path, client_column="Account"))
+    pytest.importorskip("openpyxl")
+    portfolio.to_excel(tmp_path / "export.xlsx", index=False)
+    with pytest.raises(ValueError, match="excel exports cannot be streamed"):
+        next(iter_client_assessments(str(tmp_path / "export.xlsx")))
+
+
+def test_batch_reports_from_an_export(tmp_path, portfolio, monkeypatch):
+    monkeypatch.setenv("GMP_USAGE_LOG_PATH", "")
+    export, output = str(tmp_path / "export.csv"), tmp_path / "out"
+    portfolio.sample(frac=1.0, random_state=2).to_csv(export, index=False)
+    assert main([export, str(output), "--skip-llm", "--chunk-rows", "30", "--percentile-table", ""]) == 1
+    assert main([export, str(output), "--skip-llm", "--chunk-rows", "30", "--unsorted",
+                 "--percentile-table", ""]) == 0
+    assert sorted(os.listdir(output)) == ["checkpoint.json", *[f"client-{i}" for i in range(5)],
+                                          "maturity_percentiles.npz"]
+
+    # Clients whose rows did not change are skipped on a rerun
+    outcome = run_export_batch(export, str(output), skip_llm=True, chunk_rows=30, grouped=False)
+    assert len(outcome["skipped"]) == 5 and outcome["done"] == []
@@ -0,0 +1,112 @@
+"""
+The assessment store: step-by-step saves, loading an analysis back with no LLM
+call, finding earlier runs of an upload, a client's history, and comparing two
+assessments of the same client.
+
+    python -m pytest tests
+"""
+import os
+
+import pandas as pd
+import pytest
+
+import assessment_store
+from assessment_store import AssessmentStore, compare_assessments, dataframe_hash, get_assessment_store
+from recommendation_agent import OVERALL_CATEGORY, calculate_maturity_levels, run_recommendation_analysis
+from synthetic import make_assessment
+
+GAPS = pd.DataFrame({'Heading': ["No first-party data"], 'Context': ["c"], 'Impact': ["i"]})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AssessmentStore(str(tmp_path / "store"))
+
+
+@pytest.fixture
+def df():
+    return make_assessment(rows=60, seed=8)
+
+
+def test_saved_step_by_step_and_loaded_back(store, df):
+    key = ("Acme", "2025-03-01", dataframe_hash(df))
+    results = run_recommendation_analysis(df)
+    store.save(*key, df, recommendation_results=results, step=1, rules_version=2, rules_hash="r")
+    store.save(*key, df, summary="Summary", bullet_summary="- Bullet", step=3)
+    store.save(*key, df, maturity_gaps=GAPS, step=2)
+
+    loaded = store.load(key)
+    assert loaded.df.equals(df)
+    assert (loaded.summary, loaded.bullet_summary, loaded.rules_hash) == ("Summary", "- Bullet", "r")
+    assert loaded.recommendation_results == results
+    assert loaded.maturity_gaps.equals(GAPS) and loaded.maturity_drivers is None
+    # A later save of an earlier step does not move the entry back
+    assert (loaded.entry.step, loaded.entry.rules_version, loaded.entry.rows) == (3, 2, len(df))
+    assert loaded.entry.overall_maturity == pytest.approx(calculate_maturity_levels(df).overall['maturity_level'])
+
+
+def test_answers_are_stored_once_per_content_hash(store, df):
+    content_hash = dataframe_hash(df)
+    store.save("Acme", "2025-03-01", content_hash, df)
+    store.save("Globex", "2025-04-01", content_hash, df)
+    assert os.listdir(os.path.join(store.root, "assessments")) == [f"{content_hash}.parquet"]
+    assert [entry.client for entry in store.find(content_hash)] == ["Globex", "Acme"]
+    assert store.find("unknown") == []
+
+
+def test_mixed_answer_types_survive_parquet(store, df):
+    df['Answer'] = df['Answer'].astype(object)
+    df.loc[0, 'Answer'] = 3
+    store.save("Acme", "2025-03-01", "edited", df)
+    assert store.load(("Acme", "2025-03-01", "edited")).df.loc[0, 'Answer'] == "3"
+
+
+def test_history_and_clients(store):
+    for client, date, seed in (("Acme", "2024-03-01", 1), ("Acme", "2025-03-01", 2), ("Globex", "2025-01-01", 3)):
+        assessment = make_assessment(rows=30, seed=seed)
+        store.save(client, date, dataframe_hash(assessment), assessment)
+    assert [entry.assessment_date for entry in store.history("Acme")] == ["2025-03-01", "2024-03-01"]
+    assert store.clients() == ["Acme", "Globex"]
+
+    reopened = AssessmentStore(store.root)
+    assert reopened.history("Acme") == store.history("Acme")
+
+
+def test_loading_an_unknown_entry_raises(store):
+    with pytest.raises(KeyError, match="no stored assessment for Acme"):
+        store.load(("Acme", "2025-03-01", "0" * 64))
+
+
+def test_comparison_of_two_assessments():
+    before = make_assessment(rows=60, seed=8)
+    after = before.copy()
+    after.loc[after['Category'] == "Business", 'Score'] = 3
+    after.loc[after.index[0], 'Answer'] = "a brand new answer"
+    comparison = compare_assessments(before, after, run_recommendation_analysis(before),
+                                     run_recommendation_analysis(after))
+
+    maturity = comparison.maturity.set_index('Category')
+    assert comparison.maturity['Category'].iloc[-1] == OVERALL_CATEGORY
+    assert maturity.loc["Business", 'change'] > 0
+    assert (maturity.drop(["Business", OVERALL_CATEGORY])['change'] == 0).all()
+    assert comparison.changed_questions == 1
+    assert compare_assessments(before, before).recommendations_added == []
+
+
+def test_recommendation_changes_between_assessments():
+    results = {"matched_recommendations": [{"recommendation": "Adopt Floodlight"}, {"recommendation": "Use SA360"}]}
+    later = {"matched_recommendations": [{"recommendation": "Use SA360"}, {"recommendation": "Connect GA4"}]}
+    df = make_assessment(rows=20, seed=1)
+    comparison = compare_assessments(df, df, results, later)
+    assert comparison.recommendations_added == ["Connect GA4"]
+    assert comparison.recommendations_removed == ["Adopt Floodlight"]
+    assert comparison.changed_questions == 0
+
+
+def test_blank_store_path_disables_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(assessment_store, "_store", None)
+    monkeypatch.setenv("GMP_STORE_PATH", "")
+    assert get_assessment_store() is None
+    monkeypatch.setenv("GMP_STORE_PATH", str(tmp_path / "store"))
+    assert get_assessment_store() is get_assessment_store()
+    assert os.path.exists(tmp_path / "store" / "index.sqlite3")
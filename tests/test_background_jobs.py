@@ -0,0 +1,145 @@
+"""
+The background job executor: jobs wait in submission order behind a capped pool,
+report their queue position and streamed progress, are cancelled cooperatively,
+and run in the submitting context so their calls hit the caller's ledger.
+
+    python -m pytest tests
+"""
+import threading
+import time
+from concurrent.futures import wait
+
+import pytest
+
+import llm_client
+from background_jobs import JobCancelled, JobExecutor, check_cancelled, collect_stream
+from llm_usage import UsageLedger, _current_ledger, get_current_ledger, set_current_ledger
+from recommendation_agent import create_chat_completion
+
+
+@pytest.fixture
+def executor():
+    executor = JobExecutor(max_workers=1)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def blocked(release, result="done"):
+    def step():
+        assert release.wait(5)
+        return result
+    return step
+
+
+def test_jobs_wait_in_submission_order(executor):
+    release = threading.Event()
+    first = executor.submit("summary", "Summary", blocked(release, "first"))
+    wait_until(lambda: first.status == "running")
+    second = executor.submit("bullets", "Bullet summary", lambda: "second")
+    third = executor.submit("gaps", "Gaps", lambda: "third")
+    assert (first.status, second.status, third.status) == ("running", "queued", "queued")
+    assert [executor.queue_position(job) for job in (first, second, third)] == [0, 0, 1]
+    assert not executor.has_idle_worker()
+
+    release.set()
+    wait([third.future])
+    assert [job.result() for job in (first, second, third)] == ["first", "second", "third"]
+    assert third.started_at >= second.finished_at
+    assert all(job.status == "done" for job in (first, second, third))
+    assert executor.has_idle_worker()
+
+
+def test_a_queued_job_is_dropped_when_cancelled(executor):
+    release = threading.Event()
+    executor.submit("summary", "Summary", blocked(release))
+    ran = []
+    queued = executor.submit("bullets", "Bullet summary", lambda: ran.append(True))
+    queued.cancel()
+    release.set()
+    executor.shutdown(wait=True)
+    assert queued.status == "cancelled" and not ran
+    with pytest.raises(JobCancelled, match="Bullet summary was cancelled"):
+        queued.result()
+
+
+def test_a_running_job_stops_at_its_next_chunk(executor):
+    release = threading.Event()
+
+    def chunks():
+        yield "The advertiser "
+        yield "uses DV360"
+        assert release.wait(5)
+        yield " and SA360."
+        yield " Never reached."
+
+    job = executor.submit("summary", "Summary", lambda: collect_stream(chunks()))
+    wait_until(lambda: job.progress_text() == "The advertiser uses DV360")
+    job.cancel()
+    assert job.status == "cancelling"
+    release.set()
+    wait([job.future])
+    assert job.status == "cancelled"
+    # The chunk that arrived after the cancel is not reported
+    assert job.progress_text() == "The advertiser uses DV360"
+    with pytest.raises(JobCancelled):
+        job.result()
+
+
+def test_result_of_a_call_in_flight_at_cancel_is_discarded(executor):
+    release = threading.Event()
+    job = executor.submit("summary", "Summary", blocked(release))
+    wait_until(lambda: job.status == "running")
+    job.cancel()
+    release.set()
+    wait([job.future])
+    assert job.status == "cancelled" and job.elapsed() > 0
+
+
+def test_a_cancelled_job_sends_no_further_request(executor, monkeypatch):
+    monkeypatch.setattr(llm_client, "get_openai_client", lambda: pytest.fail("request sent after cancel"))
+    release = threading.Event()
+
+    def step():
+        assert release.wait(5)
+        return create_chat_completion([{"role": "user", "content": "Summarise."}], use_cache=False)
+
+    job = executor.submit("summary", "Summary", step)
+    wait_until(lambda: job.status == "running")
+    job.cancel()
+    release.set()
+    wait([job.future])
+    assert job.status == "cancelled"
+
+
+def test_a_failing_job_reraises_its_error(executor):
+    def step():
+        raise ConnectionError("OpenAI unreachable")
+
+    job = executor.submit("summary", "Summary", step)
+    wait([job.future])
+    assert job.status == "failed"
+    with pytest.raises(ConnectionError, match="OpenAI unreachable"):
+        job.result()
+
+
+def test_jobs_run_in_the_submitting_context(executor):
+    ledger = UsageLedger(log_path="")
+    token = set_current_ledger(ledger)
+    try:
+        job = executor.submit("summary", "Summary", get_current_ledger)
+    finally:
+        _current_ledger.reset(token)
+    assert job.result() is ledger
+    assert executor.submit("summary", "Summary", get_current_ledger).result() is None
+
+
+def test_check_cancelled_outside_a_job_is_a_no_op():
+    check_cancelled()
+    assert collect_stream(iter(["a", "b"])) == "ab"
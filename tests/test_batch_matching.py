@@ -0,0 +1,64 @@
+"""
+run_batch_recommendation_analysis against the original per-row loop, client by
+client, on a portfolio with roughened answers and rows without a client id.
+
+    python -m pytest tests
+"""
+import pandas as pd
+
+from batch_matching import run_batch_recommendation_analysis
+from matching_reference import assert_same_results, baseline_analysis, roughen
+from recommendation_agent import compile_rule_plan, get_rule_set
+from synthetic import make_portfolio
+
+RESULT_COLUMNS = ['recommendation', 'overview', 'gmp_impact', 'business_impact', 'score', 'maxweight']
+
+
+def client_results(batch, client, client_column='ClientId'):
+    matches = batch.matches[batch.matches[client_column] == client].sort_values('rule_index')
+    totals = batch.totals.set_index(client_column).loc[client]
+    return {
+        'matched_recommendations': matches[RESULT_COLUMNS].to_dict('records'),
+        'total_matched_recommendations': totals['total_matched_recommendations'],
+        'total_score': totals['total_score'],
+        'total_max_score': totals['total_max_score']
+    }
+
+
+def test_batch_analysis_matches_baseline_per_client():
+    rules = get_rule_set().rules
+    portfolio = roughen(make_portfolio(25, seed=7, max_selections=4), seed=7)
+    portfolio['ClientId'] = portfolio['ClientId'].astype(object)
+    # Rows without a client id belong to no client
+    portfolio.loc[portfolio.sample(frac=0.1, random_state=1).index, 'ClientId'] = None
+
+    batch = run_batch_recommendation_analysis(portfolio)
+    clients = portfolio['ClientId'].dropna().unique()
+    assert sorted(batch.totals['ClientId']) == sorted(clients)
+    for client in clients:
+        rows = portfolio[portfolio['ClientId'] == client].reset_index(drop=True)
+        assert_same_results(client_results(batch, client), baseline_analysis(rows, rules))
+
+
+def test_custom_client_column_and_rule_plan():
+    rules = [{"question": "Uses DV360?", "answer": "yes", "recommendation": "A"},
+             {"set_id": "g", "recommendation": "B", "questions": [
+                 {"question": "Uses DV360?", "answer": "yes"},
+                 {"question": "Uses CM360?", "answer": ["no", "n/a"], "type": "negative_choice"}]}]
+    portfolio = pd.DataFrame({
+        'Account': [7, 7, 8, 8, 9],
+        'Question': ["Uses DV360?", "Uses CM360?", "uses dv360? ", "Uses CM360?", "Uses CM360?"],
+        'Answer': ["Yes", "yes", "yes", "N/A", "yes"],
+        'Score': [1, 2, 3, 4, 5],
+        'MaxWeight': 5
+    })
+    batch = run_batch_recommendation_analysis(portfolio, client_column='Account', plan=compile_rule_plan(rules))
+    for client in (7, 8, 9):
+        rows = portfolio[portfolio['Account'] == client].reset_index(drop=True)
+        assert_same_results(client_results(batch, client, 'Account'), baseline_analysis(rows, rules))
+    assert list(batch.matches[batch.matches['Account'] == 7]['recommendation']) == ["A", "B"]
+
+
+def test_empty_portfolio():
+    batch = run_batch_recommendation_analysis(make_portfolio(2).iloc[0:0])
+    assert batch.matches.empty and batch.totals.empty
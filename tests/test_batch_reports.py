@@ -0,0 +1,96 @@
+"""
+The headless batch runner on a folder of synthetic assessment CSVs: the report
+files it writes (with the LLM sections from the in-process stub server), its
+checkpoint, and which clients a rerun skips.
+
+    python -m pytest tests
+"""
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import batch_reports
+from batch_reports import Checkpoint, main, run_batch
+from fake_llm import stub_server  # noqa: F401 (fixture)
+from synthetic import make_assessment, write_assessment_csvs
+
+REPORT_FILES = ["bullet_summary.md", "drivers.csv", "gaps.csv", "maturity.csv", "recommendations.csv",
+                "results.json", "summary.md"]
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    monkeypatch.setenv("GMP_USAGE_LOG_PATH", "")
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    write_assessment_csvs(str(input_dir), 3, rows=40, seed=2)
+    return input_dir, output_dir
+
+
+def test_reports_for_every_client(stub_server, folders):
+    input_dir, output_dir = folders
+    outcome = run_batch(str(input_dir), str(output_dir), workers=2)
+    assert sorted(outcome["done"]) == ["client-0", "client-1", "client-2"]
+    for client in outcome["done"]:
+        client_dir = output_dir / client
+        assert sorted(os.listdir(client_dir)) == REPORT_FILES
+        results = json.loads((client_dir / "results.json").read_text())
+        assert results["llm_usage"]["calls"] == 3 and results["llm_usage"]["cost"] > 0
+        assert (client_dir / "summary.md").read_text()
+        assert len(pd.read_csv(client_dir / "gaps.csv")) == 5
+        maturity = pd.read_csv(client_dir / "maturity.csv")
+        assert maturity['Category'].iloc[-1] == "Overall"
+        assert results["maturity_level"] == pytest.approx(maturity['maturity_level'].iloc[-1])
+    assert (output_dir / "maturity_percentiles.npz").exists()
+
+
+def test_rerun_skips_unchanged_clients(folders):
+    input_dir, output_dir = folders
+    assert len(run_batch(str(input_dir), str(output_dir), skip_llm=True)["done"]) == 3
+    assert sorted(os.listdir(output_dir / "client-0")) == ["maturity.csv", "recommendations.csv", "results.json"]
+
+    make_assessment(rows=40, seed=99).to_csv(input_dir / "client-1.csv", index=False)
+    outcome = run_batch(str(input_dir), str(output_dir), skip_llm=True)
+    assert (outcome["done"], sorted(outcome["skipped"])) == (["client-1"], ["client-0", "client-2"])
+
+    outcome = run_batch(str(input_dir), str(output_dir), skip_llm=True, force=True)
+    assert len(outcome["done"]) == 3
+
+    checkpoint = Checkpoint(str(output_dir / "checkpoint.json"))
+    entry = checkpoint.entries["client-1"]
+    assert entry["status"] == "done" and entry["skip_llm"] is True
+    assert entry["input_hash"] == batch_reports.file_sha256(str(input_dir / "client-1.csv"))
+
+
+def test_checkpoint_currency():
+    checkpoint = Checkpoint.__new__(Checkpoint)
+    checkpoint.entries = {
+        "done": {"status": "done", "input_hash": "h", "rules_hash": "r", "skip_llm": False},
+        "recommendations-only": {"status": "done", "input_hash": "h", "rules_hash": "r", "skip_llm": True},
+        "failed": {"status": "failed", "input_hash": "h"}
+    }
+    assert checkpoint.is_current("done", "h", rules_hash="r")
+    assert checkpoint.is_current("done", "h", skip_llm=True, rules_hash="r")
+    assert not checkpoint.is_current("done", "changed", rules_hash="r")
+    # Recommendations from an older rule file are out of date
+    assert not checkpoint.is_current("done", "h", rules_hash="new rules")
+    # A recommendations-only run does not satisfy a full one
+    assert checkpoint.is_current("recommendations-only", "h", skip_llm=True, rules_hash="r")
+    assert not checkpoint.is_current("recommendations-only", "h", rules_hash="r")
+    assert not checkpoint.is_current("failed", "h")
+    assert not checkpoint.is_current("unknown", "h")
+
+
+def test_failed_clients_are_retried(folders, monkeypatch):
+    input_dir, output_dir = folders
+    monkeypatch.setenv("GMP_PERCENTILE_TABLE_PATH", "")
+    (input_dir / "broken.csv").write_text("Category,Question\nMedia,Uses DV360?\n")
+    assert main([str(input_dir), str(output_dir), "--skip-llm", "--workers", "2"]) == 1
+    entry = Checkpoint(str(output_dir / "checkpoint.json")).entries["broken"]
+    assert entry["status"] == "failed" and "Score" in entry["error"]
+
+    outcome = run_batch(str(input_dir), str(output_dir), skip_llm=True)
+    assert outcome["failed"] == ["broken"] and len(outcome["skipped"]) == 3
+    os.remove(input_dir / "broken.csv")
+    assert main([str(input_dir), str(output_dir), "--skip-llm"]) == 0
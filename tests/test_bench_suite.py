@@ -0,0 +1,105 @@
+"""
+The synthetic assessment generator (deterministic, drawn from the rule set's
+vocabulary) and the benchmark suite's JSON results and commit comparison.
+
+    python -m pytest tests
+"""
+import json
+
+import pandas as pd
+import pytest
+
+import bench_suite
+from recommendation_agent import get_rule_set, run_recommendation_analysis
+from synthetic import COLUMNS, EXTRA_ANSWERS, answer_vocabulary, make_assessment, make_portfolio, write_assessment_csvs
+
+
+def test_assessments_are_deterministic_per_seed():
+    assert make_assessment(rows=80, seed=4).equals(make_assessment(rows=80, seed=4))
+    assert not make_assessment(rows=80, seed=4).equals(make_assessment(rows=80, seed=5))
+    assert make_portfolio(3, rows=20, seed=1).equals(make_portfolio(3, rows=20, seed=1))
+
+
+def test_answers_come_from_the_rule_set():
+    vocabulary = answer_vocabulary()
+    rule_questions = {sub_item['question'] for item in get_rule_set().rules for sub_item in item.get('questions', [item])}
+    assert set(vocabulary) == rule_questions
+    assert all(set(EXTRA_ANSWERS) <= set(answers) for answers in vocabulary.values())
+
+    df = make_assessment(seed=1)
+    assert tuple(df.columns) == COLUMNS
+    assert all(answer in vocabulary[question] for question, answer in zip(df['Question'], df['Answer']))
+    # Real rule questions and answers, so the generated assessments match real rules
+    assert run_recommendation_analysis(df)
+
+
+def test_rows_mix_selections_and_comments():
+    df = make_assessment(rows=500, seed=2, category_mix={"Media": 1.0}, max_selections=1, comment_rate=0.0)
+    assert len(df) == 500
+    assert set(df['Category']) == {"Media"}
+    assert df['Comment'].isna().all()
+    assert not df.duplicated(['Question']).any()
+    assert df['Question'].str.startswith("additional assessment question").any()
+
+    df = make_assessment(rows=500, seed=2, max_selections=3, comment_rate=1.0)
+    assert df.duplicated(['Question']).any()
+    assert df['Comment'].notna().all()
+    # Rows of one multi-select question share its category, score and comment
+    assert (df.groupby('Question')[['Category', 'Score', 'Comment']].nunique() == 1).all().all()
+
+
+def test_portfolio_and_csv_files(tmp_path):
+    portfolio = make_portfolio(4, rows=25, seed=3)
+    assert list(portfolio['ClientId'].unique()) == [f"client-{i}" for i in range(4)]
+    assert (portfolio.groupby('ClientId').size() >= 25).all()
+
+    paths = write_assessment_csvs(str(tmp_path), 2, rows=25, seed=3)
+    assert [p.rsplit("/", 1)[-1] for p in paths] == ["client-0.csv", "client-1.csv"]
+    assert list(pd.read_csv(paths[0]).columns) == list(COLUMNS)
+
+
+def result(stage, median_ms, size=100):
+    return {"stage": stage, "size_kind": "rows", "size": size, "median_ms": median_ms, "min_ms": median_ms, "repeat": 1}
+
+
+def test_compare_flags_stages_slower_than_the_threshold():
+    baseline = {"meta": {"commit": "abc"}, "results": [result("a", 10.0), result("b", 10.0), result("c", 0.0)]}
+    current = {"results": [result("a", 11.0), result("b", 13.0), result("c", 5.0), result("new", 1.0),
+                           result("a", 50.0, size=500)]}
+    assert [r["stage"] for r in bench_suite.compare(baseline, current, threshold=1.2)] == ["b"]
+    assert bench_suite.compare(baseline, current, threshold=1.5) == []
+
+
+def test_suite_writes_json_and_compares_against_it(tmp_path, capsys):
+    args = ["--rows", "30", "--clients", "5", "--items", "2", "--repeat", "1"]
+    before = tmp_path / "before.json"
+    assert bench_suite.main(args + ["--output", str(before)]) == 0
+    report = json.loads(before.read_text())
+    stages = {r["stage"] for r in report["results"]}
+    for stage in ("ingest_csv", "run_recommendation_analysis", "build_prompt_payload", "parse_gaps_drivers_json",
+                  "render_pdf", "run_batch_recommendation_analysis"):
+        assert stage in stages
+    assert all(r["median_ms"] >= 0 and r["repeat"] == 1 for r in report["results"])
+    tokens = report["prompt_tokens"][0]
+    assert tokens["rows"] == 30 and tokens["payload_tokens"] < tokens["legacy_tokens"]
+    assert report["meta"]["repeat"] == 1
+
+    # Every stage 1000x slower in the baseline, so nothing regresses
+    for r in report["results"]:
+        r["median_ms"] = r["median_ms"] * 1000 + 1000
+    before.write_text(json.dumps(report))
+    assert bench_suite.main(args + ["--output", str(tmp_path / "after.json"), "--compare", str(before)]) == 0
+    assert "compared with" in capsys.readouterr().out
+
+    for r in report["results"]:
+        r["median_ms"] = 1e-6
+    before.write_text(json.dumps(report))
+    assert bench_suite.main(args + ["--output", str(tmp_path / "after.json"), "--compare", str(before)]) == 1
+
+
+@pytest.mark.parametrize("repeat", [1, 3])
+def test_time_stage_warms_up_then_times_repeat_runs(repeat):
+    calls = []
+    timing = bench_suite.time_stage(lambda: calls.append(1), repeat)
+    assert len(calls) == repeat + 1
+    assert timing["repeat"] == repeat and 0 <= timing["min_ms"] <= timing["median_ms"]
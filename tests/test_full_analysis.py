@@ -0,0 +1,117 @@
+"""
+generate_full_analysis: its stages run concurrently up to max_concurrency, each
+result lands in its FullAnalysis field, a failing stage is raised once the others
+finish, and every stage is metered against the caller's run ledger.
+
+    python -m pytest tests
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from fake_llm import completion, install
+from llm_usage import UsageLedger, _current_ledger, set_current_ledger
+from recommendation_agent import (BULLET_SUMMARY_TASK, CATEGORY_SUMMARY_TASK, MATURITY_DRIVERS_TASK,
+                                  MATURITY_GAPS_TASK, build_analysis_payload, generate_full_analysis)
+from synthetic import make_assessment
+
+GAPS_JSON = json.dumps({
+    "gaps": [{"heading": "No first-party data", "context": "c", "impact": "i"}],
+    "drivers": [{"heading": "DV360 adoption", "context": "c", "impact": "i"},
+                {"heading": "", "context": "dropped", "impact": "dropped"}]
+})
+
+
+def markdown(heading):
+    return f"1. **Heading**: {heading}\n   **Context**: c\n   **Impact**: i"
+
+
+class SlowModel:
+    """
+    Answers each stage after delay seconds and tracks how many calls overlap.
+    """
+
+    def __init__(self, delay=0.05, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.finished = []
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        prompt = request["messages"][-1]["content"]
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if self.fail_on and self.fail_on in prompt:
+                raise ConnectionError("stage failed")
+            if "response_format" in request:
+                return completion(GAPS_JSON)
+            for task, text in ((CATEGORY_SUMMARY_TASK, "summary"), (BULLET_SUMMARY_TASK, "- bullet"),
+                               (MATURITY_GAPS_TASK, markdown("Gap")), (MATURITY_DRIVERS_TASK, markdown("Driver"))):
+                if prompt.endswith(task):
+                    return completion(text)
+            raise AssertionError("unexpected prompt")
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.finished.append(prompt[-40:])
+
+
+@pytest.fixture
+def df():
+    return make_assessment(rows=60, seed=2)
+
+
+@pytest.fixture
+def payload(df):
+    return build_analysis_payload(df, mode="single")
+
+
+def test_structured_stages_run_concurrently(monkeypatch, df, payload):
+    model = SlowModel()
+    transport = install(monkeypatch, model)
+    analysis = generate_full_analysis(df, use_cache=False, payload=payload)
+    assert len(transport.requests) == 3 and model.max_in_flight == 3
+    assert (analysis.summary, analysis.bullet_summary) == ("summary", "- bullet")
+    assert list(analysis.maturity_gaps['Heading']) == ["No first-party data"]
+    assert list(analysis.maturity_drivers['Heading']) == ["DV360 adoption"]
+
+
+def test_markdown_stages_respect_max_concurrency(monkeypatch, df, payload):
+    model = SlowModel()
+    transport = install(monkeypatch, model)
+    analysis = generate_full_analysis(df, max_concurrency=2, use_cache=False, payload=payload, structured=False)
+    assert len(transport.requests) == 4 and model.max_in_flight == 2
+    assert list(analysis.maturity_gaps['Heading']) == ["Gap"]
+    assert list(analysis.maturity_drivers['Heading']) == ["Driver"]
+
+    model = SlowModel(delay=0.01)
+    install(monkeypatch, model)
+    generate_full_analysis(df, max_concurrency=1, use_cache=False, payload=payload, structured=False)
+    assert model.max_in_flight == 1
+
+
+def test_failing_stage_is_raised_after_the_others_finish(monkeypatch, df, payload):
+    model = SlowModel(fail_on=CATEGORY_SUMMARY_TASK)
+    install(monkeypatch, model)
+    with pytest.raises(ConnectionError, match="stage failed"):
+        generate_full_analysis(df, use_cache=False, payload=payload)
+    assert len(model.finished) == 3 and model.in_flight == 0
+
+
+def test_stages_are_metered_against_the_current_ledger(monkeypatch, df, payload):
+    install(monkeypatch, SlowModel(delay=0.0))
+    ledger = UsageLedger(log_path="")
+    token = set_current_ledger(ledger)
+    try:
+        generate_full_analysis(df, use_cache=False, payload=payload)
+    finally:
+        _current_ledger.reset(token)
+    assert sorted(record.label for record in ledger.records) == ["bullet_summary", "category_summary",
+                                                                 "gaps_and_drivers"]
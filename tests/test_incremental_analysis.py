@@ -0,0 +1,87 @@
+"""
+IncrementalRecommendationAnalysis after answer edits against a fresh analysis and
+the original per-row loop, and the change detection edits rely on.
+
+    python -m pytest tests
+"""
+import random
+
+import pandas as pd
+
+from matching_reference import assert_same_results, baseline_analysis
+from prompt_payload import build_prompt_payload
+from recommendation_agent import (IncrementalRecommendationAnalysis, build_answer_map, compile_rule_plan,
+                                  diff_answer_maps, get_rule_set, stale_analysis_sections)
+from synthetic import make_assessment
+
+
+def test_incremental_analysis_matches_baseline_after_edits():
+    rules = get_rule_set().rules
+    rng = random.Random(5)
+    df = make_assessment(seed=5, max_selections=4)
+    analysis = IncrementalRecommendationAnalysis.from_dataframe(df)
+    assert_same_results(analysis.results(), baseline_analysis(df, rules))
+
+    for step in range(20):
+        df = df.copy()
+        other = make_assessment(seed=1000 + step, max_selections=4)
+        edit = rng.choice(["answer", "score", "drop", "add"])
+        if edit == "answer":
+            df.loc[rng.randrange(len(df)), 'Answer'] = rng.choice(list(other['Answer']) + [None, "n/a"])
+        elif edit == "score":
+            df.loc[rng.randrange(len(df)), 'Score'] = rng.choice([0, 3, -1])
+        elif edit == "drop":
+            df = df.drop(index=df.index[rng.randrange(len(df))]).reset_index(drop=True)
+        else:
+            df = pd.concat([df, other.sample(3, random_state=step)], ignore_index=True)
+        analysis.update_from_dataframe(df)
+        expected = baseline_analysis(df, rules)
+        assert_same_results(analysis.results(), expected)
+        assert_same_results(IncrementalRecommendationAnalysis.from_dataframe(df).results(), expected)
+
+
+def test_diff_answer_maps():
+    before = pd.DataFrame({'Question': ["A?", "B?", "C?"], 'Answer': ["x", "y", "z"], 'Score': 1, 'MaxWeight': 2})
+    after = pd.DataFrame({'Question': ["A?", "B?", "D?"], 'Answer': ["x", "Y ", "w"], 'Score': [1, 2, 1], 'MaxWeight': 2})
+    changes = diff_answer_maps(build_answer_map(before), build_answer_map(after))
+    # "Y " normalizes to "y", so only B's score changed
+    assert changes == {"b?": (frozenset({"y"}), 2.0, 2.0), "d?": (frozenset({"w"}), 1.0, 2.0), "c?": None}
+
+
+def test_only_rules_on_edited_questions_are_reevaluated():
+    plan = compile_rule_plan([
+        {"question": "A?", "answer": "yes", "recommendation": "A"},
+        {"question": "B?", "answer": "yes", "recommendation": "B"},
+        {"set_id": "ab", "recommendation": "AB", "questions": [
+            {"question": "A?", "answer": "yes"}, {"question": "B?", "answer": "yes"}]}
+    ])
+    df = pd.DataFrame({'Question': ["A?", "B?"], 'Answer': ["yes", "no"], 'Score': [1, 2], 'MaxWeight': 3})
+    analysis = IncrementalRecommendationAnalysis.from_dataframe(df, plan)
+    assert [match['recommendation'] for match in analysis.results()['matched_recommendations']] == ["A"]
+
+    df.loc[1, 'Answer'] = "yes"
+    assert analysis.update_from_dataframe(df) == {1, 2}
+    results = analysis.results()
+    assert [match['recommendation'] for match in results['matched_recommendations']] == ["A", "B", "AB"]
+    assert results['total_score'] == 1 + 2 + 3
+    assert analysis.update_from_dataframe(df) == set()
+
+
+def test_stale_sections_follow_the_prompt_input():
+    df = make_assessment(seed=8)
+    payload = build_prompt_payload(df)
+    rescored = df.copy()
+    rescored['Score'] = 0
+    assert stale_analysis_sections(payload, build_prompt_payload(rescored)) == set()
+
+    business = df.copy()
+    business['Category'] = business['Category'].astype(object)
+    row = business.index[business['Category'] == "Business"][0]
+    business.loc[row, 'Answer'] = "an answer no rule knows"
+    assert stale_analysis_sections(payload, build_prompt_payload(business)) == {"maturity_gaps", "maturity_drivers"}
+
+    other = df.copy()
+    row = other.index[other['Category'] != "Business"][0]
+    other.loc[row, 'Answer'] = "an answer no rule knows"
+    assert stale_analysis_sections(payload, build_prompt_payload(other)) == {
+        "summary", "bullet_summary", "maturity_gaps", "maturity_drivers"}
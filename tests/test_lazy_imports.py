@@ -0,0 +1,45 @@
+"""
+The matching core imports and runs without the LLM, PDF or UI dependencies, each
+checked in a fresh interpreter.
+
+    python -m pytest tests
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bench_import_time import HEAVY_MODULES, REPO_ROOT
+
+MATCH_AN_ASSESSMENT = """
+import sys
+sys.path.insert(0, "benchmarks")
+import recommendation_agent
+from synthetic import make_assessment
+df = make_assessment(rows=50, seed=1)
+recommendation_agent.run_recommendation_analysis(df)
+recommendation_agent.calculate_maturity_levels(df)
+"""
+
+
+def loaded_heavy_modules(statement):
+    child = f"{statement}\nimport json, sys\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", child], cwd=REPO_ROOT, check=True, capture_output=True, text=True,
+                            env=dict(os.environ, GMP_RULES_POLL_SECONDS="0")).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("statement", [
+    "import recommendation_agent",
+    "import batch_matching",
+    MATCH_AN_ASSESSMENT
+])
+def test_matching_core_loads_no_heavy_modules(statement):
+    assert loaded_heavy_modules(statement) == []
+
+
+def test_llm_and_pdf_modules_load_on_first_use():
+    loaded = loaded_heavy_modules("import recommendation_agent, llm_client, report_pdf")
+    assert "openai" in loaded and "fpdf" in loaded
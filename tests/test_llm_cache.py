@@ -0,0 +1,142 @@
+"""
+LLMResponseCache eviction and expiry against a temp-dir SQLite file, and the
+cache writes create_chat_completion and stream_chat_completion skip for
+responses cut off at max_tokens.
+
+    python -m pytest tests
+"""
+import pytest
+
+import llm_cache
+from fake_llm import completion, install, llm_cache_path, stream  # noqa: F401 (fixture)
+from llm_cache import LLMResponseCache, get_llm_cache, make_cache_key
+from recommendation_agent import LLM_MODEL, create_chat_completion, stream_chat_completion
+
+MESSAGES = [{"role": "user", "content": "Summarise the assessment"}]
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+def test_make_cache_key_covers_the_whole_request():
+    key = make_cache_key(LLM_MODEL, MESSAGES, 0.7, 100)
+    assert key == make_cache_key(LLM_MODEL, [dict(MESSAGES[0])], 0.7, 100)
+    assert key != make_cache_key("gpt-4.1-nano", MESSAGES, 0.7, 100)
+    assert key != make_cache_key(LLM_MODEL, MESSAGES, 0.7, 200)
+    assert key != make_cache_key(LLM_MODEL, MESSAGES, 0.7, 100, {"type": "json_object"})
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "nested" / "cache.sqlite3"))
+    assert cache.get("a") is None
+    cache.set("a", {"text": "ü", "items": [1, 2]})
+    assert cache.get("a") == {"text": "ü", "items": [1, 2]}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_past_max_entries(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    for i, key in enumerate("abc"):
+        clock.now = 1000.0 + i
+        cache.set(key, key)
+    clock.now = 1010.0
+    assert cache.get("a") == "a"   # now "b" is the least recently used
+    clock.now = 1011.0
+    cache.set("d", "d")
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a", "c", "d"]
+    assert cache.stats()["entries"] == 3
+
+
+def test_entries_are_evicted_past_max_bytes(tmp_path, clock):
+    value = "x" * 100
+    size = len(llm_cache.json.dumps(value))
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=2 * size + 10)
+    for i, key in enumerate("abc"):
+        clock.now = 1000.0 + i
+        cache.set(key, value)
+    assert cache.get("a") is None
+    assert cache.get("b") == value and cache.get("c") == value
+    assert cache.stats()["bytes"] == 2 * size
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    cache.set("a", "old")
+    clock.now += 30
+    cache.set("b", "new")
+    clock.now += 40
+    # Reading does not extend an entry's life
+    assert cache.get("a") is None
+    assert cache.get("b") == "new"
+    clock.now += 31
+    cache.set("c", "newest")
+    assert cache.stats()["entries"] == 1
+
+
+def test_empty_path_disables_the_cache(monkeypatch):
+    monkeypatch.setenv("GMP_LLM_CACHE_PATH", "")
+    monkeypatch.setattr(llm_cache, "_cache", None)
+    assert get_llm_cache() is None
+
+
+def test_cache_settings_come_from_the_environment(llm_cache_path, monkeypatch):
+    monkeypatch.setenv("GMP_LLM_CACHE_MAX_ENTRIES", "5")
+    monkeypatch.setenv("GMP_LLM_CACHE_TTL_SECONDS", "1.5")
+    cache = get_llm_cache()
+    assert cache is get_llm_cache()
+    assert (cache.path, cache.max_entries, cache.ttl_seconds) == (str(llm_cache_path), 5, 1.5)
+
+
+@pytest.mark.parametrize("finish_reason, cached", [("stop", True), (None, True), ("length", False)])
+def test_create_chat_completion_caches_only_complete_responses(llm_cache_path, monkeypatch, finish_reason, cached):
+    transport = install(monkeypatch, lambda request: completion("the summary", finish_reason))
+    assert create_chat_completion(MESSAGES, max_tokens=50) == "the summary"
+    assert create_chat_completion(MESSAGES, max_tokens=50) == "the summary"
+    assert len(transport.requests) == (1 if cached else 2)
+    assert get_llm_cache().stats()["entries"] == (1 if cached else 0)
+
+
+def test_use_cache_false_always_calls_the_api(llm_cache_path, monkeypatch):
+    transport = install(monkeypatch, lambda request: completion("fresh"))
+    create_chat_completion(MESSAGES, max_tokens=50)
+    assert create_chat_completion(MESSAGES, max_tokens=50, use_cache=False) == "fresh"
+    assert len(transport.requests) == 2
+
+
+@pytest.mark.parametrize("finish_reason, cached", [("stop", True), ("length", False)])
+def test_stream_chat_completion_caches_only_complete_streams(llm_cache_path, monkeypatch, finish_reason, cached):
+    transport = install(monkeypatch, lambda request: stream(["the ", "summary"], finish_reason, usage=(20, 2)))
+    assert list(stream_chat_completion(MESSAGES, max_tokens=50)) == ["the ", "summary"]
+    second = list(stream_chat_completion(MESSAGES, max_tokens=50))
+    if cached:
+        # A cached response is replayed as one chunk, without a request
+        assert second == ["the summary"]
+        assert len(transport.requests) == 1
+    else:
+        assert second == ["the ", "summary"]
+        assert len(transport.requests) == 2
+        assert get_llm_cache().stats()["entries"] == 0
+
+
+def test_failed_stream_is_not_cached(llm_cache_path, monkeypatch):
+    install(monkeypatch, lambda request: stream(["the ", "summary"], fail_after=1))
+    chunks = []
+    with pytest.raises(ConnectionError):
+        for chunk in stream_chat_completion(MESSAGES, max_tokens=50):
+            chunks.append(chunk)
+    assert chunks == ["the "]
+    assert get_llm_cache().stats()["entries"] == 0
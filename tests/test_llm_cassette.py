@@ -0,0 +1,133 @@
+"""
+Recording chat completions from the stub server to cassettes and replaying them
+with no server or API key, plus the stub's deterministic, schema-shaped answers.
+
+    python -m pytest tests
+"""
+import json
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+
+import llm_cassette
+import llm_client
+from fake_llm import stub_server  # noqa: F401 (fixture)
+from llm_cassette import CassetteMissError, CassetteStore, get_transport_mode
+from llm_stub_server import generate_content
+from recommendation_agent import create_chat_completion, stream_chat_completion
+
+MESSAGES = [{"role": "user", "content": "Summarise the advertiser's GMP setup."}]
+
+
+@pytest.fixture
+def cassette_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("GMP_LLM_CASSETTE_DIR", str(tmp_path / "cassettes"))
+    monkeypatch.delenv("GMP_LLM_REPLAY_SPEED", raising=False)
+    monkeypatch.setattr(llm_cassette, "_store", None)
+    return tmp_path / "cassettes"
+
+
+def go_offline(monkeypatch):
+    # Replay must not need the network, an API key or the shared client
+    monkeypatch.setenv("GMP_LLM_TRANSPORT", "replay")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(llm_client, "get_openai_client", lambda: pytest.fail("replay used the client"))
+
+
+def test_record_then_replay_offline(stub_server, cassette_dir, monkeypatch):
+    monkeypatch.setenv("GMP_LLM_TRANSPORT", "record")
+    text = create_chat_completion(MESSAGES, max_tokens=50)
+    chunks = list(stream_chat_completion(MESSAGES, max_tokens=50))
+    assert len(os.listdir(cassette_dir)) == 2
+
+    stub_server.stop()
+    go_offline(monkeypatch)
+    assert create_chat_completion(MESSAGES, max_tokens=50) == text
+    assert list(stream_chat_completion(MESSAGES, max_tokens=50)) == chunks
+
+    with pytest.raises(CassetteMissError, match="GMP_LLM_TRANSPORT=record"):
+        create_chat_completion(MESSAGES, max_tokens=51)
+
+
+def test_cassettes_hold_the_request_and_stream_timing(stub_server, cassette_dir, monkeypatch):
+    monkeypatch.setenv("GMP_LLM_TRANSPORT", "record")
+    list(stream_chat_completion(MESSAGES, max_tokens=50))
+    (name,) = os.listdir(cassette_dir)
+    cassette = json.loads((cassette_dir / name).read_text())
+    assert name == f"{llm_cassette.request_key(cassette['request'])}.json"
+    assert cassette["stream"] is True and cassette["request"]["messages"] == MESSAGES
+    assert len(cassette["offsets"]) == len(cassette["response"])
+    assert cassette["offsets"] == sorted(cassette["offsets"])
+
+
+def test_a_stream_abandoned_midway_is_not_recorded(stub_server, cassette_dir, monkeypatch):
+    monkeypatch.setenv("GMP_LLM_TRANSPORT", "record")
+    chunks = stream_chat_completion(MESSAGES, max_tokens=50, use_cache=False)
+    next(chunks)
+    chunks.close()
+    assert not cassette_dir.exists() or os.listdir(cassette_dir) == []
+
+
+def test_replay_speed_reproduces_the_recorded_latency(tmp_path, monkeypatch):
+    request = {"model": "m", "messages": MESSAGES}
+    store = CassetteStore(str(tmp_path), replay_speed=2.0)
+    completion = {"id": "c", "object": "chat.completion", "created": 0, "model": "m", "choices": [
+        {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "hello"}}]}
+    store._write(request, {"stream": False, "response": completion, "elapsed": 0.5})
+    sleeps = []
+    monkeypatch.setattr(llm_cassette.time, "sleep", sleeps.append)
+    assert store.replay(request).choices[0].message.content == "hello"
+    assert sleeps == [0.25]
+    CassetteStore(str(tmp_path)).replay(request)
+    assert sleeps == [0.25]
+
+
+@pytest.mark.parametrize("value, mode", [(None, "live"), ("", "live"), (" Replay ", "replay"), ("record", "record")])
+def test_transport_mode(monkeypatch, value, mode):
+    if value is None:
+        monkeypatch.delenv("GMP_LLM_TRANSPORT", raising=False)
+    else:
+        monkeypatch.setenv("GMP_LLM_TRANSPORT", value)
+    assert get_transport_mode() == mode
+
+
+def test_unknown_transport_mode_is_rejected(monkeypatch):
+    monkeypatch.setenv("GMP_LLM_TRANSPORT", "stub")
+    with pytest.raises(ValueError, match="live, record, replay"):
+        get_transport_mode()
+
+
+def test_stub_content_is_deterministic_and_schema_shaped():
+    request = {"messages": MESSAGES, "max_tokens": 40}
+    assert generate_content(request) == generate_content(dict(request))
+    assert generate_content(request) != generate_content({**request, "messages": [{"role": "user", "content": "x"}]})
+    assert len(generate_content(request).split()) == 40
+
+    schema = {"type": "object", "properties": {
+        "gaps": {"type": "array", "items": {"type": "object", "properties": {"heading": {"type": "string"}}}},
+        "score": {"type": "integer"}
+    }}
+    content = json.loads(generate_content({**request, "response_format": {
+        "type": "json_schema", "json_schema": {"name": "s", "schema": schema}}}))
+    assert len(content["gaps"]) == 5 and all(isinstance(gap["heading"], str) for gap in content["gaps"])
+    assert isinstance(content["score"], int)
+
+
+def test_stub_rejects_unknown_paths_and_injects_rate_limits(stub_server):
+    def post(path):
+        request = urllib.request.Request(stub_server.url.rsplit("/v1", 1)[0] + path, method="POST",
+                                         data=json.dumps({"messages": MESSAGES}).encode("utf-8"))
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, dict(response.headers)
+        except urllib.error.HTTPError as error:
+            return error.code, dict(error.headers)
+
+    assert post("/v1/chat/completions")[0] == 200
+    assert post("/v1/embeddings")[0] == 404
+    stub_server.error_rate = 1.0
+    status, headers = post("/v1/chat/completions")
+    assert status == 429 and headers["Retry-After"] == "0.2"
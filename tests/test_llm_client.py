@@ -0,0 +1,148 @@
+"""
+The shared OpenAI client's pacing and retries: the token buckets (on a fake
+clock), call_with_retries against the SDK's error types, and recovery from 429s
+injected by the stub server.
+
+    python -m pytest tests
+"""
+import threading
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import llm_client
+from fake_llm import stub_server  # noqa: F401 (fixture)
+from llm_client import RateLimiter, TokenBucket, call_with_retries, get_openai_client, is_retryable
+from recommendation_agent import create_chat_completion
+
+REQUEST = SimpleNamespace(method="POST", url="https://api.openai.com/v1/chat/completions")
+
+
+class FakeTime:
+    """
+    Stands in for the time module: sleep() advances monotonic() instead of waiting.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(llm_client, "time", clock)
+    return clock
+
+
+def status_error(error_type, status, headers=None):
+    # Only the attributes the SDK's error types and llm_client read, so the test does
+    # not depend on the SDK's HTTP library
+    response = SimpleNamespace(status_code=status, headers=headers or {}, request=REQUEST)
+    return error_type("error", response=response, body=None)
+
+
+def test_bucket_waits_for_its_refill(clock):
+    bucket = TokenBucket(60, period=60.0)
+    bucket.acquire(50)
+    bucket.acquire(10)
+    assert clock.sleeps == []
+    bucket.acquire(3)
+    assert clock.sleeps == [pytest.approx(3.0)]
+    clock.now += 1000
+    bucket.acquire(60)
+    assert len(clock.sleeps) == 1
+    # A request larger than the bucket drains it instead of waiting forever
+    bucket.acquire(500)
+    assert clock.sleeps[-1] == pytest.approx(60.0)
+
+
+def test_rate_limiter_paces_requests_and_tokens(clock):
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1000)
+    limiter.acquire(100)
+    limiter.acquire(100)
+    # The third request waits for the request bucket, not the token bucket
+    limiter.acquire(100)
+    limiter.acquire(900)
+    assert clock.sleeps == [pytest.approx(30.0), pytest.approx(30.0)]
+    # Now 100 tokens are left; 1000 more need 30 s for the request and 24 s more for the tokens
+    limiter.acquire(1000)
+    assert clock.sleeps[2:] == [pytest.approx(30.0), pytest.approx(24.0)]
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (status_error(openai.RateLimitError, 429), True),
+    (status_error(openai.InternalServerError, 503), True),
+    (openai.APIConnectionError(request=REQUEST), True),
+    (openai.APITimeoutError(request=REQUEST), True),
+    (status_error(openai.BadRequestError, 400), False),
+    (status_error(openai.AuthenticationError, 401), False)
+])
+def test_retryable_errors(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+class Flaky:
+    def __init__(self, errors, result="ok"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+def test_retries_back_off_or_follow_retry_after(clock, monkeypatch):
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: high)
+    func = Flaky([
+        status_error(openai.RateLimitError, 429, {"retry-after": "7"}),
+        openai.APIConnectionError(request=REQUEST),
+        status_error(openai.InternalServerError, 500)
+    ])
+    assert call_with_retries(func, max_retries=5, base_delay=1.0) == "ok"
+    assert func.calls == 4
+    # Retry-After first, then the backoff ceiling of attempts 1 and 2
+    assert clock.sleeps == [7.0, 2.0, 4.0]
+
+
+def test_retries_stop_at_max_retries_or_a_client_error(clock):
+    func = Flaky([status_error(openai.RateLimitError, 429)] * 3)
+    with pytest.raises(openai.RateLimitError):
+        call_with_retries(func, max_retries=2)
+    assert func.calls == 3
+
+    func = Flaky([status_error(openai.BadRequestError, 400)])
+    with pytest.raises(openai.BadRequestError):
+        call_with_retries(func)
+    assert func.calls == 1 and len(clock.sleeps) == 2
+
+
+def test_one_client_is_shared_by_every_thread(stub_server):
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(get_openai_client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(client) for client in clients}) == 1
+    assert str(clients[0].base_url).rstrip("/") == stub_server.url
+    assert clients[0].max_retries == 0
+
+
+def test_calls_recover_from_injected_rate_limits(stub_server, monkeypatch):
+    stub_server.error_rate = 0.5
+    monkeypatch.setenv("GMP_OPENAI_MAX_RETRIES", "10")
+    for i in range(6):
+        assert create_chat_completion([{"role": "user", "content": f"question {i}"}], max_tokens=20,
+                                      use_cache=False)
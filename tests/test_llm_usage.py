@@ -0,0 +1,172 @@
+"""
+UsageLedger budgets, the downgrade to a cheaper model, the JSON lines log, and
+the usage create_chat_completion and stream_chat_completion record, including
+estimates for streams cut short. Calls go to the in-process stub server or an
+offline fake transport, never the network.
+
+    python -m pytest tests
+"""
+import json
+
+import pytest
+
+import llm_usage
+from fake_llm import completion, install, stream, stub_server  # noqa: F401 (fixture)
+from llm_usage import BudgetExceededError, UsageLedger, estimate_cost, set_current_ledger
+from prompt_payload import count_tokens
+from recommendation_agent import LLM_MODEL, count_message_tokens, create_chat_completion, stream_chat_completion
+
+MESSAGES = [{"role": "user", "content": "List the maturity gaps of this advertiser in three bullets."}]
+PROMPT_TOKENS = count_message_tokens(MESSAGES)
+
+
+@pytest.fixture
+def activate(monkeypatch):
+    """
+    Makes a ledger current for the test only.
+    """
+    monkeypatch.setenv("GMP_LLM_CACHE_PATH", "")
+    tokens = []
+
+    def activate(ledger):
+        tokens.append(set_current_ledger(ledger))
+        return ledger
+
+    yield activate
+    for token in reversed(tokens):
+        llm_usage._current_ledger.reset(token)
+
+
+def reserved(ledger):
+    return ledger._reserved_tokens, round(ledger._reserved_cost, 12)
+
+
+def test_reservations_are_released_or_settled():
+    ledger = UsageLedger(token_budget=1000, log_path="")
+    model, reservation = ledger.authorize(LLM_MODEL, 100, 200)
+    assert model == LLM_MODEL
+    assert reservation == (300, estimate_cost(LLM_MODEL, 100, 200))
+    # The reservation counts against the budget until it is settled
+    with pytest.raises(BudgetExceededError):
+        ledger.authorize(LLM_MODEL, 400, 400)
+    ledger.release(reservation)
+    assert reserved(ledger) == (0, 0.0)
+
+    _, reservation = ledger.authorize(LLM_MODEL, 400, 400)
+    ledger.record("step", LLM_MODEL, 0.0, 1.0, 400, 50, reservation=reservation)
+    assert reserved(ledger) == (0, 0.0)
+    assert ledger.total_tokens == 450
+    # The actual usage counts from then on
+    with pytest.raises(BudgetExceededError):
+        ledger.authorize(LLM_MODEL, 300, 300)
+    assert ledger.authorize(LLM_MODEL, 250, 300)[0] == LLM_MODEL
+
+
+def test_cost_budget_downgrades_when_only_the_cheaper_model_fits():
+    # Room for one nano call, not for a mini one or a second nano one
+    budget = 1.5 * estimate_cost("gpt-4.1-nano", 1000, 1000)
+    ledger = UsageLedger(cost_budget=budget, downgrade_model="gpt-4.1-nano", log_path="")
+    model, reservation = ledger.authorize(LLM_MODEL, 1000, 1000)
+    assert model == "gpt-4.1-nano"
+    assert reservation == (2000, estimate_cost("gpt-4.1-nano", 1000, 1000))
+    # Neither fits next to the first reservation
+    with pytest.raises(BudgetExceededError):
+        ledger.authorize(LLM_MODEL, 1000, 1000)
+    # Without a downgrade model the call is refused outright
+    with pytest.raises(BudgetExceededError):
+        UsageLedger(cost_budget=budget, log_path="").authorize(LLM_MODEL, 1000, 1000)
+
+
+def test_records_are_logged_as_json_lines(tmp_path):
+    path = tmp_path / "logs" / "usage.jsonl"
+    ledger = UsageLedger(log_path=str(path), run_id="run-1")
+    ledger.record("summary", LLM_MODEL, 10.0, 1.23456, 100, 20)
+    ledger.record("summary", LLM_MODEL, 11.0, 0.01, cached=True)
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["cached"] for line in lines] == [False, True]
+    assert lines[0] == {
+        "run_id": "run-1", "label": "summary", "model": LLM_MODEL, "started_at": 10.0, "wall_seconds": 1.2346,
+        "prompt_tokens": 100, "completion_tokens": 20, "cost": estimate_cost(LLM_MODEL, 100, 20), "cached": False
+    }
+    assert lines[1]["cost"] == 0.0
+    summary = ledger.summary()
+    assert (summary["calls"], summary["cached_calls"], summary["prompt_tokens"]) == (2, 1, 100)
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("GMP_RUN_TOKEN_BUDGET", "5000")
+    monkeypatch.setenv("GMP_RUN_COST_BUDGET", "0.25")
+    monkeypatch.setenv("GMP_DOWNGRADE_MODEL", "gpt-4.1-nano")
+    monkeypatch.setenv("GMP_USAGE_LOG_PATH", "")
+    ledger = UsageLedger.from_env(run_id="r")
+    assert (ledger.token_budget, ledger.cost_budget, ledger.downgrade_model, ledger.log_path, ledger.run_id) == \
+        (5000, 0.25, "gpt-4.1-nano", "", "r")
+    monkeypatch.delenv("GMP_RUN_TOKEN_BUDGET")
+    monkeypatch.setenv("GMP_DOWNGRADE_MODEL", "")
+    ledger = UsageLedger.from_env()
+    assert (ledger.token_budget, ledger.downgrade_model) == (None, None)
+
+
+def test_completion_is_recorded_with_the_downgraded_model(stub_server, activate):
+    budget = (estimate_cost("gpt-4.1-nano", PROMPT_TOKENS, 100) + estimate_cost(LLM_MODEL, PROMPT_TOKENS, 100)) / 2
+    ledger = activate(UsageLedger(cost_budget=budget, downgrade_model="gpt-4.1-nano", log_path=""))
+    assert create_chat_completion(MESSAGES, max_tokens=100, label="gaps")
+    [record] = ledger.records
+    assert (record.label, record.model, record.cached) == ("gaps", "gpt-4.1-nano", False)
+    assert record.prompt_tokens > 0 and record.completion_tokens > 0
+    assert record.cost == estimate_cost("gpt-4.1-nano", record.prompt_tokens, record.completion_tokens)
+    assert reserved(ledger) == (0, 0.0)
+
+
+def test_call_over_the_token_budget_is_refused_before_sending(monkeypatch, activate):
+    transport = install(monkeypatch, lambda request: completion("unused"))
+    ledger = activate(UsageLedger(token_budget=PROMPT_TOKENS + 99, log_path=""))
+    with pytest.raises(BudgetExceededError):
+        create_chat_completion(MESSAGES, max_tokens=100)
+    with pytest.raises(BudgetExceededError):
+        list(stream_chat_completion(MESSAGES, max_tokens=100))
+    assert transport.requests == []
+    assert ledger.records == [] and reserved(ledger) == (0, 0.0)
+
+
+def test_stream_records_the_reported_usage(stub_server, activate):
+    ledger = activate(UsageLedger(log_path=""))
+    text = "".join(stream_chat_completion(MESSAGES, max_tokens=100, label="drivers"))
+    [record] = ledger.records
+    assert text and record.label == "drivers"
+    # The stub reports about four characters per token, as in its usage chunk
+    assert record.completion_tokens == max(1, (len(text) + 3) // 4)
+    assert reserved(ledger) == (0, 0.0)
+
+
+def test_stream_failing_before_usage_records_an_estimate(monkeypatch, activate):
+    install(monkeypatch, lambda request: stream(["The gaps ", "are ", "measurement"], fail_after=2))
+    ledger = activate(UsageLedger(log_path=""))
+    with pytest.raises(ConnectionError):
+        list(stream_chat_completion(MESSAGES, max_tokens=100, label="gaps"))
+    [record] = ledger.records
+    assert (record.prompt_tokens, record.completion_tokens) == (PROMPT_TOKENS, count_tokens("The gaps are "))
+    assert record.cost == estimate_cost(LLM_MODEL, PROMPT_TOKENS, count_tokens("The gaps are "))
+    assert reserved(ledger) == (0, 0.0)
+
+
+def test_cancelled_stream_records_an_estimate(monkeypatch, activate):
+    install(monkeypatch, lambda request: stream(["The gaps ", "are ", "measurement"], usage=(500, 500)))
+    ledger = activate(UsageLedger(log_path=""))
+    chunks = stream_chat_completion(MESSAGES, max_tokens=100)
+    assert next(chunks) == "The gaps "
+    chunks.close()
+    [record] = ledger.records
+    assert (record.prompt_tokens, record.completion_tokens) == (PROMPT_TOKENS, count_tokens("The gaps "))
+    assert reserved(ledger) == (0, 0.0)
+
+
+def test_stream_never_sent_releases_its_reservation(monkeypatch, activate):
+    def refuse(request):
+        raise ConnectionError("no connection")
+
+    install(monkeypatch, refuse)
+    ledger = activate(UsageLedger(token_budget=10_000, log_path=""))
+    with pytest.raises(ConnectionError):
+        list(stream_chat_completion(MESSAGES, max_tokens=100))
+    assert ledger.records == [] and reserved(ledger) == (0, 0.0)
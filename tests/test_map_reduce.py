@@ -0,0 +1,124 @@
+"""
+Map-reduce analysis of large assessments: bounded category blocks, one shared map
+phase per payload, reduce prompts that stay under budget, and per-category notes
+answered from the LLM cache when only one category changes.
+
+    python -m pytest tests
+"""
+import json
+
+import pytest
+
+from fake_llm import completion, install, llm_cache_path  # noqa: F401 (fixture)
+from llm_stub_server import generate_content
+from map_reduce import CATEGORY_NOTES_TASK, MERGE_NOTES_TASK, MapReducePayload, reduce_notes, render_notes
+from prompt_payload import PromptPayload, build_category_blocks, count_tokens
+from recommendation_agent import build_analysis_payload, generate_full_analysis
+from synthetic import make_assessment
+
+
+@pytest.fixture(scope="module")
+def large_df():
+    # Too large for one uncut prompt: the single payload drops questions
+    return make_assessment(rows=2000, seed=1, comment_rate=0.6)
+
+
+def prompt(request):
+    return request["messages"][-1]["content"]
+
+
+def answer(request):
+    # Schema-shaped JSON for notes and structured gaps, prose for the rest
+    return completion(generate_content(request, completion_tokens=60))
+
+
+def map_requests(transport):
+    return [r for r in transport.requests if prompt(r).endswith(CATEGORY_NOTES_TASK)]
+
+
+def test_blocks_are_bounded_and_keep_every_question(large_df):
+    blocks = build_category_blocks(large_df, token_budget=1500)
+    assert all(count_tokens(block.text) <= 1500 for block in blocks)
+    text = "\n".join(block.text for block in blocks)
+    assert all(f"- Q: {question}" in text for question in large_df['Question'].unique())
+
+    # Oversized categories are split into numbered parts, in order
+    parts = {}
+    for block in blocks:
+        parts.setdefault(block.category, []).append(block.part)
+    assert all(numbers == list(range(1, len(numbers) + 1)) for numbers in parts.values())
+    assert max(len(numbers) for numbers in parts.values()) > 1
+
+
+def test_a_block_depends_only_on_its_category(large_df):
+    edited = large_df.copy()
+    edited.loc[edited['Category'] == "Business", 'Comment'] = "Budget moved to retail media this year."
+    before = {(b.category, b.part): b.text for b in build_category_blocks(large_df)}
+    after = {(b.category, b.part): b.text for b in build_category_blocks(edited)}
+    assert before.keys() == after.keys()
+    assert [key for key in before if before[key] != after[key]] == [key for key in before if key[0] == "Business"]
+
+
+def test_analysis_mode(large_df, monkeypatch):
+    small_df = make_assessment(rows=60, seed=1)
+    monkeypatch.delenv("GMP_ANALYSIS_MODE", raising=False)
+    assert isinstance(build_analysis_payload(small_df), PromptPayload)
+    assert isinstance(build_analysis_payload(large_df), MapReducePayload)
+    assert isinstance(build_analysis_payload(large_df, mode="single"), PromptPayload)
+    assert isinstance(build_analysis_payload(small_df, mode="map_reduce"), MapReducePayload)
+    monkeypatch.setenv("GMP_ANALYSIS_MODE", "map_reduce")
+    assert isinstance(build_analysis_payload(small_df), MapReducePayload)
+    with pytest.raises(ValueError, match="auto, single, map_reduce"):
+        build_analysis_payload(small_df, mode="chunked")
+
+
+def test_stages_share_one_bounded_map_phase(large_df, monkeypatch):
+    transport = install(monkeypatch, answer)
+    payload = MapReducePayload.from_dataframe(large_df, use_cache=False)
+    analysis = generate_full_analysis(large_df, payload=payload, use_cache=False)
+    assert analysis.summary and analysis.bullet_summary and len(analysis.maturity_gaps) == 5
+
+    # Three concurrent stages, but every block is condensed exactly once
+    assert sorted(prompt(r) for r in map_requests(transport)) == sorted(
+        f"Assessment responses:\n{block.text}\n\n{CATEGORY_NOTES_TASK}" for block in payload.blocks)
+    assert len(transport.requests) == len(payload.blocks) + 3
+    largest = max(count_tokens("\n".join(m["content"] for m in r["messages"])) for r in transport.requests)
+    assert largest < payload.reduce_token_budget + 1000
+
+
+def test_notes_over_budget_are_merged_first(monkeypatch):
+    merged = json.dumps({"overview": "Merged.", "strengths": ["s"], "gaps": ["g"]})
+    transport = install(monkeypatch, lambda request: completion(merged))
+    notes = [{"category": f"Category {i}", "overview": "word " * 80, "strengths": ["a strength"] * 3,
+              "gaps": ["a gap"] * 3} for i in range(12)]
+    budget = count_tokens(render_notes(notes[:3])) + 10
+    reduced = reduce_notes(notes, token_budget=budget, use_cache=False)
+    assert count_tokens(render_notes(reduced)) <= budget
+    assert len(transport.requests) == 4 and len(reduced) == 4
+    assert reduced[0]["category"] == "Category 0, Category 1, Category 2"
+    assert all(prompt(r).endswith(MERGE_NOTES_TASK) for r in transport.requests)
+
+    # Notes that already fit are passed through
+    assert reduce_notes(notes[:2], token_budget=budget, use_cache=False) == notes[:2]
+    assert len(transport.requests) == 4
+
+
+def test_unparsable_notes_are_kept_as_the_overview(monkeypatch):
+    install(monkeypatch, lambda request: completion("Plain text, not JSON."))
+    (block,) = build_category_blocks(make_assessment(rows=20, seed=1, category_mix={"Media": 1.0}))
+    payload = MapReducePayload([block], use_cache=False)
+    assert payload.notes() == [{"category": "Media", "overview": "Plain text, not JSON.", "strengths": [], "gaps": []}]
+
+
+def test_only_the_changed_category_is_summarized_again(large_df, llm_cache_path, monkeypatch):
+    transport = install(monkeypatch, answer)
+    MapReducePayload.from_dataframe(large_df).notes()
+    first = len(map_requests(transport))
+
+    edited = large_df.copy()
+    edited.loc[edited['Category'] == "Business", 'Comment'] = "Budget moved to retail media this year."
+    payload = MapReducePayload.from_dataframe(edited)
+    payload.notes()
+    business = [block for block in payload.blocks if block.category == "Business"]
+    assert len(map_requests(transport)) == first + len(business)
+    assert 0 < len(business) < len(payload.blocks)
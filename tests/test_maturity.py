@@ -0,0 +1,54 @@
+"""
+maturity_table's grouping against per-group calculate_maturity_levels, including
+key columns with missing values.
+
+    python -m pytest tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommendation_agent import OVERALL_CATEGORY, calculate_maturity_levels, maturity_table
+from synthetic import make_portfolio
+
+
+def test_missing_second_key_is_a_group_of_its_own():
+    df = pd.DataFrame({
+        'R': ['a', 'b'],
+        'C': ['x', None],
+        'Category': ['Media', 'Media'],
+        'Question': ['q1', 'q1'],
+        'Answer': ['yes', 'yes'],
+        'Score': [1, 2],
+        'MaxWeight': [3, 3]
+    })
+    table = maturity_table(df, keys=['R', 'C'])
+    overall = table[table['Category'] == OVERALL_CATEGORY].set_index('R')
+    assert list(overall.index) == ['a', 'b']
+    assert overall.loc['a', 'total_score'] == 1.0
+    assert overall.loc['b', 'total_score'] == 2.0
+    assert pd.isna(overall.loc['b', 'C'])
+
+
+def test_portfolio_table_matches_each_client_with_missing_keys():
+    portfolio = make_portfolio(12, seed=3)
+    portfolio['ClientId'] = portfolio['ClientId'].astype(object)
+    portfolio['Region'] = np.where(np.arange(len(portfolio)) % 3 == 0, None, "emea")
+    portfolio.loc[portfolio['ClientId'] == "client-4", 'ClientId'] = None
+
+    table = maturity_table(portfolio, keys=['ClientId', 'Region'])
+    groups = portfolio.groupby(['ClientId', 'Region'], dropna=False, sort=False)
+    assert table[table['Category'] == OVERALL_CATEGORY].shape[0] == groups.ngroups
+
+    for (client, region), rows in groups:
+        expected = calculate_maturity_levels(rows.reset_index(drop=True))
+        in_group = (table['ClientId'].isna() if pd.isna(client) else table['ClientId'] == client) & \
+            (table['Region'].isna() if pd.isna(region) else table['Region'] == region)
+        got = table[in_group]
+        overall = got[got['Category'] == OVERALL_CATEGORY].iloc[0]
+        assert overall['total_score'] == pytest.approx(expected.overall['total_score'])
+        assert overall['total_max_weight'] == pytest.approx(expected.overall['total_max_weight'])
+        assert overall['questions'] == expected.overall['questions']
+        categories = got[got['Category'] != OVERALL_CATEGORY].reset_index(drop=True)
+        assert list(categories['Category']) == list(expected.categories['Category'])
+        assert list(categories['total_score']) == pytest.approx(list(expected.categories['total_score']))
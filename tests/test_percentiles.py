@@ -0,0 +1,90 @@
+"""
+PercentileTable lookups at the edges of the portfolio, its .npz round trip and the
+copy batch_reports saves for the app.
+
+    python -m pytest tests
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_reports import run_batch
+from maturity_benchmarks import PercentileTable
+from recommendation_agent import OVERALL_CATEGORY, calculate_maturity_levels
+from synthetic import write_assessment_csvs
+
+
+@pytest.fixture
+def table():
+    levels = pd.DataFrame({
+        'Category': ['Media'] * 5 + [OVERALL_CATEGORY] * 2,
+        'maturity_level': [40.0, 10.0, 20.0, 20.0, np.nan, 50.0, 70.0]
+    })
+    return PercentileTable.from_portfolio(levels)
+
+
+def test_values_are_sorted_without_missing_levels(table):
+    assert list(table.values['Media']) == [10.0, 20.0, 20.0, 40.0]
+    assert table.size('Media') == 4
+    assert table.size('Unknown') == 0
+
+
+@pytest.mark.parametrize("level, expected", [
+    (5.0, 0.0),      # below the minimum
+    (10.0, 12.5),    # equal to the minimum: half of one tie
+    (20.0, 50.0),    # two ties
+    (30.0, 75.0),    # between stored values
+    (40.0, 87.5),    # equal to the maximum
+    (95.0, 100.0)    # above the maximum
+])
+def test_percentile_edges(table, level, expected):
+    assert table.percentile('Media', level) == expected
+
+
+def test_percentile_without_portfolio_data(table):
+    assert table.percentile('Unknown', 50.0) is None
+    assert table.percentile('Media', None) is None
+    assert table.percentile('Media', float("nan")) is None
+    assert PercentileTable({'Media': np.array([])}).percentile('Media', 10.0) is None
+
+
+def test_rank_adds_percentile_and_portfolio_size(table):
+    scores = calculate_maturity_levels(pd.DataFrame({
+        'Category': ['Media', 'Data'],
+        'Question': ['q1', 'q2'],
+        'Answer': ['yes', 'no'],
+        'Score': [1, 2],
+        'MaxWeight': [5, 2]
+    }))
+    ranked = table.rank(scores).set_index('Category')
+    assert ranked.loc['Media', 'percentile'] == 50.0
+    assert ranked.loc['Media', 'portfolio_size'] == 4
+    assert pd.isna(ranked.loc['Data', 'percentile'])
+    # 3 of 7 points overall, below both portfolio levels
+    assert ranked.loc[OVERALL_CATEGORY, 'percentile'] == 0.0
+
+
+def test_save_load_round_trip(table, tmp_path):
+    path = tmp_path / "nested" / "table.npz"
+    table.save(str(path))
+    loaded = PercentileTable.load(str(path))
+    assert list(loaded.values) == list(table.values)
+    for category, values in table.values.items():
+        assert loaded.values[category].dtype == np.float64
+        np.testing.assert_array_equal(loaded.values[category], values)
+    assert os.listdir(path.parent) == ["table.npz"]
+
+
+def test_batch_saves_the_table_where_the_app_reads_it(tmp_path):
+    write_assessment_csvs(str(tmp_path / "in"), 3, seed=1)
+    app_path = tmp_path / "app" / "maturity_percentiles.npz"
+    outcome = run_batch(str(tmp_path / "in"), str(tmp_path / "out"), workers=1, skip_llm=True,
+                        percentile_table=str(app_path))
+    assert len(outcome["done"]) == 3
+    loaded = PercentileTable.load(str(app_path))
+    assert loaded.size(OVERALL_CATEGORY) == 3
+    np.testing.assert_array_equal(loaded.values[OVERALL_CATEGORY],
+                                  PercentileTable.load(str(tmp_path / "out" / "maturity_percentiles.npz"))
+                                  .values[OVERALL_CATEGORY])
@@ -0,0 +1,145 @@
+"""
+Prefetching the next walkthrough step: the per-session budget, the worst-case
+cost estimate, and the app starting, adopting and discarding prefetch jobs.
+
+    python -m pytest tests
+"""
+import logging
+import threading
+import time
+
+import pytest
+import streamlit as st
+
+import streamlit_app
+from background_jobs import JobExecutor
+from fake_llm import completion, install, llm_cache_path, stream  # noqa: F401 (fixture)
+from llm_usage import estimate_cost
+from prefetch import NEXT_STEPS, PrefetchBudget, estimate_step_cost
+from prompt_payload import build_prompt_payload, count_tokens
+from recommendation_agent import LLM_MODEL
+from synthetic import make_assessment
+
+
+@pytest.fixture
+def df():
+    return make_assessment(rows=40, seed=5)
+
+
+@pytest.fixture
+def payload(df):
+    return build_prompt_payload(df)
+
+
+@pytest.fixture
+def session(llm_cache_path, monkeypatch):
+    """
+    Bare-mode session state, a private one-worker executor and a fresh LLM cache.
+    """
+    # Outside a running app Streamlit warns that session state is a plain dict
+    for logger in ("streamlit.runtime.scriptrunner_utils.script_run_context",
+                   "streamlit.runtime.state.session_state_proxy"):
+        logging.getLogger(logger).setLevel(logging.ERROR)
+    executor = JobExecutor(max_workers=1)
+    monkeypatch.setattr(streamlit_app, "get_job_executor", lambda: executor)
+    monkeypatch.setenv("GMP_PREFETCH_COST_BUDGET", "1")
+    st.session_state.clear()
+    yield executor
+    st.session_state.clear()
+    executor.shutdown(wait=True)
+
+
+def test_budget_reserves_releases_and_counts_waste():
+    budget = PrefetchBudget(limit=0.10)
+    assert budget.reserve(0.06)
+    assert not budget.reserve(0.05)
+    budget.release(0.06, wasted=True)
+    assert (budget.reserved, budget.wasted) == (0.0, 0.06)
+    # Wasted spend stays on the account
+    assert not budget.reserve(0.05)
+    assert budget.reserve(0.04)
+    budget.release(0.04)
+    assert (budget.reserved, budget.wasted) == (0.0, 0.06)
+
+
+def test_budget_limit_from_env(monkeypatch):
+    monkeypatch.setenv("GMP_PREFETCH_COST_BUDGET", "0.2")
+    assert PrefetchBudget().limit == 0.2
+    monkeypatch.setenv("GMP_PREFETCH_COST_BUDGET", "0")
+    assert not PrefetchBudget().reserve(0.0)
+
+
+def test_cost_estimate_is_the_worst_case(payload):
+    bullets, gaps = NEXT_STEPS[1], NEXT_STEPS[2]
+    assert estimate_step_cost(payload, bullets) == estimate_cost(
+        LLM_MODEL, count_tokens(payload.text(include_business=False)), 1000)
+    assert estimate_step_cost(payload, gaps) == estimate_cost(LLM_MODEL, count_tokens(payload.text()), 1500)
+    assert estimate_step_cost(payload, gaps) > estimate_step_cost(payload, bullets)
+
+
+def test_prefetched_steps_run_the_step_requests(llm_cache_path, df, payload, monkeypatch):
+    gaps = '{"gaps": [{"heading": "Gap", "context": "c", "impact": "i"}], "drivers": []}'
+    install(monkeypatch, lambda request: completion(gaps) if "response_format" in request
+            else stream(["- one", "\n- two"]))
+    assert NEXT_STEPS[1].run(df, payload) == "- one\n- two"
+    maturity_gaps, maturity_drivers = NEXT_STEPS[2].run(df, payload)
+    assert list(maturity_gaps['Heading']) == ["Gap"] and maturity_drivers.empty
+
+
+def test_app_starts_then_adopts_the_next_step(session, df, payload, monkeypatch):
+    release = threading.Event()
+    install(monkeypatch, lambda request: release.wait(5) and stream(["- bullet"]))
+    monkeypatch.setattr(st, "rerun", lambda: None)
+    streamlit_app.start_prefetch(1, df, payload)
+    prefetch = st.session_state.prefetch
+    assert prefetch.name == "bullet_summary" and prefetch.payload is payload
+    assert st.session_state.prefetch_budget.reserved == prefetch.cost > 0
+
+    # Reruns of the same step keep the running prefetch
+    streamlit_app.start_prefetch(1, df, payload)
+    assert st.session_state.prefetch is prefetch
+    # Only the prefetched step, for the same payload, is adopted
+    assert streamlit_app.adopt_prefetch("gaps_and_drivers", payload) is False
+    assert streamlit_app.adopt_prefetch("bullet_summary", build_prompt_payload(df)) is False
+
+    streamlit_app.adopt_prefetch("bullet_summary", payload)
+    assert "prefetch" not in st.session_state and st.session_state.llm_job is prefetch.job
+    assert st.session_state.prefetch_budget.reserved == 0.0
+    release.set()
+    assert prefetch.job.result() == "- bullet"
+    assert st.session_state.prefetch_budget.wasted == 0.0
+
+
+def test_app_discards_a_stale_prefetch_as_wasted(session, df, payload, monkeypatch):
+    release = threading.Event()
+    install(monkeypatch, lambda request: release.wait(5) and stream(["- bullet"]))
+    streamlit_app.start_prefetch(1, df, payload)
+    prefetch = st.session_state.prefetch
+    while prefetch.job.started_at is None:
+        time.sleep(0.001)
+
+    # Edited answers make a new payload, so the running prefetch is dropped
+    edited = build_prompt_payload(df)
+    streamlit_app.start_prefetch(3, df, edited)
+    release.set()
+    assert "prefetch" not in st.session_state
+    assert prefetch.job.cancel_requested
+    assert st.session_state.prefetch_budget.wasted == prefetch.cost
+    assert st.session_state.prefetch_budget.reserved == 0.0
+
+
+def test_app_prefetches_only_within_budget_and_on_an_idle_worker(session, df, payload, monkeypatch):
+    monkeypatch.setenv("GMP_PREFETCH_COST_BUDGET", "0")
+    streamlit_app.start_prefetch(1, df, payload)
+    assert "prefetch" not in st.session_state
+
+    st.session_state.clear()
+    monkeypatch.setenv("GMP_PREFETCH_COST_BUDGET", "1")
+    release = threading.Event()
+    busy = session.submit("summary", "Summary", release.wait, 5)
+    streamlit_app.start_prefetch(1, df, payload)
+    assert "prefetch" not in st.session_state
+    release.set()
+    busy.result()
+    streamlit_app.start_prefetch(1, df, payload)
+    assert st.session_state.prefetch.name == "bullet_summary"
@@ -0,0 +1,96 @@
+"""
+build_prompt_payload: the shared Q/A serialization of an assessment, its
+Business-free prefix for the summary prompts, and how it fits a token budget by
+shortening comments before dropping trailing questions.
+
+    python -m pytest tests
+"""
+import pandas as pd
+import pytest
+
+from prompt_payload import ASSESSMENT_SYSTEM_PROMPT, COMMENT_CAPS, build_prompt_payload, count_tokens
+from synthetic import make_assessment
+
+
+def assessment():
+    return pd.DataFrame({
+        'Category': ["Business", "Media", "Media", "Media", "Data", "Business"],
+        'Question': ["Budget?", "Which DSPs?", "Which DSPs?", "Which DSPs?", "Uses GA4?", "Team size?"],
+        'Answer': ["  1m ", "DV360", "Other", "DV360", None, "5"],
+        'Score': [1, 2, 2, 2, 0, 3],
+        'MaxWeight': [3, 3, 3, 3, 3, 3],
+        'Comment': [None, "Mostly DV360.", "Mostly DV360.", "Trialling others.", "Not yet.", None]
+    })
+
+
+def test_rows_are_grouped_per_question_with_business_last():
+    payload = build_prompt_payload(assessment(), token_budget=None)
+    assert payload.core_text == "\n".join([
+        "## Media",
+        "- Q: Which DSPs?",
+        "  A: DV360; Other",
+        "  Comment: Mostly DV360. | Trialling others.",
+        "## Data",
+        "- Q: Uses GA4?",
+        "  A: No answer",
+        "  Comment: Not yet."
+    ])
+    assert payload.business_text == "## Business\n- Q: Budget?\n  A: 1m\n- Q: Team size?\n  A: 5"
+    assert payload.text(include_business=False) == payload.core_text
+    assert payload.text().startswith(payload.core_text + "\n## Business")
+    assert (payload.omitted_questions, payload.comment_cap) == (0, None)
+
+
+def test_scores_are_not_part_of_the_prompt():
+    df = assessment()
+    rescored = df.assign(Score=0, MaxWeight=5)
+    assert build_prompt_payload(rescored).text() == build_prompt_payload(df).text()
+
+
+def test_messages_share_a_stable_prefix():
+    payload = build_prompt_payload(assessment())
+    summary = payload.messages("Summarise.", include_business=False)
+    gaps = payload.messages("List the gaps.")
+    assert summary[0] == gaps[0] == {"role": "system", "content": ASSESSMENT_SYSTEM_PROMPT}
+    assert summary[1]["content"] == f"Assessment responses:\n{payload.core_text}\n\nSummarise."
+    assert gaps[1]["content"].startswith(f"Assessment responses:\n{payload.core_text}\n")
+    assert gaps[1]["content"].endswith(f"{payload.business_text}\n\nList the gaps.")
+    assert "Budget?" not in summary[1]["content"]
+
+
+@pytest.fixture(scope="module")
+def large():
+    return make_assessment(rows=400, seed=4, comment_rate=0.8)
+
+
+def test_comments_are_shortened_before_questions_are_dropped(large):
+    full = build_prompt_payload(large, token_budget=None)
+    budget = count_tokens(full.text()) * 3 // 4
+    payload = build_prompt_payload(large, token_budget=budget)
+    assert count_tokens(payload.text()) <= budget
+    assert payload.comment_cap in COMMENT_CAPS[1:-1] and payload.omitted_questions == 0
+    assert "…" in payload.text()
+    assert payload.text(include_business=False).count("- Q:") == full.text(include_business=False).count("- Q:")
+
+
+def test_trailing_questions_are_dropped_business_first(large):
+    without_comments = build_prompt_payload(large.drop(columns=['Comment']), token_budget=None)
+    budget = count_tokens(without_comments.text(include_business=False)) // 2
+    payload = build_prompt_payload(large, token_budget=budget)
+    assert count_tokens(f"{payload.core_text}\n{payload.business_text}") <= budget
+    assert payload.comment_cap == 0 and "Comment:" not in payload.text()
+    assert payload.business_text == ""
+    assert payload.core_text.endswith(f"[{payload.omitted_questions} further questions omitted to fit the token budget]")
+    kept = payload.text().count("- Q:")
+    assert kept + payload.omitted_questions == without_comments.text().count("- Q:")
+    # The kept questions are the first ones, unchanged
+    assert without_comments.core_text.startswith(payload.core_text.rsplit("\n", 1)[0])
+    # The same input always gives the same text
+    assert build_prompt_payload(large, token_budget=budget).text() == payload.text()
+
+
+def test_token_report_compares_with_the_legacy_prompt(large):
+    report = build_prompt_payload(large).token_report()
+    assert report["payload_tokens"] < report["legacy_tokens"]
+    assert report["saved_tokens"] == report["legacy_tokens"] - report["payload_tokens"] > 0
+    assert build_prompt_payload(large.iloc[0:0]).token_report()["saved_pct"] >= 0
@@ -0,0 +1,79 @@
+"""
+The compiled rule plan (run_recommendation_analysis, match_recommendations)
+against the original per-row loop (matching_reference.baseline_analysis) on
+synthetic assessments with multi-select answers, blank answers and missing
+comments and scores.
+
+    python -m pytest tests
+"""
+import pandas as pd
+import pytest
+
+from matching_reference import assert_same_results, baseline_analysis, roughen
+from recommendation_agent import (build_answer_map, compile_rule_plan, get_rule_set, match_recommendations,
+                                  run_recommendation_analysis)
+from synthetic import make_assessment
+
+# Single questions, a negative_choice condition, list answers and a set_id group
+RULES = [
+    {"question": "Uses DV360?", "answer": "yes", "recommendation": "A"},
+    {"question": "Which bidding?", "answer": ["Manual", "N/A"], "recommendation": "B", "overview": "o"},
+    {"question": "Which bidding?", "answer": ["target cpa", "max conversions"], "type": "negative_choice",
+     "recommendation": "C"},
+    {"set_id": "group", "recommendation": "D", "questions": [
+        {"question": "Uses DV360?", "answer": "yes"},
+        {"question": "Which bidding?", "answer": "manual"}
+    ]},
+    {"question": "Never asked?", "answer": "yes", "recommendation": "E"}
+]
+
+
+def assessments():
+    for seed in range(12):
+        df = make_assessment(seed=seed, max_selections=4, answer_rate=0.95)
+        yield roughen(df, seed) if seed % 2 else df
+    yield make_assessment(seed=99).drop(columns=['Comment'])
+    yield make_assessment(seed=100).iloc[0:0]
+
+
+@pytest.mark.parametrize("df", list(assessments()))
+def test_run_recommendation_analysis_matches_baseline(df):
+    rules = get_rule_set().rules
+    assert_same_results(run_recommendation_analysis(df), baseline_analysis(df, rules))
+
+
+def test_synthetic_assessments_exercise_the_rules():
+    df = make_assessment(seed=3, max_selections=4)
+    assert df.groupby('Question').size().max() > 1
+    assert baseline_analysis(df, get_rule_set().rules)['total_matched_recommendations'] > 0
+
+
+def rule_test_assessment(answers, scores=(2, 1)):
+    questions = ["Uses DV360?"] + ["Which bidding?"] * (len(answers) - 1)
+    return pd.DataFrame({
+        'Category': "Media",
+        'Question': questions,
+        'Answer': answers,
+        'Score': [scores[0]] + [scores[1]] * (len(answers) - 1),
+        'MaxWeight': 3
+    })
+
+
+@pytest.mark.parametrize("answers", [
+    ["yes", "manual"],
+    ["YES ", "target cpa", "manual"],
+    ["no", "n/a"],
+    ["yes", None],
+    ["yes", "target cpa", "max conversions"],
+    ["yes", "other"]
+])
+def test_compiled_rules_match_baseline(answers):
+    df = rule_test_assessment(answers)
+    results = match_recommendations(build_answer_map(df), compile_rule_plan(RULES))
+    assert_same_results(results, baseline_analysis(df, RULES))
+
+
+def test_candidate_rules_only_include_rules_on_answered_questions():
+    plan = compile_rule_plan(RULES)
+    assert [rule.recommendation for rule in plan.candidate_rules(["which bidding?"])] == ["B", "C", "D"]
+    assert plan.candidate_rules(["unrelated?"]) == []
@@ -0,0 +1,79 @@
+"""
+PDF rendering: text the core fonts can print, reports built in memory, parallel
+rendering in input order, and report.pdf written from a batch client folder.
+
+    python -m pytest tests
+"""
+import re
+
+import pandas as pd
+import pytest
+
+from batch_reports import run_batch
+from report_pdf import create_full_report_pdf, pdf_text, render_reports_parallel, write_report_pdf
+from synthetic import write_assessment_csvs
+
+
+def page_count(pdf_bytes):
+    return len(re.findall(rb"/Type\s*/Page\b", pdf_bytes))
+
+
+def report(items, title="GMP Assessment Report"):
+    frame = pd.DataFrame({
+        'Heading': [f"Gap {i}" for i in range(items)],
+        'Context': ["Consent mode is not set up — conversions go unmeasured."] * items,
+        'Impact': [None] * items
+    })
+    return {
+        "summary": "## Summary\nThe advertiser uses **DV360** and “Search Ads 360”…",
+        "bullet_points": "• First\n• Second",
+        "gaps_df": frame,
+        "drivers_df": frame.iloc[0:0],
+        "recommendations_df": pd.DataFrame({'Recommendation': ["Adopt Floodlight"], 'Overview': ["o"],
+                                            'GMP Utilization Impact': ["g"], 'Business Impact': ["b"]}),
+        "title": title
+    }
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("**Bold** and __also__ `code`", "Bold and also code"),
+    ("### Heading\nbody", "Heading\nbody"),
+    ("“Quoted” – it’s… → ≥ 5 • ok", "\"Quoted\" - it's... -> >= 5 - ok"),
+    ("Café 50€ 中", "Café 50? ?"),
+    (3.5, "3.5")
+])
+def test_pdf_text(text, expected):
+    assert pdf_text(text) == expected
+    pdf_text(text).encode("latin-1")
+
+
+def test_report_is_built_in_memory():
+    pdf = create_full_report_pdf(**report(2))
+    assert isinstance(pdf, bytes) and pdf.startswith(b"%PDF")
+    assert page_count(pdf) == 1
+    # Empty sections still render
+    assert create_full_report_pdf(None, None, None, pd.DataFrame(), None).startswith(b"%PDF")
+
+
+def test_long_reports_break_pages():
+    assert page_count(create_full_report_pdf(**report(80))) > 2
+
+
+def test_parallel_rendering_keeps_the_input_order():
+    reports = [report(items, title=f"Client {items}") for items in (60, 1, 30, 5)]
+    rendered = render_reports_parallel(reports, max_workers=2)
+    assert [page_count(pdf) for pdf in rendered] == [page_count(create_full_report_pdf(**r)) for r in reports]
+    assert len({page_count(pdf) for pdf in rendered}) > 1
+
+
+def test_report_pdf_from_a_batch_client_folder(tmp_path, monkeypatch):
+    monkeypatch.setenv("GMP_USAGE_LOG_PATH", "")
+    write_assessment_csvs(str(tmp_path / "in"), 2, rows=30, seed=1)
+    run_batch(str(tmp_path / "in"), str(tmp_path / "out"), skip_llm=True, pdf=True, pdf_workers=1)
+    for client in ("client-0", "client-1"):
+        assert (tmp_path / "out" / client / "report.pdf").read_bytes().startswith(b"%PDF")
+
+    # Without the LLM sections (a --skip-llm run) the report still renders
+    (tmp_path / "out" / "client-0" / "report.pdf").unlink()
+    path = write_report_pdf(str(tmp_path / "out" / "client-0"), title="Client 0")
+    assert path.endswith("report.pdf") and page_count(open(path, "rb").read()) >= 1
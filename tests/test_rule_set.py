@@ -0,0 +1,198 @@
+"""
+Rule file validation, the pickled compiled-plan cache, hot reload and the
+RECOMMENDATION_SET alias recommendation_agent kept for older imports.
+
+    python -m pytest tests
+"""
+import json
+import os
+import re
+import time
+
+import pytest
+
+from recommendation_agent import RULE_PLAN_FORMAT, compile_rule_plan, get_rule_set
+from rule_set import RuleSetError, RuleSetWatcher, RuleStore, validate_rule_set
+
+RULE = {"question": "Uses DV360?", "answer": "yes", "recommendation": "Adopt DV360"}
+GROUP = {"set_id": "dv360", "recommendation": "Connect DV360", "questions": [
+    {"question": "Uses DV360?", "answer": "yes"},
+    {"question": "Which bidding?", "answer": ["manual", "n/a"], "type": "negative_choice"}
+]}
+
+
+def document(*rules, version=1):
+    return {"version": version, "rules": list(rules)}
+
+
+def write_rules(path, *rules, version=1):
+    path.write_text(json.dumps(document(*rules, version=version)))
+    # Make sure the watcher's mtime/size check sees every write
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + version * 1_000_000))
+
+
+class CountingCompiler:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, rules):
+        self.calls += 1
+        return compile_rule_plan(rules)
+
+
+def test_valid_rule_set():
+    version, rules = validate_rule_set(document(RULE, GROUP, version="2026-10"))
+    assert version == "2026-10"
+    assert rules == [RULE, GROUP]
+
+
+@pytest.mark.parametrize("doc, message", [
+    ([RULE], "must be an object with a 'version' and a 'rules' list"),
+    ({"version": 1, "rules": {}}, "must be an object with a 'version' and a 'rules' list"),
+    ({"rules": [RULE]}, "missing its 'version'"),
+    (document("rule"), "rule 0: must be an object"),
+    (document({"answer": "yes", "recommendation": "r"}), "rule 0: 'question' must be a non-empty string"),
+    (document({"question": "  ", "answer": "yes", "recommendation": "r"}),
+     "rule 0: 'question' must be a non-empty string"),
+    (document({"question": "q", "recommendation": "r"}), "rule 0: 'answer' must be a string"),
+    (document({"question": "q", "answer": [], "recommendation": "r"}), "rule 0: 'answer' must be a string"),
+    (document({"question": "q", "answer": ["yes", 1], "recommendation": "r"}), "rule 0: 'answer' must be a string"),
+    (document({"question": "q", "answer": "yes"}), "rule 0: 'recommendation' must be a non-empty string"),
+    (document({**RULE, "overview": 3}), "rule 0: 'overview' must be a string"),
+    (document({**RULE, "type": "contains"}), "rule 0: unknown condition type 'contains'"),
+    (document({"set_id": "s", "recommendation": "r"}), "rule 0: a set_id rule needs a non-empty 'questions' list"),
+    (document({"set_id": "s", "recommendation": "r", "questions": []}),
+     "rule 0: a set_id rule needs a non-empty 'questions' list"),
+    (document({"set_id": "s", "recommendation": "r", "questions": ["Uses DV360?"]}),
+     "rule 0, question 0: must be an object"),
+    (document({"set_id": "s", "recommendation": "r",
+               "questions": [{"question": "q", "answer": "a"}, {"question": "q"}]}),
+     "rule 0, question 1: 'answer' must be a string"),
+    (document(GROUP, GROUP), "rule 1: duplicate set_id 'dv360'")
+])
+def test_invalid_rule_sets(doc, message):
+    with pytest.raises(RuleSetError, match=re.escape(message)):
+        validate_rule_set(doc)
+
+
+def test_every_problem_is_reported_at_once():
+    with pytest.raises(RuleSetError) as error:
+        validate_rule_set(document(RULE, {"question": "q"}, {"set_id": "s", "recommendation": "r",
+                                                             "questions": [{"answer": "a"}]}))
+    lines = str(error.value).splitlines()
+    assert lines[0] == "invalid rule set:"
+    assert lines[1:] == [
+        "rule 1: 'recommendation' must be a non-empty string",
+        "rule 1: 'answer' must be a string or a non-empty list of strings",
+        "rule 2, question 0: 'question' must be a non-empty string"
+    ]
+
+
+def test_unparseable_file_fails_the_first_load(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text("{not json")
+    with pytest.raises(RuleSetError, match="invalid JSON"):
+        RuleStore(str(path), compile_rule_plan, RULE_PLAN_FORMAT, cache_path="")
+    write_rules(path, {"question": "q", "answer": "yes"})
+    with pytest.raises(RuleSetError, match="recommendation"):
+        RuleStore(str(path), compile_rule_plan, RULE_PLAN_FORMAT, cache_path="")
+
+
+def test_compiled_plan_cache_is_reused_until_the_file_changes(tmp_path):
+    path, cache_path = tmp_path / "rules.json", tmp_path / "cache" / "plan.pickle"
+    write_rules(path, RULE, GROUP)
+
+    compiler = CountingCompiler()
+    first = RuleStore(str(path), compiler, RULE_PLAN_FORMAT, cache_path=str(cache_path))
+    assert compiler.calls == 1 and cache_path.exists()
+    assert first.snapshot.rules == (RULE, GROUP)
+
+    # A new process with the same file unpickles the plan instead of compiling it
+    second = RuleStore(str(path), compiler, RULE_PLAN_FORMAT, cache_path=str(cache_path))
+    assert compiler.calls == 1
+    assert second.snapshot.source_hash == first.snapshot.source_hash
+    assert second.snapshot.plan.rules[1].recommendation == "Connect DV360"
+
+    # An edited file no longer matches the cached hash
+    write_rules(path, RULE, version=2)
+    third = RuleStore(str(path), compiler, RULE_PLAN_FORMAT, cache_path=str(cache_path))
+    assert compiler.calls == 2
+    assert third.snapshot.source_hash != first.snapshot.source_hash
+    assert (third.snapshot.version, len(third.snapshot.plan.rules)) == (2, 1)
+
+    # So does a new plan format
+    RuleStore(str(path), compiler, RULE_PLAN_FORMAT + 1, cache_path=str(cache_path))
+    assert compiler.calls == 3
+
+
+def test_unreadable_cache_is_rebuilt(tmp_path):
+    path, cache_path = tmp_path / "rules.json", tmp_path / "plan.pickle"
+    write_rules(path, RULE)
+    cache_path.write_bytes(b"not a pickle")
+    compiler = CountingCompiler()
+    store = RuleStore(str(path), compiler, RULE_PLAN_FORMAT, cache_path=str(cache_path))
+    assert compiler.calls == 1 and store.snapshot.rules == (RULE,)
+    RuleStore(str(path), compiler, RULE_PLAN_FORMAT, cache_path=str(cache_path))
+    assert compiler.calls == 1
+
+
+def test_reload_swaps_valid_edits_and_keeps_the_rules_on_invalid_ones(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, RULE)
+    store = RuleStore(str(path), compile_rule_plan, RULE_PLAN_FORMAT, cache_path="")
+    assert store.reload() is False
+
+    write_rules(path, RULE, GROUP, version=2)
+    assert store.reload() is True
+    assert (store.snapshot.version, len(store.snapshot.rules)) == (2, 2)
+
+    previous = store.snapshot
+    write_rules(path, {"question": "q", "answer": "yes"}, version=3)
+    assert store.reload() is False
+    assert store.snapshot is previous
+
+    # Restoring the active rules is not a change
+    write_rules(path, RULE, GROUP, version=2)
+    assert store.reload(force=True) is False
+    assert store.snapshot is previous
+
+
+def test_watcher_hot_reloads_edits(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, RULE)
+    store = RuleStore(str(path), compile_rule_plan, RULE_PLAN_FORMAT, cache_path="")
+    watcher = RuleSetWatcher(store, interval=0.01)
+    watcher.start()
+    try:
+        write_rules(path, RULE, GROUP, version=2)
+        deadline = time.monotonic() + 5
+        while store.snapshot.version != 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.snapshot.version == 2
+        assert [rule.recommendation for rule in store.snapshot.plan.rules] == ["Adopt DV360", "Connect DV360"]
+
+        # A file missing mid-replace is retried on the next poll
+        os.remove(path)
+        time.sleep(0.05)
+        assert watcher.is_alive()
+        write_rules(path, RULE, version=3)
+        deadline = time.monotonic() + 5
+        while store.snapshot.version != 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.snapshot.version == 3
+    finally:
+        watcher.stop()
+        watcher.join(timeout=1)
+    assert not watcher.is_alive()
+
+
+def test_recommendation_set_is_still_importable():
+    from recommendation_agent import RECOMMENDATION_SET
+
+    assert isinstance(RECOMMENDATION_SET, list) and RECOMMENDATION_SET
+    assert RECOMMENDATION_SET == list(get_rule_set().rules)
+    # Each access is a copy, so callers cannot change the active rules
+    RECOMMENDATION_SET.clear()
+    import recommendation_agent
+    assert recommendation_agent.RECOMMENDATION_SET == list(get_rule_set().rules)
@@ -0,0 +1,166 @@
+"""
+Candidate recall of the MinHash/LSH similarity index on near-duplicate synthetic
+assessments (fixed seeds), the exact similarity check behind it, and the rule
+that an earlier analysis is only reused verbatim when no response differs.
+
+    python -m pytest tests
+"""
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+from assessment_store import AssessmentStore
+from prompt_payload import render_response_changes
+from similarity_index import SimilarityIndex, answer_shingles, jaccard, minhash_signature
+from synthetic import make_assessment
+
+THRESHOLD = 0.85
+
+
+def near_duplicate(df, changes, seed):
+    """
+    df with the answers of `changes` random rows replaced by answers no rule uses.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(df), size=changes, replace=False)
+    df = df.copy()
+    df.loc[df.index[rows], 'Answer'] = [f"changed answer {seed}-{i}" for i in range(changes)]
+    return df
+
+
+@pytest.fixture
+def index():
+    return SimilarityIndex(sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False),
+                           threading.Lock())
+
+
+@pytest.fixture(scope="module")
+def archive():
+    return {f"a{seed}": answer_shingles(make_assessment(rows=200, seed=seed)) for seed in range(40)}
+
+
+def test_shingles_follow_the_normalized_answers():
+    df = make_assessment(rows=60, seed=1)
+    shingles = answer_shingles(df)
+    assert shingles.dtype == np.uint64 and list(shingles) == sorted(set(shingles))
+    rough = df.assign(Answer=df['Answer'].str.upper() + "  ", Score=0, Comment="new comment")
+    np.testing.assert_array_equal(answer_shingles(rough), shingles)
+    assert jaccard(shingles, shingles) == 1.0
+    assert jaccard(shingles[:0], shingles[:0]) == 1.0
+
+
+def test_signature_agreement_estimates_jaccard(archive):
+    a = archive["a0"]
+    b = answer_shingles(near_duplicate(make_assessment(rows=200, seed=0), 20, seed=7))
+    estimate = np.mean(minhash_signature(a) == minhash_signature(b))
+    assert abs(estimate - jaccard(a, b)) < 0.1
+
+
+def test_near_duplicates_are_found(index, archive):
+    for content_hash, shingles in archive.items():
+        index.add(content_hash, shingles)
+    similarities = []
+    for seed in range(40):
+        changes = 2 + seed % 7
+        query = answer_shingles(near_duplicate(make_assessment(rows=200, seed=seed), changes, seed))
+        expected = {content_hash for content_hash, shingles in archive.items()
+                    if jaccard(query, shingles) >= THRESHOLD}
+        matches = index.query(query, THRESHOLD)
+        # Every indexed assessment above the threshold is found, with its exact similarity
+        assert {match.content_hash for match in matches} == expected
+        assert matches[0].content_hash == f"a{seed}"
+        for match in matches:
+            assert match.similarity == jaccard(query, archive[match.content_hash])
+        similarities.append(matches[0].similarity)
+    assert min(similarities) < 0.95
+
+
+def test_dissimilar_assessments_are_not_returned(index, archive):
+    for content_hash, shingles in archive.items():
+        index.add(content_hash, shingles)
+    # About 70% similar: below the threshold, though often a candidate
+    query = answer_shingles(near_duplicate(make_assessment(rows=200, seed=3), 35, seed=3))
+    assert jaccard(query, archive["a3"]) < THRESHOLD
+    assert index.query(query, THRESHOLD) == []
+    assert [match.content_hash for match in index.query(query, 0.5)] == ["a3"]
+    assert index.query(answer_shingles(make_assessment(rows=200, seed=1000)), THRESHOLD) == []
+
+
+def test_adding_twice_is_a_no_op(index, archive):
+    index.add("a0", archive["a0"])
+    index.add("a0", archive["a1"])
+    assert "a0" in index and index.indexed_hashes() == {"a0"}
+    assert [match.similarity for match in index.query(archive["a0"], THRESHOLD)] == [1.0]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AssessmentStore(str(tmp_path / "store"))
+
+
+def test_store_offers_analysed_similar_assessments(store):
+    analysed = make_assessment(rows=120, seed=5)
+    store.save("acme", "2026-01-01", "analysed", analysed, summary="s", step=1)
+    store.save("acme", "2026-02-01", "not-analysed", near_duplicate(analysed, 1, seed=1), step=0)
+
+    upload = near_duplicate(analysed, 2, seed=2)
+    [match] = store.similar(upload, threshold=THRESHOLD, content_hash="upload")
+    assert match.entry.content_hash == "analysed" and match.similarity >= THRESHOLD
+    # An upload's own hash is left out, as is everything when the offer is off
+    assert store.similar(analysed, threshold=THRESHOLD, content_hash="analysed") == []
+    assert store.similar(upload, threshold=0) == []
+
+
+def test_verbatim_reuse_only_when_no_response_differs(store):
+    df = make_assessment(rows=80, seed=11, comment_rate=0.5)
+    store.save("acme", "2026-01-01", "stored", df, summary="s", step=1)
+    stored = store.load(store.find("stored")[0])
+
+    # The stored copy reads back with no difference, and scores are not in the prompt
+    assert render_response_changes(stored.df, df) == ""
+    rescored = df.assign(Score=(df['Score'] + 1) % 4)
+    assert render_response_changes(stored.df, rescored) == ""
+
+    # A different comment, or differently written answer text, is a 100% match
+    # that must still be adapted rather than reused
+    first = df.index[0]
+    for changed in (df.assign(Comment=df['Comment'].where(df.index != first, "A new comment.")),
+                    df.assign(Answer=df['Answer'].where(df.index != first, df.loc[first, 'Answer'].upper()))):
+        [match] = store.similar(changed, threshold=THRESHOLD, content_hash="upload")
+        assert match.similarity == 1.0
+        changes = render_response_changes(stored.df, changed)
+        assert changes.startswith(f"- Q: {df.loc[first, 'Question']}")
+
+    edited = near_duplicate(df, 1, seed=4)
+    assert "changed answer 4-0" in render_response_changes(stored.df, edited)
+
+
+def offer_script(root, comment):
+    """
+    Runs as the app script under AppTest, so it imports what it uses.
+    """
+    import streamlit_app
+    from assessment_store import AssessmentStore
+    from synthetic import make_assessment
+
+    df = make_assessment(rows=80, seed=11, comment_rate=0.5)
+    store = AssessmentStore(root)
+    store.save("acme", "2026-01-01", "stored", df, summary="s", step=1)
+    if comment is not None:
+        df = df.assign(Comment=comment)
+    streamlit_app.offer_similar_analysis(store, "upload", df)
+
+
+@pytest.mark.parametrize("comment, buttons", [
+    (None, ["♻️ Reuse That Analysis", "✏️ Adapt It To These Answers"]),
+    ("A new comment.", ["✏️ Adapt It To These Answers"])
+])
+def test_app_offers_reuse_only_when_no_response_differs(tmp_path, comment, buttons):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(offer_script, args=(str(tmp_path / "store"), comment), default_timeout=60).run()
+    assert not app.exception
+    assert [button.label for button in app.button] == buttons
+    assert app.info[0].value.startswith("These answers match **100%** of those of **acme**")
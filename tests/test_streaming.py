@@ -0,0 +1,46 @@
+"""
+The streamed summaries against the in-process stub server: they arrive in many
+chunks, match the blocking calls, and share their cache entries.
+
+    python -m pytest tests
+"""
+import pytest
+
+from fake_llm import llm_cache_path, stub_server  # noqa: F401 (fixtures)
+from llm_cache import get_llm_cache
+from recommendation_agent import (build_analysis_payload, generate_bullet_summary, generate_category_summary,
+                                  stream_bullet_summary, stream_category_summary)
+from synthetic import make_assessment
+
+
+@pytest.fixture
+def df():
+    return make_assessment(rows=40, seed=6)
+
+
+@pytest.fixture
+def payload(df):
+    return build_analysis_payload(df, mode="single")
+
+
+@pytest.mark.parametrize("stream, generate", [
+    (stream_category_summary, generate_category_summary),
+    (stream_bullet_summary, generate_bullet_summary)
+])
+def test_stream_matches_the_blocking_call(stub_server, df, payload, stream, generate):
+    chunks = list(stream(df, use_cache=False, payload=payload))
+    assert len(chunks) > 10 and all(chunks)
+    assert "".join(chunks) == generate(df, use_cache=False, payload=payload)
+
+
+def test_completed_stream_answers_the_blocking_call(stub_server, llm_cache_path, df, payload):
+    text = "".join(stream_category_summary(df, payload=payload))
+    assert get_llm_cache().stats()["entries"] == 1
+    assert generate_category_summary(df, payload=payload) == text
+    assert get_llm_cache().stats()["hits"] == 1
+
+
+def test_cached_response_is_streamed_as_one_chunk(stub_server, llm_cache_path, df, payload):
+    text = generate_bullet_summary(df, payload=payload)
+    assert list(stream_bullet_summary(df, payload=payload)) == [text]
+    assert get_llm_cache().stats()["hits"] == 1
@@ -0,0 +1,80 @@
+"""
+The single-call structured gaps and drivers analysis: validation of the JSON
+items, the request it sends, and the markdown parser it replaces.
+
+    python -m pytest tests
+"""
+import json
+
+import pytest
+
+from fake_llm import completion, install, stub_server  # noqa: F401 (fixture)
+from recommendation_agent import (MATURITY_ANALYSIS_RESPONSE_FORMAT, build_analysis_payload,
+                                  identify_gaps_and_drivers, parse_maturity_items, parse_maturity_markdown)
+from synthetic import make_assessment
+
+
+def test_items_are_validated_into_a_frame():
+    items = [
+        {"heading": " Measurement ", "context": "No conversion API.", "impact": "Lost signal."},
+        {"heading": "Bidding", "context": None},
+        {"heading": "  ", "context": "dropped", "impact": "dropped"},
+        "not an object",
+        {"context": "no heading"}
+    ]
+    frame = parse_maturity_items(items)
+    assert list(frame.columns) == ["Heading", "Context", "Impact"]
+    assert frame.to_dict("records") == [
+        {"Heading": "Measurement", "Context": "No conversion API.", "Impact": "Lost signal."},
+        {"Heading": "Bidding", "Context": "N/A", "Impact": "N/A"}
+    ]
+    assert parse_maturity_items([]).empty and list(parse_maturity_items([]).columns) == list(frame.columns)
+    with pytest.raises(ValueError):
+        parse_maturity_items({"heading": "not a list"})
+
+
+@pytest.mark.parametrize("response, message", [
+    ('{"gaps": [', "not valid JSON"),
+    ('["gaps"]', "not a JSON object"),
+    ('{"gaps": "none", "drivers": []}', "Expected a list")
+])
+def test_invalid_responses_raise(monkeypatch, response, message):
+    install(monkeypatch, lambda request: completion(response))
+    with pytest.raises(ValueError, match=message):
+        identify_gaps_and_drivers(make_assessment(rows=20, seed=1), use_cache=False)
+
+
+def test_one_request_returns_both_lists(monkeypatch):
+    transport = install(monkeypatch, lambda request: completion(json.dumps({
+        "gaps": [{"heading": "Gap", "context": "c", "impact": "i"}],
+        "drivers": [{"heading": "Driver", "context": "c", "impact": "i"}] * 2
+    })))
+    df = make_assessment(rows=20, seed=1)
+    gaps, drivers = identify_gaps_and_drivers(df, use_cache=False)
+    assert (list(gaps['Heading']), list(drivers['Heading'])) == (["Gap"], ["Driver", "Driver"])
+    [request] = transport.requests
+    assert request["response_format"] == MATURITY_ANALYSIS_RESPONSE_FORMAT
+    assert request["max_tokens"] == 1500
+    # The whole assessment, Business included, is sent once
+    assert build_analysis_payload(df, mode="single").text() in request["messages"][1]["content"]
+
+
+def test_schema_constrained_response_from_the_stub(stub_server):
+    gaps, drivers = identify_gaps_and_drivers(make_assessment(rows=20, seed=1), use_cache=False)
+    assert len(gaps) == len(drivers) == 5
+    assert gaps['Heading'].str.len().min() > 0
+
+
+def test_markdown_parser():
+    text = (
+        "Here are the gaps:\n"
+        "1. **Heading**: Measurement\n   **Context**: No conversion API.\n   **Impact**: Lost signal.\n"
+        "2. **Heading**: Bidding **Context**: Manual CPC. **Impact**: Higher CPA.\n"
+        "3. **Heading**: Incomplete"
+    )
+    assert parse_maturity_markdown(text).to_dict("records") == [
+        {"Heading": "Measurement", "Context": "No conversion API.", "Impact": "Lost signal."},
+        {"Heading": "Bidding", "Context": "Manual CPC.", "Impact": "Higher CPA."},
+        {"Heading": "N/A", "Context": "N/A", "Impact": "N/A"}
+    ]
+    assert parse_maturity_markdown("no list").empty